@@ -5,6 +5,8 @@ import time
 import re
 import subprocess
 import platform
+import shutil
+import hashlib
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -73,6 +75,9 @@ HONORIFIC_SPLIT_PATTERN = re.compile(
     r"(です|ます|ございます|いたします|ください|下さい)[/／・](です|ます|ございます|いたします|ください|下さい)"
 )
 
+# 出力フォルダ内に保存する、セリフごとの音声ハッシュ一覧（再実行時に変更のないセリフの合成を省く）
+AUDIO_MANIFEST_NAME = "manifest.json"
+
 SPEAKER_ID_CACHE = None
 VOICEVOX_READY_CACHE = None
 
@@ -222,9 +227,40 @@ def generate_audio_file(text, speaker_name, output_filename, speaker_id=None):
         print(f"Error synthesizing audio for {speaker_name}: {e}")
         return False
 
+def audio_line_hash(text, speaker_id):
+    """
+    合成結果に影響する入力（読み上げ用テキストと話者ID）のハッシュ
+    """
+    payload = json.dumps({"text": normalize_tts_text(text), "speaker_id": speaker_id}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_audio_manifest(output_dir):
+    manifest_path = os.path.join(output_dir, AUDIO_MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except Exception:
+        return {}
+
+def save_audio_manifest(output_dir, files):
+    manifest_path = os.path.join(output_dir, AUDIO_MANIFEST_NAME)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"files": files}, f, indent=2, ensure_ascii=False)
+
+def cleanup_audio_output(output_dir="output_audio"):
+    """
+    前回の実行が途中で止まったときの一時ファイルだけを削除する。
+    音声・マニフェスト・動画セグメントのキャッシュ（segments/）は、次の実行で変わっていないセリフを再利用するために残す
+    （台本から消えたセリフの音声やセグメントは process_script と差分レンダリングが削除する）。
+    """
+    shutil.rmtree(os.path.join(output_dir, ".staging"), ignore_errors=True)
+
 def process_script(script_file="script.json", output_dir="output_audio"):
     """
     script.json を読み込み、全てのセリフを音声化して保存する。
+    前回の出力とマニフェストが残っている場合は、入力が変わっていないセリフの音声を再利用する。
     """
     if not os.path.exists(script_file):
         print(f"Script file {script_file} not found.")
@@ -243,32 +279,83 @@ def process_script(script_file="script.json", output_dir="output_audio"):
     dialogues = data.get("dialogue", [])
     print(f"Processing {len(dialogues)} lines of dialogue...")
 
+    # 前回の出力: ハッシュ -> ファイル名
+    previous = {}
+    for name, line_hash in load_audio_manifest(output_dir).items():
+        if os.path.exists(os.path.join(output_dir, name)):
+            previous.setdefault(line_hash, name)
+
+    # 新しい音声や並び替えた音声はいったん staging に置き、最後に差し替える
+    staging_dir = os.path.join(output_dir, ".staging")
+    os.makedirs(staging_dir, exist_ok=True)
+
     audio_files = []
+    manifest = {}
+    staged = []
+    reused = 0
 
     for i, line in enumerate(dialogues):
         speaker = line.get("speaker") or DEFAULT_SPEAKER_NAME
         text = line.get("text", "")
         speaker_id = resolve_speaker_id(speaker)
+        line_hash = audio_line_hash(text, speaker_id)
 
         # 安全なファイル名を生成
         safe_speaker = safe_speaker_filename(speaker, speaker_id)
-        filename = os.path.join(output_dir, f"{i:03d}_{safe_speaker}.wav")
+        name = f"{i:03d}_{safe_speaker}.wav"
+        filename = os.path.join(output_dir, name)
+
+        if line_hash in previous:
+            reused += 1
+            if previous[line_hash] != name:
+                staged_path = os.path.join(staging_dir, name)
+                shutil.copyfile(os.path.join(output_dir, previous[line_hash]), staged_path)
+                staged.append((staged_path, filename))
+            audio_files.append(filename)
+            manifest[name] = line_hash
+            continue
 
         print(f"[{i+1}/{len(dialogues)}] Generating {speaker}: {text[:20]}...")
-        success = generate_audio_file(text, speaker, filename, speaker_id=speaker_id)
+        staged_path = os.path.join(staging_dir, name)
+        success = generate_audio_file(text, speaker, staged_path, speaker_id=speaker_id)
 
         if success:
+            staged.append((staged_path, filename))
             audio_files.append(filename)
+            manifest[name] = line_hash
         else:
             print("  -> Failed.")
 
         # 少し待機（API負荷軽減）
         time.sleep(0.1)
 
+    for staged_path, filename in staged:
+        os.replace(staged_path, filename)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+    # 台本から消えたセリフの古い音声を削除（動画側はフォルダ内の wav を全て使うため）
+    for name in os.listdir(output_dir):
+        if name.endswith(".wav") and name not in manifest:
+            try:
+                os.remove(os.path.join(output_dir, name))
+            except OSError:
+                pass
+
+    save_audio_manifest(output_dir, manifest)
+
+    if reused:
+        print(f"Reused {reused}/{len(dialogues)} unchanged lines.")
     print("\nAudio generation complete!")
     return audio_files
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate audio for each dialogue line with VOICEVOX")
+    parser.add_argument("--script", type=str, default="script.json")
+    parser.add_argument("--output", type=str, default="output_audio")
+    args = parser.parse_args()
+
     # Test execution
     # 事前に script_generator.py で作成された script.json を使用
-    process_script()
+    process_script(args.script, args.output)
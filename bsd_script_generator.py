@@ -1,31 +1,28 @@
 import os
-import requests
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 from lm_studio_utils import ensure_lm_studio_ready
+from llm_client import chat_json, context_length, dialogue_schema, has_dialogue, report_cache, resolve_model
+from token_budget import allocate, count_message_tokens, output_tokens_for_lines, split_to_tokens
 
 load_dotenv()
 
-LM_STUDIO_URL = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1") + "/chat/completions"
-API_KEY = os.getenv("LM_STUDIO_API_KEY", "lm-studio")
-DEFAULT_MODEL = "openai/gpt-oss-20b" # Will be resolved dynamically
 DEFAULT_SPEAKER_NAME = os.getenv("VOICEVOX_SPEAKER_NAME", "青山龍星")
-
-def resolve_model():
-    model = os.getenv("LM_STUDIO_MODEL")
-    if model:
-        return model
-    # Fallback resolution same as script_generator.py
-    base_url = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1")
-    try:
-        response = requests.get(f"{base_url}/models", timeout=5)
-        if response.status_code == 200:
-            data = response.json().get("data", [])
-            if data: return data[0].get("id")
-    except:
-        pass
-    return DEFAULT_MODEL
+# Sections are generated concurrently (match LM Studio's parallel slots)
+BSD_SECTION_CONCURRENCY = int(os.getenv("BSD_SECTION_CONCURRENCY", "4"))
+# Attempts per section before it is dropped
+BSD_SECTION_RETRIES = int(os.getenv("BSD_SECTION_RETRIES", "2"))
+BSD_SECTION_TIMEOUT = int(os.getenv("BSD_SECTION_TIMEOUT", "600"))
+# Upper bound for the whole script in seconds (sections still running at the deadline are dropped)
+BSD_SCRIPT_DEADLINE = int(os.getenv("BSD_SCRIPT_DEADLINE", "1800"))
+# Upper bound for the article text sent per section (lowered further if the context window is small)
+BSD_CHUNK_TOKENS = int(os.getenv("BSD_CHUNK_TOKENS", "1600"))
+BSD_MIN_CHUNK_TOKENS = 500
+# Target length of each section's script, used to size max_tokens
+BSD_SECTION_LINES = int(os.getenv("BSD_SECTION_LINES", "20"))
 
 def normalize_dialogue_text(text):
     # Same normalization as script_generator.py
@@ -33,43 +30,13 @@ def normalize_dialogue_text(text):
     text = re.sub(r"\s+", " ", text).strip()
     return text
 
-def chunk_text(text, max_chars=2000):
+def chunk_text(text, max_tokens=BSD_CHUNK_TOKENS):
     """
-    Splits text into chunks of roughly max_chars, respecting newlines/headers if possible.
+    Splits text into chunks of at most max_tokens, respecting paragraph boundaries if possible.
     """
-    if len(text) <= max_chars:
-        return [text]
-        
-    chunks = []
-    current_chunk = ""
-    
-    # Split by double newlines to preserve paragraphs
-    paragraphs = text.split("\n\n")
-    
-    for para in paragraphs:
-        if len(current_chunk) + len(para) < max_chars:
-            current_chunk += para + "\n\n"
-        else:
-            if current_chunk:
-                chunks.append(current_chunk)
-            current_chunk = para + "\n\n"
-            
-            # If a single paragraph is huge (unlikely but possible), split it blindly
-            while len(current_chunk) > max_chars:
-                chunks.append(current_chunk[:max_chars])
-                current_chunk = current_chunk[max_chars:]
-                
-    if current_chunk:
-        chunks.append(current_chunk)
-        
-    return chunks
+    return split_to_tokens(text, max_tokens)
 
-def generate_section_script(title, section_text, section_type="middle", model=None):
-    """
-    Generates a script fragment for a specific section.
-    section_type: "intro", "middle", "outro"
-    """
-    
+def section_messages(title, section_text, section_type="middle"):
     system_prompt = f"""
     あなたは科学解説Podcastの構成作家です。
     脳科学辞典の項目「{title}」について、ナレーター「{DEFAULT_SPEAKER_NAME}」が解説する台本の一部を作成してください。
@@ -101,30 +68,20 @@ def generate_section_script(title, section_text, section_type="middle", model=No
     {section_text}
     """
     
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 2000,
-        "stream": False
-    }
-    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def generate_section_script(title, section_text, section_type="middle", model=None, timeout=600, max_tokens=2000, cache=True):
+    """
+    Generates a script fragment for a specific section.
+    section_type: "intro", "middle", "outro"
+    """
+    messages = section_messages(title, section_text, section_type)
     try:
-        response = requests.post(LM_STUDIO_URL, headers={"Content-Type": "application/json"}, json=payload, timeout=600)
-        response.raise_for_status()
-        
-        content = response.json()['choices'][0]['message']['content']
-        # Extract JSON
-        content = content.replace("```json", "").replace("```", "").strip()
-        start = content.find('{')
-        end = content.rfind('}')
-        if start != -1 and end != -1:
-            content = content[start:end+1]
-            
-        data = json.loads(content)
+        data = chat_json(messages, temperature=0.7, max_tokens=max_tokens, timeout=timeout, model=model, retries=1,
+                         schema=dialogue_schema(title=False), schema_name="bsd_section", cache=cache, valid=has_dialogue)
         return data.get("dialogue", [])
     except Exception as e:
         print(f"Error generating section ({section_type}): {e}")
@@ -142,27 +99,72 @@ def generate_bsd_script(article_data):
     
     print(f"Generating script for: {title} (Length: {len(content)})")
     
-    chunks = chunk_text(content, max_chars=1500) # Conservative limit
-    full_dialogue = []
-    
     model = resolve_model()
+    # Size the output from the section target and fit it with a full chunk when the context allows
+    max_tokens, input_tokens = allocate(
+        context_length(model),
+        count_message_tokens(section_messages(title, "", "middle")),
+        output_tokens_for_lines(BSD_SECTION_LINES, DEFAULT_SPEAKER_NAME),
+        desired_input=BSD_CHUNK_TOKENS,
+        min_input=BSD_MIN_CHUNK_TOKENS
+    )
+    chunks = chunk_text(content, max_tokens=min(BSD_CHUNK_TOKENS, max(input_tokens, BSD_MIN_CHUNK_TOKENS)))
+    deadline = time.time() + BSD_SCRIPT_DEADLINE
+    workers = max(1, min(BSD_SECTION_CONCURRENCY, len(chunks)))
+    print(f"Generating {len(chunks)} sections ({workers} in flight, deadline {BSD_SCRIPT_DEADLINE} s)...")
+    
+    def run_section(i, chunk, section_type):
+        # Each attempt gets only the time left before the deadline
+        for attempt in range(max(1, BSD_SECTION_RETRIES)):
+            remaining = deadline - time.time()
+            if remaining <= 1:
+                print(f"Skipping chunk {i+1}/{len(chunks)} ({section_type}): deadline reached")
+                return []
+            print(f"Processing chunk {i+1}/{len(chunks)} ({section_type}), attempt {attempt + 1}/{max(1, BSD_SECTION_RETRIES)}...")
+            timeout = int(min(BSD_SECTION_TIMEOUT, remaining))
+            # Retries bypass the cache so they do not replay the reply that just failed
+            dialogue_part = generate_section_script(title, chunk, section_type, model, timeout=timeout, max_tokens=max_tokens,
+                                                    cache=attempt == 0)
+            if dialogue_part:
+                return dialogue_part
+        return []
     
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = []
     for i, chunk in enumerate(chunks):
         section_type = "middle"
         if i == 0:
             section_type = "intro"
         elif i == len(chunks) - 1:
             section_type = "outro"
-            
-        print(f"Processing chunk {i+1}/{len(chunks)} ({section_type})...")
-        dialogue_part = generate_section_script(title, chunk, section_type, model)
-        
-        # Add normalization
+        futures.append(executor.submit(run_section, i, chunk, section_type))
+    
+    done, not_done = wait(futures, timeout=max(0, deadline - time.time()))
+    if not_done:
+        print(f"Warning: {len(not_done)} sections did not finish before the deadline and were dropped.")
+    # Do not wait for sections still running past the deadline
+    executor.shutdown(wait=False, cancel_futures=True)
+    
+    # Reassemble in article order
+    full_dialogue = []
+    for i, future in enumerate(futures):
+        if future not in done:
+            continue
+        dialogue_part = future.result()
+        if not isinstance(dialogue_part, list) or not dialogue_part:
+            print(f"Warning: Section {i+1}/{len(chunks)} produced no dialogue.")
+            continue
         for line in dialogue_part:
+            if not isinstance(line, dict) or not line.get("text"):
+                continue
+            # Add normalization
             line['text'] = normalize_dialogue_text(line['text'])
-            
-        full_dialogue.extend(dialogue_part)
-        
+            full_dialogue.append(line)
+    
+    report_cache()
+    if not full_dialogue:
+        print("Error: No section produced dialogue.")
+        return None
     return {
         "title": title,
         "dialogue": full_dialogue,
@@ -0,0 +1,465 @@
+"""
+ComfyUI Stand-in
+image_generator が使う ComfyUI API の一部（/prompt, /history, /view, /queue, /ws）だけを話すローカルサーバー。
+モデルも GPU も使わず、指定した遅延のあとにプレースホルダーの PNG を返すので、
+クライアントのタイムアウト・バッチ投入・スループットを普通の Linux マシンで試せる。
+
+Usage:
+  python comfyui_standin.py serve --port 8189 --delay 2 --jitter 0.5
+  COMFYUI_BASE_URL=http://127.0.0.1:8189 python image_generator.py
+
+  # サーバーを起動して image_generator.generate_images で負荷をかける
+  python comfyui_standin.py loadtest --jobs 8 --candidates 2 --delay 0.5
+"""
+import os
+import io
+import json
+import time
+import uuid
+import queue
+import base64
+import random
+import select
+import struct
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class StandinState:
+    """
+    キュー・履歴・生成済み画像・websocket クライアントを保持する
+    """
+
+    def __init__(self, delay=2.0, jitter=0.0, view_delay=0.0, fail_rate=0.0, drop_rate=0.0, parallel=1, steps_messages=5):
+        self.delay = delay
+        self.jitter = jitter
+        self.view_delay = view_delay
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.parallel = max(1, parallel)
+        self.steps_messages = steps_messages
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.queued = {}
+        self.cancelled = set()
+        self.running = set()
+        self.history = {}
+        self.images = {}
+        self.clients = {}
+        self.counter = 0
+        self.stats = {"queued": 0, "completed": 0, "failed": 0, "cancelled": 0, "views": 0}
+
+    def start_workers(self):
+        for _ in range(self.parallel):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def enqueue(self, workflow, client_id):
+        prompt_id = str(uuid.uuid4())
+        with self.lock:
+            self.counter += 1
+            number = self.counter
+            self.queued[prompt_id] = (number, workflow, client_id)
+            self.stats["queued"] += 1
+        self.pending.put(prompt_id)
+        self.broadcast_status()
+        return prompt_id, number
+
+    def cancel(self, prompt_ids):
+        with self.lock:
+            for prompt_id in prompt_ids:
+                # 実行中のものは取り消せない（ComfyUI と同じ）
+                if prompt_id in self.queued and prompt_id not in self.running and prompt_id not in self.cancelled:
+                    self.cancelled.add(prompt_id)
+                    self.stats["cancelled"] += 1
+
+    def queue_remaining(self):
+        with self.lock:
+            return len(self.queued) - len(self.cancelled & set(self.queued))
+
+    # websocket
+
+    def register(self, client_id):
+        outbox = queue.Queue()
+        with self.lock:
+            self.clients[client_id] = outbox
+        return outbox
+
+    def unregister(self, client_id, outbox):
+        with self.lock:
+            if self.clients.get(client_id) is outbox:
+                del self.clients[client_id]
+
+    def send(self, client_id, message):
+        with self.lock:
+            outbox = self.clients.get(client_id)
+        if outbox is not None:
+            outbox.put(json.dumps(message))
+
+    def broadcast_status(self):
+        message = {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": self.queue_remaining()}}}}
+        with self.lock:
+            outboxes = list(self.clients.values())
+        for outbox in outboxes:
+            outbox.put(json.dumps(message))
+
+    # 実行
+
+    def _worker(self):
+        while True:
+            prompt_id = self.pending.get()
+            with self.lock:
+                number, workflow, client_id = self.queued[prompt_id]
+                cancelled = prompt_id in self.cancelled
+                if not cancelled:
+                    self.running.add(prompt_id)
+            if cancelled:
+                with self.lock:
+                    del self.queued[prompt_id]
+                    self.cancelled.discard(prompt_id)
+                self.broadcast_status()
+                continue
+            try:
+                self._execute(prompt_id, number, workflow, client_id)
+            finally:
+                with self.lock:
+                    del self.queued[prompt_id]
+                    self.running.discard(prompt_id)
+            self.broadcast_status()
+
+    def _execute(self, prompt_id, number, workflow, client_id):
+        self.send(client_id, {"type": "execution_start", "data": {"prompt_id": prompt_id}})
+        sampler_node = next((k for k, v in workflow.items() if v.get("class_type") == "KSampler"), None)
+        self.send(client_id, {"type": "executing", "data": {"node": sampler_node, "prompt_id": prompt_id}})
+
+        duration = max(0.0, self.delay + random.uniform(-self.jitter, self.jitter))
+        steps = max(1, self.steps_messages)
+        for step in range(steps):
+            time.sleep(duration / steps)
+            self.send(client_id, {"type": "progress", "data": {
+                "value": step + 1, "max": steps, "prompt_id": prompt_id, "node": sampler_node
+            }})
+
+        if random.random() < self.fail_rate:
+            with self.lock:
+                self.history[prompt_id] = {
+                    "prompt": [number, prompt_id, workflow, {}, []],
+                    "outputs": {},
+                    "status": {"status_str": "error", "completed": False, "messages": []}
+                }
+                self.stats["failed"] += 1
+            self.send(client_id, {"type": "execution_error", "data": {
+                "prompt_id": prompt_id, "node_id": sampler_node, "exception_message": "Simulated failure"
+            }})
+            return
+
+        outputs = {}
+        for node_id, node in workflow.items():
+            if node.get("class_type") != "SaveImage":
+                continue
+            prefix = node.get("inputs", {}).get("filename_prefix", "ComfyUI")
+            images = []
+            for i, png in enumerate(render_outputs(workflow)):
+                filename = f"{prefix}_{number:05d}_{i}.png"
+                with self.lock:
+                    self.images[filename] = png
+                images.append({"filename": filename, "subfolder": "", "type": "output"})
+            outputs[node_id] = {"images": images}
+            self.send(client_id, {"type": "executed", "data": {"node": node_id, "output": {"images": images}, "prompt_id": prompt_id}})
+
+        with self.lock:
+            self.history[prompt_id] = {
+                "prompt": [number, prompt_id, workflow, {}, list(outputs)],
+                "outputs": outputs,
+                "status": {"status_str": "success", "completed": True, "messages": []}
+            }
+            self.stats["completed"] += 1
+
+        # 完了通知を落として、クライアントの履歴確認によるフォールバックを試せるようにする
+        if random.random() < self.drop_rate:
+            return
+        self.send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+        self.send(client_id, {"type": "execution_success", "data": {"prompt_id": prompt_id}})
+
+
+def render_outputs(workflow):
+    """
+    ワークフローのサイズ・バッチ数・シード・プロンプトからプレースホルダーの PNG を作る
+    """
+    width, height, batch_size = 512, 512, 1
+    seed, text = 0, ""
+    for node in workflow.values():
+        inputs = node.get("inputs", {})
+        if node.get("class_type") == "EmptyLatentImage":
+            width, height = int(inputs.get("width", 512)), int(inputs.get("height", 512))
+            batch_size = int(inputs.get("batch_size", 1))
+        elif node.get("class_type") == "KSampler":
+            seed = int(inputs.get("seed", 0))
+        elif node.get("class_type") == "CLIPTextEncode" and not text:
+            text = str(inputs.get("text", ""))
+
+    pngs = []
+    for i in range(batch_size):
+        rng = np.random.default_rng(seed + i)
+        top, bottom = rng.integers(0, 256, 3), rng.integers(0, 256, 3)
+        t = np.linspace(0.0, 1.0, height)[:, None]
+        rows = (top[None, :] * (1 - t) + bottom[None, :] * t).astype(np.uint8)
+        pixels = np.ascontiguousarray(np.broadcast_to(rows[:, None, :], (height, width, 3)))
+        image = Image.fromarray(pixels)
+        draw = ImageDraw.Draw(image)
+        draw.text((16, 16), f"seed {seed + i}", fill=(255, 255, 255))
+        draw.text((16, 36), text[:60], fill=(255, 255, 255))
+        buf = io.BytesIO()
+        image.save(buf, format="PNG", compress_level=1)
+        pngs.append(buf.getvalue())
+    return pngs
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server_version = "ComfyUIStandin/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        return json.loads(self.rfile.read(length) or b"{}") if length > 0 else {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/ws":
+            self._serve_websocket(parse_qs(url.query).get("clientId", [""])[0])
+            return
+        if url.path.startswith("/history/"):
+            prompt_id = url.path[len("/history/"):]
+            with self.state.lock:
+                entry = self.state.history.get(prompt_id)
+            self._send_json(200, {prompt_id: entry} if entry else {})
+            return
+        if url.path == "/view":
+            filename = parse_qs(url.query).get("filename", [""])[0]
+            if self.state.view_delay:
+                time.sleep(self.state.view_delay)
+            with self.state.lock:
+                png = self.state.images.get(filename)
+                if png is not None:
+                    self.state.stats["views"] += 1
+            if png is None:
+                self._send_json(404, {"error": "not found"})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(png)))
+            self.end_headers()
+            self.wfile.write(png)
+            return
+        if url.path == "/stats":
+            with self.state.lock:
+                payload = {**self.state.stats, "clients": len(self.state.clients)}
+            payload["queue_remaining"] = self.state.queue_remaining()
+            self._send_json(200, payload)
+            return
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except Exception as e:
+            self._send_json(400, {"error": f"invalid json: {e}"})
+            return
+        if self.path == "/prompt":
+            workflow = body.get("prompt")
+            if not isinstance(workflow, dict):
+                self._send_json(400, {"error": "prompt is required"})
+                return
+            prompt_id, number = self.state.enqueue(workflow, body.get("client_id", ""))
+            self._send_json(200, {"prompt_id": prompt_id, "number": number, "node_errors": {}})
+            return
+        if self.path == "/queue":
+            self.state.cancel(body.get("delete", []))
+            self._send_json(200, {})
+            return
+        self._send_json(404, {"error": "not found"})
+
+    # 最小限の websocket（RFC 6455）: サーバーからはテキストフレームを送り、クライアントからは close / ping だけを扱う
+
+    def _serve_websocket(self, client_id):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not key or self.headers.get("Upgrade", "").lower() != "websocket":
+            self._send_json(400, {"error": "websocket upgrade required"})
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        sock = self.connection
+        outbox = self.state.register(client_id)
+        try:
+            outbox.put(json.dumps({"type": "status", "data": {
+                "status": {"exec_info": {"queue_remaining": self.state.queue_remaining()}}, "sid": client_id
+            }}))
+            while True:
+                readable, _, _ = select.select([sock], [], [], 0)
+                if readable:
+                    opcode, payload = read_frame(self.rfile)
+                    if opcode is None or opcode == 0x8:
+                        send_frame(sock, 0x8, b"")
+                        break
+                    if opcode == 0x9:
+                        send_frame(sock, 0xA, payload)
+                    continue
+                try:
+                    message = outbox.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                send_frame(sock, 0x1, message.encode("utf-8"))
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.state.unregister(client_id, outbox)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def read_frame(rfile):
+    """
+    クライアントからのフレームを1つ読む（クライアントのフレームは必ずマスクされている）
+    """
+    header = rfile.read(2)
+    if len(header) < 2:
+        return None, b""
+    opcode = header[0] & 0x0F
+    masked = header[1] & 0x80
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", rfile.read(8))[0]
+    mask = rfile.read(4) if masked else b"\x00\x00\x00\x00"
+    data = rfile.read(length)
+    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+    return opcode, payload
+
+
+def send_frame(sock, opcode, payload):
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    sock.sendall(header + payload)
+
+
+def start_server(host="127.0.0.1", port=8189, **options):
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(**options)
+    server.state.start_workers()
+    return server
+
+
+def run_loadtest(jobs, candidates, timeout, output_dir, **options):
+    """
+    スタンドインを別スレッドで起動し、image_generator.generate_images でまとめて生成する
+    """
+    server = start_server("127.0.0.1", 0, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = f"127.0.0.1:{server.server_address[1]}"
+
+    os.environ["THUMBNAIL_CACHE"] = "0"
+    import image_generator
+    import thumbnail_cache
+    thumbnail_cache.THUMBNAIL_CACHE_ENABLED = False
+    image_generator._CLIENT = image_generator.ComfyUIClient(server_address=address, timeout=timeout)
+
+    os.makedirs(output_dir, exist_ok=True)
+    batch = [
+        {"prompt": f"load test image {i}", "output": os.path.join(output_dir, f"loadtest_{i}.png")}
+        for i in range(jobs)
+    ]
+    started = time.time()
+    results = image_generator.generate_images(batch, candidates=candidates)
+    elapsed = time.time() - started
+
+    saved = sum(1 for r in results if r)
+    prompts = jobs * candidates
+    print("")
+    print(f"Jobs: {jobs}, candidates: {candidates}, prompts: {prompts}, parallel: {server.state.parallel}")
+    print(f"Saved: {saved}/{jobs} in {elapsed:.2f}s ({prompts / elapsed:.2f} prompts/s)")
+    print(f"Server stats: {server.state.stats}")
+    image_generator._CLIENT.close()
+    server.shutdown()
+    server.server_close()
+    return saved, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local ComfyUI stand-in for testing image_generator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_options(p):
+        p.add_argument("--delay", type=float, default=2.0, help="1プロンプトの実行時間（秒）")
+        p.add_argument("--jitter", type=float, default=0.0, help="実行時間のばらつき（秒）")
+        p.add_argument("--view-delay", type=float, default=0.0, help="/view の応答遅延（秒）")
+        p.add_argument("--fail-rate", type=float, default=0.0, help="実行エラーにする割合")
+        p.add_argument("--drop-rate", type=float, default=0.0, help="完了通知を送らない割合")
+        p.add_argument("--parallel", type=int, default=1, help="同時に実行するプロンプト数")
+
+    serve_parser = subparsers.add_parser("serve", help="Run the stand-in server")
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8189)
+    add_options(serve_parser)
+
+    loadtest_parser = subparsers.add_parser("loadtest", help="Run image_generator against an in-process stand-in")
+    loadtest_parser.add_argument("--jobs", type=int, default=8)
+    loadtest_parser.add_argument("--candidates", type=int, default=1)
+    loadtest_parser.add_argument("--timeout", type=float, default=60.0)
+    loadtest_parser.add_argument("--output-dir", type=str, default="comfyui_loadtest")
+    add_options(loadtest_parser)
+
+    args = parser.parse_args()
+    options = {
+        "delay": args.delay,
+        "jitter": args.jitter,
+        "view_delay": args.view_delay,
+        "fail_rate": args.fail_rate,
+        "drop_rate": args.drop_rate,
+        "parallel": args.parallel,
+    }
+    if args.command == "serve":
+        server = start_server(args.host, args.port, **options)
+        print(f"ComfyUI stand-in listening on {args.host}:{args.port} (delay {args.delay}s)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        run_loadtest(args.jobs, args.candidates, args.timeout, args.output_dir, **options)
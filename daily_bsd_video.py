@@ -5,7 +5,6 @@ Fetches new items from BSD, generates explanatory videos.
 import time
 import datetime
 import os
-import shutil
 import argparse
 import json
 import sys
@@ -14,10 +13,10 @@ from dotenv import load_dotenv
 # Import modules
 from bsd_fetcher import fetch_recent_items_list, fetch_article_content
 from bsd_script_generator import generate_bsd_script
-from audio_generator import process_script
-from simple_image_gen import generate_thumbnail
+from audio_generator import cleanup_audio_output, process_script
+from series_thumbnail import make_episode_thumbnail
 from video_editor import create_podcast_video
-from youtube_uploader import upload_video
+from youtube_uploader import upload_video, upload_while_rendering, STREAMING_UPLOAD
 
 load_dotenv()
 
@@ -58,8 +57,8 @@ def cleanup_temp_files():
                     os.remove(filename)
                 except OSError:
                     pass
-    if os.path.exists('bsd_output_audio'):
-        shutil.rmtree('bsd_output_audio', ignore_errors=True)
+    # 音声とセグメントのキャッシュは残す（変わっていないセリフを再利用する）
+    cleanup_audio_output('bsd_output_audio')
 
 def generate_bsd_video(test_mode=False, force_url=None):
     print(f"\n=== BSD Video Generation Start ===")
@@ -125,22 +124,46 @@ def generate_bsd_video(test_mode=False, force_url=None):
     # Truncate title if too long for prompt
     safe_title = title[:50]
     thumbnail_prompt = f"neuroscience, brain anatomy, scientific diagram, detailed illustration, {safe_title}, 4k"
-    thumbnail_path = generate_thumbnail(thumbnail_prompt, output_filename="bsd_thumbnail.png")
+    today_str = datetime.date.today().strftime("%Y%m%d")
+    thumbnail_path = make_episode_thumbnail("bsd", title, thumbnail_prompt, output_filename="bsd_thumbnail.png", date_str=today_str)
     
     # 6. Create Video
-    today_str = datetime.date.today().strftime("%Y%m%d")
     video_filename = f"bsd_video_{today_str}.mp4"
     if test_mode:
         video_filename = f"test_{video_filename}"
         
     video_path = get_unique_path(video_filename)
-    
-    final_video = create_podcast_video(
-        thumbnail_path,
-        audio_folder,
-        video_path,
-        script_file=script_file
-    )
+
+    video_title = f"【脳科学辞典】{title} の解説"
+    if test_mode:
+        video_title = f"[TEST] {video_title}"
+        
+    description = f"脳科学辞典の「{title}」についての解説動画です。\n\n元記事:\n{target_item['url']}\n\n※この動画はAIによって自動生成されました。"
+    upload_options = {
+        "title": video_title,
+        "description": description,
+        "category_id": "28", # Science & Technology
+        "keywords": ["脳科学", "Neuroscience", "BSD", title],
+        "privacy_status": "public" if not test_mode else "private"
+    }
+
+    def render():
+        return create_podcast_video(
+            thumbnail_path,
+            audio_folder,
+            video_path,
+            script_file=script_file,
+            series="bsd",
+            fragmented=True if STREAMING_UPLOAD else None
+        )
+
+    video_id = None
+    if STREAMING_UPLOAD:
+        # 書き出し中の fragmented MP4 を並行してアップロード
+        print("Uploading to YouTube while encoding...")
+        final_video, video_id = upload_while_rendering(render, video_path, **upload_options)
+    else:
+        final_video = render()
     
     if not final_video:
         print("Failed to create video.")
@@ -148,21 +171,10 @@ def generate_bsd_video(test_mode=False, force_url=None):
 
     # 7. Upload
     print("\n=== Uploading ===")
-    video_title = f"【脳科学辞典】{title} の解説"
-    if test_mode:
-        video_title = f"[TEST] {video_title}"
-        
-    description = f"脳科学辞典の「{title}」についての解説動画です。\n\n元記事:\n{target_item['url']}\n\n※この動画はAIによって自動生成されました。"
     
     try:
-        video_id = upload_video(
-            file_path=final_video,
-            title=video_title,
-            description=description,
-            category_id="28", # Science & Technology
-            keywords=["脳科学", "Neuroscience", "BSD", title],
-            privacy_status="public" if not test_mode else "private"
-        )
+        if not STREAMING_UPLOAD:
+            video_id = upload_video(file_path=final_video, **upload_options)
         print(f"Uploaded: https://youtu.be/{video_id}")
         
         # Update state only if successful (and not forced test?)
@@ -5,7 +5,6 @@ eegflow.jp の GitHub リポジトリの変更点を取得し、学術的議論
 import time
 import datetime
 import os
-import shutil
 import argparse
 import json
 import sys
@@ -15,10 +14,10 @@ from dotenv import load_dotenv
 # Import our modules
 from github_fetcher import fetch_all_activities
 from github_script_generator import generate_github_script, format_description
-from audio_generator import process_script
-from simple_image_gen import generate_thumbnail
+from audio_generator import cleanup_audio_output, process_script
+from series_thumbnail import make_episode_thumbnail
 from video_editor import create_podcast_video
-from youtube_uploader import upload_video
+from youtube_uploader import upload_video, upload_while_rendering, STREAMING_UPLOAD
 
 # Load environment variables
 load_dotenv()
@@ -57,8 +56,8 @@ def cleanup_temp_files():
                 except OSError:
                     pass
 
-    if os.path.exists('github_output_audio'):
-        shutil.rmtree('github_output_audio', ignore_errors=True)
+    # 音声とセグメントのキャッシュは残す（変わっていないセリフを再利用する）
+    cleanup_audio_output('github_output_audio')
 
 
 def wait_until_target_time(target_hour, target_minute, force_next_day=False):
@@ -154,7 +153,7 @@ def generate_github_video(test_mode=False, days_back=1, target_date=None, repo=N
     title = script_data.get("title", f"EEGFlow Development Diary {today}")
     thumbnail_prompt = f"EEG brain wave research development, programming code, GitHub, scientific visualization, {title}"
 
-    thumbnail_path = generate_thumbnail(thumbnail_prompt, output_filename="github_thumbnail.png")
+    thumbnail_path = make_episode_thumbnail("github", title, thumbnail_prompt, output_filename="github_thumbnail.png", date_str=str(today))
     if not thumbnail_path:
         print("Failed to generate thumbnail. Using fallback/black image might happen.")
 
@@ -166,12 +165,36 @@ def generate_github_video(test_mode=False, days_back=1, target_date=None, repo=N
 
     video_path = get_unique_path(video_path)
 
-    final_video = create_podcast_video(
-        thumbnail_path,
-        audio_folder,
-        video_path,
-        script_file=script_file
-    )
+    video_title = f"EEGFlow開発日記 {today} | GitHub更新まとめ"
+    if test_mode:
+        video_title = f"[TEST] {video_title}"
+
+    description = format_description(script_data)
+    upload_options = {
+        "title": video_title,
+        "description": description,
+        "category_id": "28",  # Science & Technology
+        "keywords": ["EEGFlow", "EEG", "脳波", "開発日記", "GitHub", "Neuroscience", "BCI"],
+        "privacy_status": "public" if not test_mode else "private"
+    }
+
+    def render():
+        return create_podcast_video(
+            thumbnail_path,
+            audio_folder,
+            video_path,
+            script_file=script_file,
+            series="github",
+            fragmented=True if STREAMING_UPLOAD else None
+        )
+
+    video_id = None
+    if STREAMING_UPLOAD:
+        # 書き出し中の fragmented MP4 を並行してアップロード
+        print("Uploading to YouTube while encoding...")
+        final_video, video_id = upload_while_rendering(render, video_path, **upload_options)
+    else:
+        final_video = render()
 
     if not final_video:
         print("Failed to create video.")
@@ -180,21 +203,9 @@ def generate_github_video(test_mode=False, days_back=1, target_date=None, repo=N
     # 6. Upload to YouTube
     print("\n=== Phase 6: Uploading to YouTube ===")
 
-    video_title = f"EEGFlow開発日記 {today} | GitHub更新まとめ"
-    if test_mode:
-        video_title = f"[TEST] {video_title}"
-
-    description = format_description(script_data)
-
     try:
-        video_id = upload_video(
-            file_path=final_video,
-            title=video_title,
-            description=description,
-            category_id="28",  # Science & Technology
-            keywords=["EEGFlow", "EEG", "脳波", "開発日記", "GitHub", "Neuroscience", "BCI"],
-            privacy_status="public" if not test_mode else "private"
-        )
+        if not STREAMING_UPLOAD:
+            video_id = upload_video(file_path=final_video, **upload_options)
         print(f"Video uploaded successfully! ID: {video_id}")
         print(f"URL: https://youtu.be/{video_id}")
     except Exception as e:
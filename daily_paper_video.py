@@ -6,7 +6,6 @@ Runs daily at 10:00 JST.
 import time
 import datetime
 import os
-import shutil
 import argparse
 import sys
 import json
@@ -16,10 +15,10 @@ from dotenv import load_dotenv
 # Import our modules
 from paper_fetcher import fetch_papers
 from paper_script_generator import generate_paper_script
-from audio_generator import process_script
-from simple_image_gen import generate_thumbnail
+from audio_generator import cleanup_audio_output, process_script
+from series_thumbnail import make_episode_thumbnail
 from video_editor import create_podcast_video
-from youtube_uploader import upload_video
+from youtube_uploader import upload_video, upload_while_rendering, STREAMING_UPLOAD
 
 # Load environment variables
 load_dotenv()
@@ -53,8 +52,8 @@ def cleanup_temp_files():
                 except OSError:
                     pass
 
-    if os.path.exists('output_audio'):
-        shutil.rmtree('output_audio', ignore_errors=True)
+    # 音声とセグメントのキャッシュは残す（変わっていないセリフを再利用する）
+    cleanup_audio_output('output_audio')
 
 def wait_until_target_time(target_hour, target_minute, force_next_day=False):
     """Wait until the target time (JST)."""
@@ -143,7 +142,7 @@ def generate_daily_video(test_mode=False, max_papers=None, target_date=None):
     else:
         title_for_prompt = f"Brain Computer Interface News {today}"
 
-    thumbnail_path = generate_thumbnail(title_for_prompt)
+    thumbnail_path = make_episode_thumbnail("paper", title_for_prompt, title_for_prompt, output_filename="thumbnail.png", date_str=str(today))
     if not thumbnail_path:
         print("Failed to generate thumbnail. Using fallback/black image might happen.")
 
@@ -155,8 +154,36 @@ def generate_daily_video(test_mode=False, max_papers=None, target_date=None):
 
     video_path = get_unique_path(video_path)
 
+    title = f"Brain Tech News {today} | New EEG & BCI Papers"
+    if test_mode:
+        title = f"[TEST] {title}"
+
+    description = f"Daily summary of the latest EEG and BCI research papers selected from arXiv and Scopus.\n\nDate: {today}\n\nPapers covered:\n"
+    for p in all_papers:
+        description += f"- {p['title']}\n  {p['url']}\n"
+
+    upload_options = {
+        "title": title,
+        "description": description,
+        "category_id": "28", # Science & Technology
+        "keywords": ["EEG", "BCI", "Neuroscience", "Brain Computer Interface", "AI", "Research"],
+        "privacy_status": "public"
+    }
+
     # Corrected arguments: image_path, audio_folder, output_filename, script_file
-    final_video = create_podcast_video(thumbnail_path, "output_audio", video_path, script_file="script.json")
+    def render():
+        return create_podcast_video(
+            thumbnail_path, "output_audio", video_path, script_file="script.json", series="paper",
+            fragmented=True if STREAMING_UPLOAD else None
+        )
+
+    video_id = None
+    if STREAMING_UPLOAD:
+        # 書き出し中の fragmented MP4 を並行してアップロード
+        print("Uploading to YouTube while encoding...")
+        final_video, video_id = upload_while_rendering(render, video_path, **upload_options)
+    else:
+        final_video = render()
 
     if not final_video:
         print("Failed to create video.")
@@ -164,23 +191,10 @@ def generate_daily_video(test_mode=False, max_papers=None, target_date=None):
 
     # 8. Upload to YouTube (Always upload)
     print("\n=== Phase 6: Uploading to YouTube ===")
-    title = f"Brain Tech News {today} | New EEG & BCI Papers"
-    if test_mode:
-        title = f"[TEST] {title}"
-
-    description = f"Daily summary of the latest EEG and BCI research papers selected from arXiv and Scopus.\n\nDate: {today}\n\nPapers covered:\n"
-    for p in all_papers:
-        description += f"- {p['title']}\n  {p['url']}\n"
 
     try:
-        video_id = upload_video(
-            file_path=final_video,
-            title=title,
-            description=description,
-            category_id="28", # Science & Technology
-            keywords=["EEG", "BCI", "Neuroscience", "Brain Computer Interface", "AI", "Research"],
-            privacy_status="public"
-        )
+        if not STREAMING_UPLOAD:
+            video_id = upload_video(file_path=final_video, **upload_options)
         print(f"Video uploaded successfully! ID: {video_id}")
         print(f"URL: https://youtu.be/{video_id}")
     except Exception as e:
@@ -0,0 +1,180 @@
+"""
+ディスクキャッシュ
+キーのハッシュをファイル名にして保存し、合計サイズが上限を超えたら最後に使われた時刻が古いものから削除する（LRU）。
+ttl を指定すると、書き込んでから ttl 秒を過ぎたものは使わずに削除する。
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+
+def make_key(*parts):
+    """
+    任意の JSON 化可能な値からキャッシュキー（sha256）を作る
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, cache_dir, max_bytes, suffix="", ttl=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}{self.suffix}")
+
+    def _touch(self, path):
+        # 最終利用時刻は atime に記録する（noatime でマウントされていても明示的に更新する）
+        try:
+            st = os.stat(path)
+            os.utime(path, (time.time(), st.st_mtime))
+        except OSError:
+            pass
+
+    def _expired(self, mtime, now=None):
+        # 書き込んだ時刻は mtime に残る（_touch は atime だけを更新する）
+        return bool(self.ttl) and (now or time.time()) - mtime > self.ttl
+
+    def get_path(self, key):
+        """
+        キャッシュ済みならファイルのパスを返す
+        """
+        path = self.path_for(key)
+        try:
+            expired = self._expired(os.stat(path).st_mtime)
+        except OSError:
+            expired = None
+        if expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        elif expired is not None:
+            self._touch(path)
+            with self._lock:
+                self.hits += 1
+            return path
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_bytes(self, key):
+        path = self.get_path(key)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _store(self, key, write):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.evict()
+        return path
+
+    def put_file(self, key, src_path):
+        def write(f):
+            with open(src_path, "rb") as src:
+                while True:
+                    block = src.read(1024 * 1024)
+                    if not block:
+                        break
+                    f.write(block)
+        return self._store(key, write)
+
+    def put_bytes(self, key, data):
+        return self._store(key, lambda f: f.write(data))
+
+    def entries(self):
+        """
+        (atime, size, path) のリスト
+        """
+        entries = []
+        if not os.path.exists(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_atime, st.st_size, path))
+        return entries
+
+    def remove_expired(self):
+        """
+        ttl を過ぎたものを削除し、残りの (atime, size, path) のリストを返す
+        """
+        entries = self.entries()
+        if not self.ttl:
+            return entries, 0
+        now = time.time()
+        kept = []
+        removed = 0
+        for entry in entries:
+            path = entry[2]
+            try:
+                if self._expired(os.stat(path).st_mtime, now):
+                    os.remove(path)
+                    removed += 1
+                    continue
+            except OSError:
+                continue
+            kept.append(entry)
+        return kept, removed
+
+    def evict(self):
+        """
+        ttl を過ぎたものを削除し、合計サイズが上限を下回るまで、最後に使われたのが古いものから削除する
+        """
+        if (not self.max_bytes or self.max_bytes <= 0) and not self.ttl:
+            return 0
+        with self._lock:
+            entries, removed = self.remove_expired()
+            if not self.max_bytes or self.max_bytes <= 0:
+                return removed
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError:
+                    pass
+            return removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
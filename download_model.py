@@ -1,22 +1,17 @@
-from huggingface_hub import hf_hub_download
-import shutil
-import os
+from model_store import fetch_file, fetch_snapshot
 
 repo_id = "runwayml/stable-diffusion-v1-5"
 filename = "v1-5-pruned-emaonly.safetensors"
 target_dir = "ComfyUI/models/checkpoints"
 
-print(f"Downloading {filename} from {repo_id}...")
-
 try:
-    # ダウンロード（キャッシュされます）
-    cached_path = hf_hub_download(repo_id=repo_id, filename=filename)
-    
-    # ComfyUIのフォルダへコピー
-    target_path = os.path.join(target_dir, filename)
-    shutil.copy(cached_path, target_path)
-    
+    # ComfyUI 用の単一ファイルのチェックポイント（モデルストアに取り込み、コピーせずにリンクで配置）
+    target_path = fetch_file(repo_id, filename, link_to=target_dir)
     print(f"Successfully downloaded to {target_path}")
 
+    # simple_image_gen 用の diffusers 形式（以降の実行では Hub へ問い合わせずにロードする）
+    snapshot_dir = fetch_snapshot(repo_id)
+    print(f"Successfully stored diffusers snapshot in {snapshot_dir}")
+
 except Exception as e:
     print(f"Error downloading model: {e}")
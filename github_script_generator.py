@@ -3,46 +3,27 @@ GitHub リポジトリ変更点の台本生成モジュール
 学術的議論に焦点を当てたPodcast形式の台本を生成
 """
 import os
-import requests
 import json
 import re
 from dotenv import load_dotenv
 from lm_studio_utils import ensure_lm_studio_ready
+from llm_client import LLMError, chat_json, context_length, dialogue_schema, has_dialogue, report_cache
+from token_budget import allocate, count_message_tokens, count_tokens, lines_for_minutes, output_tokens_for_lines, truncate_to_tokens
 
 load_dotenv()
 
-LM_STUDIO_URL = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1") + "/chat/completions"
-API_KEY = os.getenv("LM_STUDIO_API_KEY", "lm-studio")
-DEFAULT_MODEL = "openai/gpt-oss-20b"
 DEFAULT_SPEAKER_NAME = os.getenv("VOICEVOX_SPEAKER_NAME", "青山龍星")
+# Issue・Discussion の本文に使うトークンの上限（PR は1.5倍、コメントは3割）。コンテキストが足りなければ半分ずつ減らす
+GITHUB_BODY_MAX_TOKENS = int(os.getenv("GITHUB_BODY_MAX_TOKENS", "400"))
+GITHUB_BODY_MIN_TOKENS = 50
+GITHUB_MIN_INPUT_TOKENS = 1000
+LM_STUDIO_MAX_TOKENS = int(os.getenv("LM_STUDIO_MAX_TOKENS", "8000"))
 CJK_RANGE = r"\u3040-\u30ff\u3400-\u9fff"
 SPACE_BETWEEN_CJK = re.compile(rf"(?<=[{CJK_RANGE}0-9])\s+(?=[{CJK_RANGE}0-9])")
 SPACE_BETWEEN_CJK_ASCII = re.compile(rf"(?<=[{CJK_RANGE}])\s+(?=[A-Za-z0-9])")
 SPACE_BETWEEN_ASCII_CJK = re.compile(rf"(?<=[A-Za-z0-9])\s+(?=[{CJK_RANGE}])")
 
 
-def resolve_model():
-    model = os.getenv("LM_STUDIO_MODEL")
-    if model:
-        return model
-
-    base_url = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1")
-    try:
-        response = requests.get(f"{base_url}/models", timeout=10)
-        response.raise_for_status()
-        data = response.json().get("data", [])
-        for item in data:
-            model_id = item.get("id")
-            if model_id and "embed" not in model_id.lower():
-                return model_id
-        if data:
-            return data[0].get("id")
-    except Exception as e:
-        print(f"Warning: Could not fetch LM Studio models: {e}")
-
-    return DEFAULT_MODEL
-
-
 def normalize_dialogue_text(text):
     if not text:
         return ""
@@ -64,12 +45,13 @@ def format_date_jp(date_str):
         return date_str
 
 
-def format_activities_text(activities):
+def format_activities_text(activities, body_tokens=GITHUB_BODY_MAX_TOKENS):
     """
     アクティビティ情報をテキスト形式に整形
     学術的議論に関連する内容を抽出
     """
     text_parts = []
+    comment_tokens = body_tokens * 3 // 10
 
     # PRから学術的議論を抽出
     for pr in activities.get("pull_requests", []):
@@ -84,7 +66,7 @@ def format_activities_text(activities):
 作成日: {pr['created_at'][:10] if pr.get('created_at') else '不明'}
 URL: {pr['url']}
 内容:
-{body[:1500] if body else '説明なし'}
+{truncate_to_tokens(body, body_tokens * 3 // 2) if body else '説明なし'}
 """
         text_parts.append(pr_text)
 
@@ -94,7 +76,7 @@ URL: {pr['url']}
 
         comments_text = ""
         for comment in issue.get("comments", [])[:3]:
-            comments_text += f"\n  - {comment['author']}: {comment['body'][:300]}"
+            comments_text += f"\n  - {comment['author']}: {truncate_to_tokens(comment['body'], comment_tokens)}"
 
         issue_text = f"""
 【Issue #{issue['number']}】
@@ -105,7 +87,7 @@ URL: {pr['url']}
 ラベル: {', '.join(issue.get('labels', [])) or 'なし'}
 URL: {issue['url']}
 内容:
-{body[:1000] if body else '説明なし'}
+{truncate_to_tokens(body, body_tokens) if body else '説明なし'}
 {('コメント:' + comments_text) if comments_text else ''}
 """
         text_parts.append(issue_text)
@@ -116,7 +98,7 @@ URL: {issue['url']}
 
         comments_text = ""
         for comment in disc.get("comments", [])[:3]:
-            comments_text += f"\n  - {comment['author']}: {comment['body'][:300]}"
+            comments_text += f"\n  - {comment['author']}: {truncate_to_tokens(comment['body'], comment_tokens)}"
 
         disc_text = f"""
 【Discussion #{disc['number']}】
@@ -126,7 +108,7 @@ URL: {issue['url']}
 作成日: {disc['created_at'][:10] if disc.get('created_at') else '不明'}
 URL: {disc['url']}
 内容:
-{body[:1000] if body else '説明なし'}
+{truncate_to_tokens(body, body_tokens) if body else '説明なし'}
 {('コメント:' + comments_text) if comments_text else ''}
 """
         text_parts.append(disc_text)
@@ -177,8 +159,6 @@ def generate_github_script(activities, date_str=None):
         if not activities.get("commits"):
             return None
 
-    activities_text = format_activities_text(activities)
-
     system_prompt = f"""
 あなたは人気Podcastの構成作家です。
 提供されたGitHubリポジトリの変更情報を元に、リスナーが親しみやすく、かつ知的好奇心を刺激されるような「一人語りの台本」を作成してください。
@@ -234,7 +214,8 @@ Format:
         min_lines = 6
         target_minutes = 12
 
-    user_prompt = f"""以下の{repo}リポジトリの変更情報を元に、約{target_minutes}分程度のトーク台本を作成してください。
+    def build_messages(activities_text):
+        user_prompt = f"""以下の{repo}リポジトリの変更情報を元に、約{target_minutes}分程度のトーク台本を作成してください。
 日付は{jp_date_str}です。冒頭で日付と「イーイージーフロー開発日記」であることを紹介してください。
 
 【重要】学術的・研究的な議論に焦点を当ててください：
@@ -262,104 +243,84 @@ Format:
 - 各トピックにつき最低{min_lines}発話
 - 1セリフは1〜2文で、読み上げやすい長さにする
 """
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-
-    model = resolve_model()
-    payload = {
-        "model": model,
-        "messages": [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.5,
-        "max_tokens": 4000,
-        "stream": False
-    }
+        ]
+
+    # 出力は目標の長さから決め、本文と一緒にコンテキストに収める。入力の枠に収まるまで本文を短くする
+    body_tokens = GITHUB_BODY_MAX_TOKENS
+    activities_text = format_activities_text(activities, body_tokens)
+    lines = max(max(total_activities, 1) * min_lines + 10, lines_for_minutes(target_minutes))
+    max_tokens, input_tokens = allocate(
+        context_length(),
+        count_message_tokens(build_messages("")),
+        output_tokens_for_lines(lines, DEFAULT_SPEAKER_NAME),
+        desired_input=count_tokens(activities_text),
+        min_input=GITHUB_MIN_INPUT_TOKENS,
+        max_output=LM_STUDIO_MAX_TOKENS
+    )
+    while count_tokens(activities_text) > input_tokens and body_tokens > GITHUB_BODY_MIN_TOKENS:
+        body_tokens //= 2
+        activities_text = format_activities_text(activities, body_tokens)
+    if count_tokens(activities_text) > input_tokens:
+        print(f"Warning: Activity text ({count_tokens(activities_text)} tokens) exceeds the {input_tokens}-token input budget.")
+    messages = build_messages(activities_text)
 
     print(f"Generating GitHub activity script for {repo}...")
     print(f"Activities: {total_activities} (PRs: {len(activities.get('pull_requests', []))}, Issues: {len(activities.get('issues', []))}, Discussions: {len(activities.get('discussions', []))})")
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            print(f"Attempt {attempt + 1}/{max_retries}...")
-            response = requests.post(LM_STUDIO_URL, headers=headers, json=payload, timeout=600)
-            response.raise_for_status()
-
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-
-            # JSON部分を抽出
-            content = content.replace("```json", "").replace("```", "").strip()
-            start_idx = content.find('{')
-            end_idx = content.rfind('}')
-
-            if start_idx != -1 and end_idx != -1:
-                content = content[start_idx : end_idx + 1]
-
-            script_data = json.loads(content)
-            if isinstance(script_data.get("dialogue"), list):
-                cleaned_dialogue = []
-                for line in script_data["dialogue"]:
-                    if not isinstance(line, dict):
-                        continue
-                    speaker = line.get("speaker") or DEFAULT_SPEAKER_NAME
-                    text = normalize_dialogue_text(line.get("text", ""))
-                    if text:
-                        cleaned_dialogue.append({"speaker": speaker, "text": text})
-                script_data["dialogue"] = cleaned_dialogue
-
-            # 参考リンク情報を追加
-            script_data['references'] = []
-            for pr in activities.get("pull_requests", []):
-                script_data['references'].append({
-                    'type': 'PR',
-                    'number': pr['number'],
-                    'title': pr['title'],
-                    'url': pr['url'],
-                    'author': pr['author']
-                })
-            for issue in activities.get("issues", []):
-                script_data['references'].append({
-                    'type': 'Issue',
-                    'number': issue['number'],
-                    'title': issue['title'],
-                    'url': issue['url'],
-                    'author': issue['author']
-                })
-            for disc in activities.get("discussions", []):
-                script_data['references'].append({
-                    'type': 'Discussion',
-                    'number': disc['number'],
-                    'title': disc['title'],
-                    'url': disc['url'],
-                    'author': disc['author']
-                })
-
-            script_data['date'] = date_str
-            script_data['repo'] = repo
-
-            return script_data
-
-        except json.JSONDecodeError:
-            print("Error: LM Studio response was not valid JSON.")
-            if attempt < max_retries - 1:
-                print("Retrying...")
-            else:
-                print("Raw response:", content[:500])
-                return None
-        except Exception as e:
-            print(f"Error communicating with LM Studio: {e}")
-            if attempt < max_retries - 1:
-                print("Retrying...")
-            else:
-                return None
-
-    return None
+    try:
+        script_data = chat_json(messages, temperature=0.5, max_tokens=max_tokens, timeout=600,
+                                schema=dialogue_schema(), schema_name="github_script", valid=has_dialogue)
+    except LLMError as e:
+        if e.content:
+            print("Raw response:", e.content[:500])
+        return None
+
+    if isinstance(script_data.get("dialogue"), list):
+        cleaned_dialogue = []
+        for line in script_data["dialogue"]:
+            if not isinstance(line, dict):
+                continue
+            speaker = line.get("speaker") or DEFAULT_SPEAKER_NAME
+            text = normalize_dialogue_text(line.get("text", ""))
+            if text:
+                cleaned_dialogue.append({"speaker": speaker, "text": text})
+        script_data["dialogue"] = cleaned_dialogue
+
+    # 参考リンク情報を追加
+    script_data['references'] = []
+    for pr in activities.get("pull_requests", []):
+        script_data['references'].append({
+            'type': 'PR',
+            'number': pr['number'],
+            'title': pr['title'],
+            'url': pr['url'],
+            'author': pr['author']
+        })
+    for issue in activities.get("issues", []):
+        script_data['references'].append({
+            'type': 'Issue',
+            'number': issue['number'],
+            'title': issue['title'],
+            'url': issue['url'],
+            'author': issue['author']
+        })
+    for disc in activities.get("discussions", []):
+        script_data['references'].append({
+            'type': 'Discussion',
+            'number': disc['number'],
+            'title': disc['title'],
+            'url': disc['url'],
+            'author': disc['author']
+        })
+
+    script_data['date'] = date_str
+    script_data['repo'] = repo
+    report_cache()
+
+    return script_data
 
 
 def format_description(script_data):
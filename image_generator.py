@@ -1,46 +1,296 @@
 import websocket
 import uuid
 import json
-import urllib.request
-import urllib.parse
+import io
 import os
+import queue
 import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
 from dotenv import load_dotenv
 
+import thumbnail_cache
+
 load_dotenv()
 
 SERVER_ADDRESS = os.getenv("COMFYUI_BASE_URL", "http://127.0.0.1:8188").replace("http://", "")
 CLIENT_ID = str(uuid.uuid4())
 
+# 投入したプロンプトがすべて終わるまでの待ち時間の上限（秒）
+COMFYUI_TIMEOUT = float(os.getenv("COMFYUI_TIMEOUT", "600"))
+# /prompt, /history, /view と websocket 接続のタイムアウト（秒）
+COMFYUI_HTTP_TIMEOUT = float(os.getenv("COMFYUI_HTTP_TIMEOUT", "30"))
+# websocket にメッセージが来ない間、履歴で完了を確認する間隔（秒）
+COMFYUI_POLL_INTERVAL = float(os.getenv("COMFYUI_POLL_INTERVAL", "5"))
+# 出力画像を並行して取得する数
+COMFYUI_FETCH_WORKERS = int(os.getenv("COMFYUI_FETCH_WORKERS", "4"))
+# 1件あたりの候補数（シードを変えて投入し、最も良い1枚を選ぶ）
+COMFYUI_CANDIDATES = int(os.getenv("COMFYUI_CANDIDATES", "1"))
+
+# 注意: モデル名はダウンロードしたものと一致させる必要があります
+MODEL_NAME = "v1-5-pruned-emaonly.safetensors"
+STEPS = 20
+SIZE = 512
+
+class ComfyUITimeout(TimeoutError):
+    def __init__(self, message, pending):
+        super().__init__(message)
+        self.pending = pending
+
+class ComfyUIClient:
+    """
+    ComfyUI の API クライアント。
+    websocket と HTTP の接続を使い回し、複数のプロンプトをまとめてキューに入れて、終わったものから出力を並行して取得する。
+    """
+
+    def __init__(self, server_address=SERVER_ADDRESS, client_id=CLIENT_ID, timeout=COMFYUI_TIMEOUT,
+                 http_timeout=COMFYUI_HTTP_TIMEOUT, fetch_workers=COMFYUI_FETCH_WORKERS):
+        self.server_address = server_address
+        self.client_id = client_id
+        self.timeout = timeout
+        self.http_timeout = http_timeout
+        self.fetch_workers = max(1, fetch_workers)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.fetch_workers + 1)
+        self.session.mount("http://", adapter)
+        self._ws = None
+        # 接続とキューへの投入・通知先の登録を守るロック（完了待ちの間は持たない）
+        self._lock = threading.Lock()
+        # websocket は1本なので、受信は1スレッドずつ行い、通知を prompt_id ごとに待っている run のキューへ振り分ける
+        self._recv_lock = threading.Lock()
+        self._listeners = {}
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address}"
+
+    def connect(self):
+        if self._ws is not None and self._ws.connected:
+            return self._ws
+        ws = websocket.WebSocket()
+        ws.connect(f"ws://{self.server_address}/ws?clientId={self.client_id}", timeout=self.http_timeout)
+        self._ws = ws
+        return ws
+
+    def close(self):
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+            self._ws = None
+        self.session.close()
+
+    def queue_prompt(self, workflow):
+        res = self.session.post(
+            f"{self.base_url}/prompt",
+            json={"prompt": workflow, "client_id": self.client_id},
+            timeout=self.http_timeout
+        )
+        res.raise_for_status()
+        return res.json()
+
+    def get_history(self, prompt_id):
+        res = self.session.get(f"{self.base_url}/history/{prompt_id}", timeout=self.http_timeout)
+        res.raise_for_status()
+        return res.json()
+
+    def get_image(self, filename, subfolder, folder_type):
+        res = self.session.get(
+            f"{self.base_url}/view",
+            params={"filename": filename, "subfolder": subfolder, "type": folder_type},
+            timeout=self.http_timeout
+        )
+        res.raise_for_status()
+        return res.content
+
+    def cancel(self, prompt_ids):
+        """
+        まだ実行されていないプロンプトをキューから削除する
+        """
+        try:
+            self.session.post(f"{self.base_url}/queue", json={"delete": list(prompt_ids)}, timeout=self.http_timeout)
+        except Exception as e:
+            print(f"Warning: Could not cancel ComfyUI prompts: {e}")
+
+    def _history_state(self, prompt_id):
+        """
+        websocket のメッセージを取りこぼした場合に備えて、履歴で完了を確認する
+        """
+        try:
+            entry = self.get_history(prompt_id).get(prompt_id)
+        except Exception:
+            return None
+        if not entry:
+            return None
+        status = entry.get("status") or {}
+        if status.get("status_str") == "error":
+            return "error"
+        if status.get("completed") or entry.get("outputs"):
+            return "success"
+        return None
+
+    def _receive(self, timeout):
+        """
+        websocket から1件受信し、その prompt_id を待っている run のキューへ渡す（_recv_lock を持って呼ぶ）
+        """
+        try:
+            with self._lock:
+                ws = self.connect()
+            ws.settimeout(timeout)
+            out = ws.recv()
+        except websocket.WebSocketTimeoutException:
+            return
+        except (websocket.WebSocketException, OSError) as e:
+            # 切断された場合は再接続し、その間に終わったものは次の履歴確認で拾う
+            print(f"ComfyUI websocket error, reconnecting: {e}")
+            self._ws = None
+            time.sleep(min(1.0, timeout))
+            return
+
+        if not isinstance(out, str):
+            return  # プレビュー画像（バイナリ）は無視
+        message = json.loads(out)
+        data = message.get("data") or {}
+        # 投入と登録は _lock の中で行うので、投入直後の通知も登録を待ってから振り分けられる
+        with self._lock:
+            events = self._listeners.get(data.get("prompt_id"))
+        if events is not None:
+            events.put(message)
+
+    def wait_for(self, prompt_ids, events, timeout=None):
+        """
+        prompt_ids の完了を待ち、終わった順に (prompt_id, error) を返す。events は prompt_ids の通知先に登録したキュー。
+        timeout 秒以内に終わらなければ ComfyUITimeout（pending に未完了の prompt_id）
+        """
+        timeout = timeout or self.timeout
+        pending = set(prompt_ids)
+        deadline = time.time() + timeout
+        last_event = time.time()
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise ComfyUITimeout(f"ComfyUI did not finish {len(pending)} prompt(s) within {timeout:.0f}s", pending)
+            wait = min(remaining, COMFYUI_POLL_INTERVAL)
+            # 誰も受信していなければ自分で受信する（他の run 宛ての通知はそちらのキューへ渡す）
+            if self._recv_lock.acquire(blocking=False):
+                try:
+                    self._receive(wait)
+                finally:
+                    self._recv_lock.release()
+                wait = 0
+            try:
+                message = events.get(timeout=wait) if wait else events.get_nowait()
+            except queue.Empty:
+                # 通知を取りこぼした場合に備えて、しばらく通知が無ければ履歴で完了を確認する
+                if time.time() - last_event >= COMFYUI_POLL_INTERVAL:
+                    last_event = time.time()
+                    for prompt_id in list(pending):
+                        state = self._history_state(prompt_id)
+                        if state:
+                            pending.discard(prompt_id)
+                            yield prompt_id, None if state == "success" else "execution error"
+                continue
+
+            last_event = time.time()
+            data = message.get("data") or {}
+            prompt_id = data.get("prompt_id")
+            if prompt_id not in pending:
+                continue
+            message_type = message.get("type")
+            if (message_type == "executing" and data.get("node") is None) or message_type == "execution_success":
+                pending.discard(prompt_id)
+                yield prompt_id, None
+            elif message_type in ("execution_error", "execution_interrupted"):
+                pending.discard(prompt_id)
+                yield prompt_id, data.get("exception_message") or message_type
+
+    def fetch_outputs(self, prompt_id):
+        """
+        プロンプトの出力画像をすべて取得する
+        """
+        history = self.get_history(prompt_id)[prompt_id]
+        images = []
+        for node_output in history["outputs"].values():
+            for image in node_output.get("images", []):
+                images.append(self.get_image(image["filename"], image["subfolder"], image["type"]))
+        return images
+
+    def run(self, workflows, timeout=None):
+        """
+        ワークフローをまとめてキューに入れ（ComfyUI のキューを空けない）、終わったものから出力画像を並行して取得する。
+        戻り値は workflows と同じ順の [画像のバイト列のリスト or None]
+        """
+        results = [None] * len(workflows)
+        events = queue.Queue()
+        prompt_ids = []
+        try:
+            with self._lock:
+                # 完了通知を取りこぼさないよう、キューに入れる前に接続し、投入したものから通知先に登録する
+                self.connect()
+                for workflow in workflows:
+                    prompt_id = self.queue_prompt(workflow)["prompt_id"]
+                    prompt_ids.append(prompt_id)
+                    self._listeners[prompt_id] = events
+            index = {prompt_id: i for i, prompt_id in enumerate(prompt_ids)}
+            print(f"Queued {len(prompt_ids)} prompt(s) on ComfyUI")
+
+            futures = {}
+            with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+                try:
+                    for prompt_id, error in self.wait_for(prompt_ids, events, timeout):
+                        if error:
+                            print(f"ComfyUI prompt {prompt_id} failed: {error}")
+                            continue
+                        futures[executor.submit(self.fetch_outputs, prompt_id)] = index[prompt_id]
+                except ComfyUITimeout as e:
+                    print(f"Warning: {e}")
+                    self.cancel(e.pending)
+
+                for future, i in futures.items():
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        print(f"Error fetching ComfyUI outputs: {e}")
+        finally:
+            with self._lock:
+                for prompt_id in prompt_ids:
+                    self._listeners.pop(prompt_id, None)
+        return results
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_client():
+    """
+    プロセス内で共有する ComfyUI クライアント
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = ComfyUIClient()
+        return _CLIENT
+
 def queue_prompt(prompt):
-    p = {"prompt": prompt, "client_id": CLIENT_ID}
-    data = json.dumps(p).encode('utf-8')
-    req = urllib.request.Request(f"http://{SERVER_ADDRESS}/prompt", data=data)
-    return json.loads(urllib.request.urlopen(req).read())
+    return get_client().queue_prompt(prompt)
 
 def get_image(filename, subfolder, folder_type):
-    data = {"filename": filename, "subfolder": subfolder, "type": folder_type}
-    url_values = urllib.parse.urlencode(data)
-    with urllib.request.urlopen(f"http://{SERVER_ADDRESS}/view?{url_values}") as response:
-        return response.read()
+    return get_client().get_image(filename, subfolder, folder_type)
 
 def get_history(prompt_id):
-    with urllib.request.urlopen(f"http://{SERVER_ADDRESS}/history/{prompt_id}") as response:
-        return json.loads(response.read())
+    return get_client().get_history(prompt_id)
 
-def generate_image(prompt_text, output_path="thumbnail.png"):
+def build_workflow(prompt_text, seed):
     """
-    ComfyUI APIを使用して画像を生成し、指定したパスに保存する。
+    基本的なText to Imageワークフロー
     """
-    # 基本的なText to Imageワークフロー
-    # 注意: モデル名はダウンロードしたものと一致させる必要があります
-    MODEL_NAME = "v1-5-pruned-emaonly.safetensors" 
-    
-    prompt_workflow = {
+    return {
         "3": {
             "inputs": {
-                "seed": int(time.time()), # ランダムシード
-                "steps": 20,
+                "seed": seed,
+                "steps": STEPS,
                 "cfg": 8,
                 "sampler_name": "euler",
                 "scheduler": "normal",
@@ -60,8 +310,8 @@ def generate_image(prompt_text, output_path="thumbnail.png"):
         },
         "5": {
             "inputs": {
-                "width": 512, # 正方形 (サムネ用に必要なら変更)
-                "height": 512,
+                "width": SIZE, # 正方形 (サムネ用に必要なら変更)
+                "height": SIZE,
                 "batch_size": 1
             },
             "class_type": "EmptyLatentImage"
@@ -96,39 +346,83 @@ def generate_image(prompt_text, output_path="thumbnail.png"):
         }
     }
 
-    try:
-        ws = websocket.WebSocket()
-        ws.connect(f"ws://{SERVER_ADDRESS}/ws?clientId={CLIENT_ID}")
-        
-        print(f"Queueing prompt: {prompt_text}...")
-        prompt_id = queue_prompt(prompt_workflow)['prompt_id']
-        
-        # 完了待ち
-        while True:
-            out = ws.recv()
-            if isinstance(out, str):
-                message = json.loads(out)
-                if message['type'] == 'executing':
-                    data = message['data']
-                    if data['node'] is None and data['prompt_id'] == prompt_id:
-                        break # 生成完了
-        
-        # 履歴からファイル名を取得してダウンロード
-        history = get_history(prompt_id)[prompt_id]
-        for node_id in history['outputs']:
-            node_output = history['outputs'][node_id]
-            if 'images' in node_output:
-                for image in node_output['images']:
-                    image_data = get_image(image['filename'], image['subfolder'], image['type'])
-                    
-                    with open(output_path, 'wb') as f:
-                        f.write(image_data)
-                    print(f"Image saved to {output_path}")
-                    return output_path
+def pick_best(images):
+    """
+    候補の画像（バイト列）から最も良いものを選ぶ
+    """
+    if len(images) == 1:
+        return images[0]
+    from PIL import Image
+    from simple_image_gen import select_best_image
+
+    decoded = [Image.open(io.BytesIO(data)) for data in images]
+    best, scores = select_best_image(decoded)
+    print("Candidate scores: " + ", ".join("rejected" if s is None else f"{s:.3f}" for s in scores))
+    if best is None:
+        return None
+    return images[decoded.index(best)]
 
+def generate_images(jobs, candidates=None, timeout=None):
+    """
+    複数の画像をまとめて生成する。
+    jobs: [{"prompt": ..., "output": 保存先, "date_str": 任意}, ...]
+    戻り値は jobs と同じ順の [保存先 or None]
+    """
+    candidates = max(1, int(candidates or COMFYUI_CANDIDATES))
+    results = [None] * len(jobs)
+    workflows = []
+    owners = []  # workflows[i] がどの job のものか
+    cache_keys = {}
+
+    for i, job in enumerate(jobs):
+        seed = thumbnail_cache.resolve_seed(job.get("date_str"))
+        cache_key = thumbnail_cache.thumbnail_key(
+            job["prompt"], MODEL_NAME, STEPS, SIZE, seed,
+            variant=None if candidates == 1 else f"n{candidates}"
+        )
+        if thumbnail_cache.lookup(cache_key, job["output"]):
+            results[i] = job["output"]
+            continue
+        cache_keys[i] = cache_key
+        base_seed = seed if seed is not None else random.randrange(2 ** 32)  # ランダムシード
+        for c in range(candidates):
+            workflows.append(build_workflow(job["prompt"], base_seed + c))
+            owners.append(i)
+        print(f"Queueing prompt: {job['prompt']}...")
+
+    if not workflows:
+        return results
+
+    try:
+        outputs = get_client().run(workflows, timeout)
     except Exception as e:
         print(f"Error generating image: {e}")
-        return None
+        return results
+
+    images_by_job = {}
+    for owner, images in zip(owners, outputs):
+        if images:
+            images_by_job.setdefault(owner, []).append(images[0])
+
+    for i, images in images_by_job.items():
+        image_data = pick_best(images)
+        if image_data is None:
+            print(f"All candidates were rejected for: {jobs[i]['prompt']}")
+            continue
+        output_path = jobs[i]["output"]
+        with open(output_path, 'wb') as f:
+            f.write(image_data)
+        print(f"Image saved to {output_path}")
+        thumbnail_cache.store(cache_keys[i], output_path)
+        results[i] = output_path
+    return results
+
+def generate_image(prompt_text, output_path="thumbnail.png", date_str=None, candidates=None):
+    """
+    ComfyUI APIを使用して画像を生成し、指定したパスに保存する。
+    date_str は THUMBNAIL_SEED_POLICY=date のときのシードに使う。
+    """
+    return generate_images([{"prompt": prompt_text, "output": output_path, "date_str": date_str}], candidates)[0]
 
 if __name__ == "__main__":
     # Test execution
@@ -0,0 +1,126 @@
+"""
+Import Report
+エントリポイントを `python -X importtime` で import し、起動時の import 時間と RSS を表示する。
+重い依存（torch / moviepy / googleapiclient など）が import だけで読み込まれていないかも確認する。
+
+Usage:
+  python import_report.py
+  python import_report.py daily_bsd_video --top 20
+  # 予算を超えたら終了コード 1（CI やデプロイ前の確認用）
+  python import_report.py --budget-ms 500
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+DEFAULT_MODULES = ["daily_paper_video", "daily_github_video", "daily_bsd_video", "main"]
+
+# import 時点では読み込まれてほしくないモジュール（実際に使う処理の中で読み込む）
+HEAVY_MODULES = ["torch", "diffusers", "transformers", "onnxruntime", "moviepy", "googleapiclient", "google_auth_oauthlib"]
+
+# 子プロセスで import した後に RSS と読み込まれたモジュールを出力する
+PROBE = """
+import {module}
+import sys, json, resource
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# Linux は KB、macOS はバイト単位
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"rss_mb": round(rss_mb, 1), "heavy": heavy}}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    -X importtime の出力を [(cumulative_us, self_us, depth, name)] にする
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    return rows
+
+
+def measure_module(module, cwd=None):
+    """
+    1モジュール分の import 時間（ms）、RSS、上位の import と読み込まれた重い依存を返す
+    """
+    env = dict(os.environ)
+    env.setdefault("PYTHONDONTWRITEBYTECODE", "1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    rows = parse_importtime(proc.stderr)
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+        return {"module": module, "error": error}
+
+    probe = json.loads(proc.stdout.strip().splitlines()[-1])
+    # site などインタプリタ起動時の import は除き、対象モジュール配下だけを数える
+    # （-X importtime は子の import を親より先に出力する）
+    end = next((i for i, (_, _, depth, name) in enumerate(rows) if depth == 0 and name == module), None)
+    total_us = rows[end][0] if end is not None else 0
+    top_level = []
+    if end is not None:
+        for cumulative_us, _, depth, name in reversed(rows[:end]):
+            if depth == 0:
+                break
+            if depth == 1:
+                top_level.append((cumulative_us, name))
+    return {
+        "module": module,
+        "import_ms": round(total_us / 1000, 1),
+        "rss_mb": probe["rss_mb"],
+        "heavy": probe["heavy"],
+        "slowest": [{"name": name, "ms": round(c / 1000, 1)} for c, name in sorted(top_level, reverse=True)],
+    }
+
+
+def print_report(results, top):
+    for r in results:
+        print(f"=== {r['module']} ===")
+        if "error" in r:
+            print(f"  import failed: {r['error']}")
+            continue
+        print(f"  import: {r['import_ms']} ms, max RSS: {r['rss_mb']} MB")
+        if r["heavy"]:
+            print(f"  Warning: heavy modules loaded at import time: {', '.join(r['heavy'])}")
+        for item in r["slowest"][:top]:
+            print(f"    {item['ms']:>9.1f} ms  {item['name']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import time and RSS of the pipeline entry points")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=10, help="表示する import の数")
+    parser.add_argument("--budget-ms", type=float, default=None, help="import 時間の上限（超えたら終了コード 1）")
+    parser.add_argument("--json", action="store_true", help="JSON で出力する")
+    args = parser.parse_args()
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    results = [measure_module(module, cwd=project_dir) for module in args.modules]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_report(results, args.top)
+
+    failed = False
+    if args.budget_ms is not None:
+        for r in results:
+            if "error" not in r and (r["import_ms"] > args.budget_ms or r["heavy"]):
+                print(f"Over budget: {r['module']} ({r['import_ms']} ms, heavy: {r['heavy'] or 'none'})")
+                failed = True
+    sys.exit(1 if failed else 0)
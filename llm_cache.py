@@ -0,0 +1,64 @@
+"""
+LLM 応答のキャッシュ
+(モデル, メッセージ, temperature, max_tokens, seed) をキーに LM Studio の応答をディスクに保存する。
+下流の処理（音声合成・動画書き出し・アップロード）で失敗して同じ論文・同じプロンプトで再実行したとき、台本を作り直さない。
+"""
+import os
+from dotenv import load_dotenv
+
+from disk_cache import DiskCache, make_key
+
+load_dotenv()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+# 1 にするとキャッシュを読まずに生成し直す（結果は保存する）
+LLM_CACHE_REFRESH = os.getenv("LLM_CACHE_REFRESH", "0") == "1"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "llm_cache")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "50"))
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "72"))
+
+CACHE = DiskCache(
+    LLM_CACHE_DIR,
+    int(LLM_CACHE_MAX_MB * 1024 * 1024),
+    suffix=".txt",
+    ttl=LLM_CACHE_TTL_HOURS * 3600 if LLM_CACHE_TTL_HOURS > 0 else None
+)
+
+
+def completion_key(model, messages, temperature, max_tokens, seed=None, **extra):
+    """
+    extra には response_format など、同じプロンプトでも応答が変わるパラメータを渡す
+    """
+    return make_key(model, messages, temperature, max_tokens, seed, extra)
+
+
+def lookup(key):
+    """
+    キャッシュ済みの応答本文を返す
+    """
+    if not LLM_CACHE_ENABLED or LLM_CACHE_REFRESH:
+        return None
+    data = CACHE.get_bytes(key)
+    return data.decode("utf-8") if data is not None else None
+
+
+def store(key, content):
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        return CACHE.put_bytes(key, content.encode("utf-8"))
+    except Exception as e:
+        print(f"Warning: Could not store LLM response in cache: {e}")
+        return None
+
+
+def report():
+    """
+    このプロセスでのヒット率を表示する
+    """
+    if not LLM_CACHE_ENABLED:
+        return
+    stats = CACHE.stats()
+    lookups = stats["hits"] + stats["misses"]
+    if lookups:
+        print(f"LLM cache: {stats['hits']}/{lookups} hits ({stats['hit_rate']:.0%})")
@@ -0,0 +1,579 @@
+"""
+LLM Client
+LM Studio（OpenAI 互換 API）への共通クライアント。
+HTTP の接続を使い回し、モデル名の解決結果は一定時間キャッシュする。
+タイムアウトとリトライ、応答からの JSON の取り出しもここでまとめて扱う。
+応答はストリーミングで受け取り、JSON が閉じた時点で打ち切る。同じ文の繰り返しに入ったら中断して再試行する。
+台本の JSON は response_format の JSON スキーマで形を指定し、それでも崩れた JSON は読める形に直してから使う。
+"""
+import os
+import json
+import math
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+import llm_cache
+import token_budget
+
+load_dotenv()
+
+LM_STUDIO_BASE_URL = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1").rstrip("/")
+API_KEY = os.getenv("LM_STUDIO_API_KEY", "lm-studio")
+DEFAULT_MODEL = "openai/gpt-oss-20b"
+# /models の結果を使い回す秒数（LM Studio でモデルを切り替えたときはこの時間内に反映される）
+LLM_MODEL_TTL = float(os.getenv("LLM_MODEL_TTL", "300"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "2"))
+# 同時に張る接続の上限（並列にリクエストするときのスロット数以上にする）
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "8"))
+
+# ストリーミングで受け取る（0 にすると応答全体を待つ）
+LLM_STREAM = os.getenv("LLM_STREAM", "1") != "0"
+# 同じ文字列がこの文字数以上、周期的に繰り返されたら生成が暴走しているとみなす
+LLM_REPEAT_MIN_CHARS = int(os.getenv("LLM_REPEAT_MIN_CHARS", "240"))
+LLM_REPEAT_CHECK_INTERVAL = 200
+
+# response_format (json_schema) で出力の形を強制する（0 にするとプロンプトの指示だけに頼る）
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") != "0"
+
+# リトライしても意味がない（リクエスト自体が誤っている）ステータス
+NON_RETRYABLE_STATUS = {400, 401, 403, 404, 422}
+
+
+class LLMError(Exception):
+    """
+    リトライしても応答を得られなかった。最後の応答本文があれば content に入る
+    """
+    def __init__(self, message, content=None):
+        super().__init__(message)
+        self.content = content
+
+
+class RepetitionError(LLMError):
+    """
+    生成が同じ文字列の繰り返しに入ったので中断した
+    """
+
+
+class TruncatedError(LLMError):
+    """
+    max_tokens に達して応答が途中で切れた（finish_reason == "length"）
+    """
+
+
+class InvalidReplyError(LLMError):
+    """
+    JSON としては読めたが、chat_json の valid を満たさなかった（台詞が空など）
+    """
+
+
+class JSONStreamScanner:
+    """
+    ストリームの文字を順に読み、最初のトップレベルの JSON（{...} または [...]）が閉じた位置を見つける
+    """
+    def __init__(self, array=False):
+        self.open_char, self.close_char = ("[", "]") if array else ("{", "}")
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.position = 0
+        self.end = None
+
+    def feed(self, text):
+        """
+        これまでに受け取った全文を渡す。JSON が閉じていれば終端の位置（閉じ括弧の次）を返す
+        """
+        if self.end is not None:
+            return self.end
+        for i in range(self.position, len(text)):
+            ch = text[i]
+            if self.depth == 0:
+                if ch == self.open_char:
+                    self.depth = 1
+                continue
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = i + 1
+                    return self.end
+        self.position = len(text)
+        return None
+
+
+def find_repetition(text, min_chars=None, min_period=8, max_period=400):
+    """
+    末尾が同じ文字列の繰り返しになっていれば (周期, 回数) を返す
+    """
+    min_chars = min_chars or LLM_REPEAT_MIN_CHARS
+    if len(text) < min_chars:
+        return None
+    probe = text[-min_period:]
+    search_end = len(text) - 1
+    lower = max(0, len(text) - max_period - min_period)
+    while True:
+        idx = text.rfind(probe, lower, search_end)
+        if idx == -1:
+            return None
+        period = len(text) - min_period - idx
+        # 周期が min_chars の半分より長い段落のループも、2回の繰り返しで検出する
+        repeats = max(2, math.ceil(min_chars / period))
+        if repeats >= 2 and period * repeats <= len(text):
+            unit = text[-period:]
+            if text[-period * repeats:] == unit * repeats:
+                return period, repeats
+        search_end = idx + min_period - 1
+
+
+DIALOGUE_LINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "speaker": {"type": "string"},
+        "text": {"type": "string"}
+    },
+    "required": ["speaker", "text"],
+    "additionalProperties": False
+}
+
+
+def dialogue_schema(*list_fields, title=True):
+    """
+    台本の JSON スキーマ。list_fields は台詞のリストを入れるキー（省略時は "dialogue"）
+    """
+    properties = {"title": {"type": "string"}} if title else {}
+    for name in list_fields or ("dialogue",):
+        properties[name] = {"type": "array", "items": DIALOGUE_LINE_SCHEMA}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+
+def has_dialogue(data, *list_fields):
+    """
+    list_fields（省略時は "dialogue"）のどれにも text のある台詞が1つ以上あるか。chat_json の valid に渡す
+    """
+    if not isinstance(data, dict):
+        return False
+    for name in list_fields or ("dialogue",):
+        lines = data.get(name)
+        if not isinstance(lines, list) or not any(isinstance(line, dict) and line.get("text") for line in lines):
+            return False
+    return True
+
+
+def schema_rejected(response):
+    """
+    400 の理由が response_format（JSON スキーマ）を受け付けないことか。
+    コンテキスト超過など他の理由の 400 では構造化出力を止めない
+    """
+    try:
+        body = response.text.lower()
+    except Exception:
+        return False
+    return "response_format" in body or "json_schema" in body
+
+
+def repair_json(content, array=False, max_cuts=20):
+    """
+    ほぼ正しい JSON を直して読む。
+    直すもの: 文字列中の生の改行、末尾のカンマ、要素間のカンマ漏れ、閉じ括弧の種類の誤り、途中で切れた応答。
+    途中で切れた応答は、最後に完結している要素までを残して括弧を閉じる。直せなければ ValueError
+    """
+    open_char = "[" if array else "{"
+    content = content.replace("```json", "").replace("```", "")
+    start = content.find(open_char)
+    if start == -1:
+        raise ValueError("No JSON value found")
+
+    out = []
+    stack = []
+    # 要素の区切りごとの (そこまでの出力の長さ, その時点で必要な閉じ括弧)
+    cuts = []
+    in_string = False
+    escaped = False
+    # 文字列の外で直前に出力した意味のある文字（数値や true などは "v"）と、その後に空白を挟んだか
+    last = ""
+    gap = False
+    for ch in content[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                last = '"'
+            elif ch in "\n\r\t":
+                ch = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}[ch]
+            out.append(ch)
+            continue
+        if ch.isspace():
+            out.append(ch)
+            gap = True
+            continue
+        after_value = last in ('"', "}") or (last == "v" and gap)
+        gap = False
+        if ch in "}]":
+            if not stack:
+                break
+            while out and (out[-1].isspace() or out[-1] == ","):
+                out.pop()
+            out.append(stack.pop())
+            last = "}"
+            if not stack:
+                break
+            cuts.append((len(out), "".join(reversed(stack))))
+            continue
+        if after_value and ch not in ",:":
+            # 値の直後に次の値が来ている（カンマ漏れ）
+            cuts.append((len(out), "".join(reversed(stack))))
+            out.append(",")
+        if ch == ",":
+            if last in (",", "{", "[", ""):
+                continue
+            cuts.append((len(out), "".join(reversed(stack))))
+            out.append(ch)
+            last = ","
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            last = ch
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch == ":":
+            out.append(ch)
+            last = ":"
+        else:
+            out.append(ch)
+            last = "v"
+
+    text = "".join(out)
+    candidates = []
+    if not stack and not in_string:
+        candidates.append(text)
+    else:
+        # 途中で切れている: 完結している配列の要素までで閉じるのを優先し、最後に全体をそのまま閉じる
+        recent = sorted(reversed(cuts[-max_cuts:]), key=lambda cut: not cut[1].startswith("]"))
+        candidates.extend(text[:length].rstrip().rstrip(",") + closers for length, closers in recent)
+        candidates.append((text + ('"' if in_string else "")).rstrip().rstrip(",") + "".join(reversed(stack)))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    raise ValueError("Could not repair JSON")
+
+
+def extract_json(content, array=False):
+    """
+    応答からコードフェンスを除き、最初の { (array=True なら [) から最後の } (]) までを JSON として読む。
+    読めなければ repair_json で直して読む
+    """
+    open_char, close_char = ("[", "]") if array else ("{", "}")
+    stripped = content.replace("```json", "").replace("```", "").strip()
+    start = stripped.find(open_char)
+    end = stripped.rfind(close_char)
+    if start != -1 and end != -1:
+        stripped = stripped[start:end + 1]
+    try:
+        return json.loads(stripped)
+    except json.JSONDecodeError as e:
+        try:
+            data = repair_json(content, array=array)
+        except ValueError:
+            raise e
+        print("Warning: Repaired malformed JSON in LM Studio response.")
+        return data
+
+
+class LLMClient:
+    def __init__(self, base_url=None, api_key=None, pool_size=None):
+        self.base_url = (base_url or LM_STUDIO_BASE_URL).rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or LLM_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key or API_KEY}"
+        })
+        self._model = None
+        self._model_expires = 0.0
+        self._lock = threading.Lock()
+        # サーバーが受け付けなかったスキーマ（以降は response_format を付けない）
+        self._rejected_schemas = set()
+        self._context_lengths = {}
+
+    def resolve_model(self, refresh=False):
+        """
+        LM_STUDIO_MODEL が無ければ /models から埋め込み用以外の最初のモデルを選ぶ（LLM_MODEL_TTL 秒キャッシュ）
+        """
+        model = os.getenv("LM_STUDIO_MODEL")
+        if model:
+            return model
+
+        with self._lock:
+            if not refresh and self._model and time.time() < self._model_expires:
+                return self._model
+            try:
+                response = self.session.get(f"{self.base_url}/models", timeout=LLM_CONNECT_TIMEOUT)
+                response.raise_for_status()
+                data = response.json().get("data", [])
+                model = next(
+                    (item.get("id") for item in data if item.get("id") and "embed" not in item["id"].lower()),
+                    data[0].get("id") if data else None
+                )
+            except Exception as e:
+                print(f"Warning: Could not fetch LM Studio models: {e}")
+                # 失敗はキャッシュせず、次の呼び出しで問い合わせ直す
+                return DEFAULT_MODEL
+            self._model = model or DEFAULT_MODEL
+            self._model_expires = time.time() + LLM_MODEL_TTL
+            return self._model
+
+    def context_length(self, model=None):
+        """
+        モデルのコンテキスト長。LLM_CONTEXT_TOKENS が無ければ LM Studio の /api/v0/models から
+        ロード時のコンテキスト長を取る（モデルごとにキャッシュ）。取れなければ token_budget の既定値を使う
+        """
+        if os.getenv("LLM_CONTEXT_TOKENS"):
+            return token_budget.LLM_CONTEXT_TOKENS
+        model = model or self.resolve_model()
+        with self._lock:
+            if model in self._context_lengths:
+                return self._context_lengths[model]
+            root = self.base_url[:-3] if self.base_url.endswith("/v1") else self.base_url
+            length = None
+            try:
+                response = self.session.get(f"{root}/api/v0/models/{model}", timeout=LLM_CONNECT_TIMEOUT)
+                response.raise_for_status()
+                info = response.json()
+                length = info.get("loaded_context_length") or info.get("max_context_length")
+            except Exception as e:
+                print(f"Warning: Could not fetch context length for {model}: {e}")
+            if not length:
+                return token_budget.LLM_CONTEXT_TOKENS
+            self._context_lengths[model] = int(length)
+            return self._context_lengths[model]
+
+    def complete(self, messages, temperature=0.7, max_tokens=2000, timeout=600, model=None, stream=None, json_root=None, **extra):
+        """
+        1回だけリクエストして応答本文を返す。
+        json_root に "{" か "[" を指定すると、トップレベルの JSON が閉じた時点で生成を打ち切る
+        """
+        stream = LLM_STREAM if stream is None else stream
+        payload = {
+            "model": model or self.resolve_model(),
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+            **extra
+        }
+        response = self.session.post(
+            f"{self.base_url}/chat/completions",
+            json=payload,
+            timeout=(LLM_CONNECT_TIMEOUT, timeout),
+            stream=stream
+        )
+        if response.status_code == 400 and "response_format" in payload and schema_rejected(response):
+            # 構造化出力に対応していないモデル・バージョンでは指定せずに送り直す
+            name = payload["response_format"].get("json_schema", {}).get("name")
+            print(f"Warning: LM Studio rejected the JSON schema ({name}); retrying without structured output.")
+            response.close()
+            self._rejected_schemas.add(name)
+            extra = {k: v for k, v in extra.items() if k != "response_format"}
+            return self.complete(messages, temperature, max_tokens, timeout, model, stream, json_root, **extra)
+        response.raise_for_status()
+        if not stream or "text/event-stream" not in response.headers.get("Content-Type", ""):
+            choice = response.json()["choices"][0]
+            content = choice["message"]["content"]
+            if choice.get("finish_reason") == "length":
+                raise TruncatedError(f"Response reached max_tokens ({max_tokens})", content=content)
+            return content
+        with response:
+            return self._read_stream(response, timeout, json_root, max_tokens)
+
+    def _read_stream(self, response, timeout, json_root=None, max_tokens=None):
+        """
+        Server-Sent Events を読み、JSON が閉じたら接続を切って生成を止める（LM Studio は切断で生成を中止する）
+        """
+        deadline = time.time() + timeout
+        scanner = JSONStreamScanner(array=json_root == "[") if json_root else None
+        texts = {"content": "", "reasoning": ""}
+        next_check = {"content": LLM_REPEAT_CHECK_INTERVAL, "reasoning": LLM_REPEAT_CHECK_INTERVAL}
+        for line in response.iter_lines():
+            if time.time() > deadline:
+                raise requests.Timeout(f"Streaming response exceeded {timeout} s")
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            choice = json.loads(data)["choices"][0]
+            delta = choice.get("delta") or {}
+            # gpt-oss などの推論モデルは思考の部分を reasoning_content（または reasoning）で返す
+            for field, key in (("content", "content"), ("reasoning", "reasoning_content"), ("reasoning", "reasoning")):
+                piece = delta.get(key)
+                if not piece:
+                    continue
+                texts[field] += piece
+                if len(texts[field]) >= next_check[field]:
+                    next_check[field] = len(texts[field]) + LLM_REPEAT_CHECK_INTERVAL
+                    repetition = find_repetition(texts[field])
+                    if repetition:
+                        period, repeats = repetition
+                        print(f"Warning: Stopped generation in a repetition loop ({field}, {period} chars x {repeats}).")
+                        raise RepetitionError(f"Repetition detected in {field}", content=texts[field][-500:])
+            if scanner and delta.get("content"):
+                end = scanner.feed(texts["content"])
+                if end is not None:
+                    return texts["content"][:end]
+            if choice.get("finish_reason") == "length":
+                raise TruncatedError(f"Response reached max_tokens ({max_tokens})", content=texts["content"])
+            if choice.get("finish_reason"):
+                break
+        return texts["content"]
+
+    def _with_retries(self, attempt_fn, retries):
+        retries = max(1, retries or LLM_RETRIES)
+        content = None
+        for attempt in range(retries):
+            content = None
+            try:
+                if retries > 1:
+                    print(f"Attempt {attempt + 1}/{retries}...")
+                return attempt_fn()
+            except json.JSONDecodeError as e:
+                print("Error: LM Studio response was not valid JSON.")
+                content = e.doc
+                error = e
+            except requests.HTTPError as e:
+                print(f"Error communicating with LM Studio: {e}")
+                error = e
+                if e.response is not None and e.response.status_code in NON_RETRYABLE_STATUS:
+                    break
+            except RepetitionError as e:
+                content = e.content
+                error = e
+            except (TruncatedError, InvalidReplyError) as e:
+                # 途中で切れた応答や中身の無い応答は使わず、キャッシュにも入れない
+                print(f"Error: {e}")
+                content = e.content
+                error = e
+            except (requests.RequestException, KeyError, IndexError, ValueError) as e:
+                print(f"Error communicating with LM Studio: {e}")
+                error = e
+            if attempt < retries - 1:
+                print("Retrying...")
+                time.sleep(LLM_RETRY_BACKOFF * (attempt + 1))
+        raise LLMError(str(error), content=content)
+
+    def chat(self, messages, temperature=0.7, max_tokens=2000, timeout=600, model=None, retries=None, cache=True, **extra):
+        """
+        応答本文を返す。通信エラーは retries 回まで再試行し、それでも失敗したら LLMError。
+        cache=False ならキャッシュを使わない
+        """
+        model = model or self.resolve_model()
+        key = llm_cache.completion_key(model, messages, temperature, max_tokens, kind="text", **extra) if cache else None
+        cached = llm_cache.lookup(key) if key else None
+        if cached is not None:
+            return cached
+        content = self._with_retries(
+            lambda: self.complete(messages, temperature, max_tokens, timeout, model, **extra),
+            retries
+        )
+        if key:
+            llm_cache.store(key, content)
+        return content
+
+    def chat_json(self, messages, temperature=0.7, max_tokens=2000, timeout=600, model=None, retries=None, array=False, cache=True,
+                  schema=None, schema_name="script", valid=None, **extra):
+        """
+        応答を JSON として読んで返す。JSON として読めない応答も再試行の対象にする。
+        schema を渡すと response_format で出力の形を指定する。
+        キャッシュには JSON として読めた応答だけを保存する。
+        valid を渡すと、valid(data) が偽の応答も再試行の対象にし、保存・再利用もしない
+        """
+        model = model or self.resolve_model()
+        if schema and LLM_STRUCTURED_OUTPUT and schema_name not in self._rejected_schemas:
+            extra["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "strict": True, "schema": schema}
+            }
+        json_root = "[" if array else "{"
+        key = llm_cache.completion_key(model, messages, temperature, max_tokens, kind=json_root, **extra) if cache else None
+        cached = llm_cache.lookup(key) if key else None
+        if cached is not None:
+            try:
+                data = extract_json(cached, array=array)
+                if valid is None or valid(data):
+                    return data
+            except ValueError:
+                pass
+
+        def attempt():
+            content = self.complete(messages, temperature, max_tokens, timeout, model, json_root=json_root, **extra)
+            data = extract_json(content, array=array)
+            if valid is not None and not valid(data):
+                raise InvalidReplyError("Reply did not contain the expected content", content=content)
+            return content, data
+
+        content, data = self._with_retries(attempt, retries)
+        if key:
+            llm_cache.store(key, content)
+        return data
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client():
+    """
+    プロセス内で共有するクライアント
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = LLMClient()
+        return _CLIENT
+
+
+def resolve_model():
+    return get_client().resolve_model()
+
+
+def context_length(model=None):
+    return get_client().context_length(model)
+
+
+def chat(messages, **kwargs):
+    return get_client().chat(messages, **kwargs)
+
+
+def chat_json(messages, **kwargs):
+    return get_client().chat_json(messages, **kwargs)
+
+
+def report_cache():
+    llm_cache.report()
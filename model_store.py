@@ -0,0 +1,312 @@
+"""
+Model Store
+simple_image_gen（diffusers）と ComfyUI で共有するローカルのモデル置き場。
+ファイルは内容の sha256 をキーに blobs/ へ一度だけ置き、diffusers 用のスナップショットや
+ComfyUI の models/checkpoints にはハードリンク（使えなければ reflink、最後にコピー）で配置する。
+チェックサムは取り込み時に一度だけ検証し、以降はサイズと更新時刻が変わっていないことだけを確認する。
+
+Usage:
+  # diffusers 形式のスナップショットを取り込む（ネットワークを使うのはこのときだけ）
+  python model_store.py fetch runwayml/stable-diffusion-v1-5
+  # 単一ファイルのチェックポイントを取り込んで ComfyUI に配置する
+  python model_store.py fetch runwayml/stable-diffusion-v1-5 --file v1-5-pruned-emaonly.safetensors --link-to ComfyUI/models/checkpoints
+  python model_store.py list
+  python model_store.py verify --full
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR", os.path.join("models", "store"))
+# 1 にするとストアに無いモデルも Hugging Face Hub へ問い合わせず、ローカルのキャッシュだけを使う
+MODEL_OFFLINE = os.getenv("MODEL_OFFLINE", "0") == "1"
+
+# diffusers のスナップショットとして取り込むファイル（重複する ckpt / fp16 / non-ema などは除く）
+SNAPSHOT_ALLOW_PATTERNS = ["*.json", "*.txt", "*.safetensors"]
+SNAPSHOT_IGNORE_PATTERNS = ["*.fp16.*", "*non_ema*", "*.ckpt", "*.bin", "*.msgpack", "*.onnx", "v1-5-pruned*"]
+
+_MANIFEST_LOCK = threading.Lock()
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def file_sha256(path, block_size=8 * 1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def _reflink(src, dst):
+    """
+    コピーオンライトの複製（Linux の btrfs / XFS、macOS の APFS）
+    """
+    if sys.platform == "darwin":
+        subprocess.run(["cp", "-c", src, dst], check=True, capture_output=True)
+        return
+    import fcntl
+    FICLONE = 0x40049409
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def link_file(src, dst):
+    """
+    src を dst に配置する。ハードリンク → reflink → コピーの順に試し、使った方法を返す
+    """
+    # Hub のスナップショットはシンボリックリンクなので、リンク先の実体を配置する
+    src = os.path.realpath(src)
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return "existing"
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return "reflink"
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+class ModelStore:
+    def __init__(self, root=None):
+        self.root = root or MODEL_STORE_DIR
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+        self._manifest = None
+
+    # --- manifest ---
+
+    def manifest(self):
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+            self._manifest.setdefault("blobs", {})
+            self._manifest.setdefault("snapshots", {})
+            self._manifest.setdefault("files", {})
+        return self._manifest
+
+    def save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.manifest(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    # --- blobs ---
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def add_blob(self, src, expected_sha256=None):
+        """
+        ファイルを内容のハッシュで取り込む（ハッシュは取り込み時に一度だけ計算する）
+        """
+        digest = file_sha256(src)
+        if expected_sha256 and digest != expected_sha256:
+            raise ValueError(f"Checksum mismatch for {src}: expected {expected_sha256}, got {digest}")
+        path = self.blob_path(digest)
+        method = "existing" if os.path.exists(path) else link_file(src, path)
+        st = os.stat(path)
+        with _MANIFEST_LOCK:
+            self.manifest()["blobs"][digest] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        return digest, method
+
+    def blob_ok(self, digest, full=False):
+        """
+        検証済みの blob が変わっていないか確認する。full=True ならハッシュを計算し直す
+        """
+        path = self.blob_path(digest)
+        record = self.manifest()["blobs"].get(digest)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if not record or st.st_size != record["size"]:
+            return False
+        if full or st.st_mtime_ns != record["mtime_ns"]:
+            if file_sha256(path) != digest:
+                return False
+            if st.st_mtime_ns != record["mtime_ns"]:
+                with _MANIFEST_LOCK:
+                    record["mtime_ns"] = st.st_mtime_ns
+                # 次の起動でハッシュを計算し直さないよう、確認した mtime をすぐに保存する
+                self.save_manifest()
+        return True
+
+    # --- snapshots (diffusers 形式のディレクトリ) ---
+
+    def snapshot_dir(self, model_id):
+        return os.path.join(self.root, "snapshots", model_id.replace("/", "--"))
+
+    def add_snapshot(self, model_id, source_dir, revision=None):
+        """
+        ディレクトリ内のファイルを blob として取り込み、スナップショットをハードリンクで組み立てる
+        """
+        files = {}
+        methods = {}
+        target_dir = self.snapshot_dir(model_id)
+        for root, _, names in os.walk(source_dir):
+            for name in sorted(names):
+                src = os.path.join(root, name)
+                rel = os.path.relpath(src, source_dir).replace(os.sep, "/")
+                digest, method = self.add_blob(src, expected_sha256=hub_blob_sha256(src))
+                link_file(self.blob_path(digest), os.path.join(target_dir, rel))
+                files[rel] = digest
+                methods[method] = methods.get(method, 0) + 1
+        with _MANIFEST_LOCK:
+            self.manifest()["snapshots"][model_id] = {"revision": revision, "files": files}
+        self.save_manifest()
+        print(f"Stored {model_id}: {len(files)} files ({', '.join(f'{k}: {v}' for k, v in sorted(methods.items()))})")
+        return target_dir
+
+    def add_file(self, model_id, filename, src):
+        digest, method = self.add_blob(src, expected_sha256=hub_blob_sha256(src))
+        with _MANIFEST_LOCK:
+            self.manifest()["files"][f"{model_id}/{filename}"] = digest
+        self.save_manifest()
+        print(f"Stored {model_id}/{filename} ({method})")
+        return self.blob_path(digest)
+
+    def snapshot_path(self, model_id, full=False):
+        """
+        検証済みのスナップショットがあればそのディレクトリを返す
+        """
+        entry = self.manifest()["snapshots"].get(model_id)
+        if not entry:
+            return None
+        target_dir = self.snapshot_dir(model_id)
+        for rel, digest in entry["files"].items():
+            if not self.blob_ok(digest, full=full) or not os.path.exists(os.path.join(target_dir, rel)):
+                return None
+        return target_dir
+
+    def file_path(self, model_id, filename, full=False):
+        digest = self.manifest()["files"].get(f"{model_id}/{filename}")
+        if digest and self.blob_ok(digest, full=full):
+            return self.blob_path(digest)
+        return None
+
+    def verify(self, full=False):
+        """
+        すべての blob を確認し、壊れている blob のハッシュのリストを返す
+        """
+        broken = [digest for digest in self.manifest()["blobs"] if not self.blob_ok(digest, full=full)]
+        self.save_manifest()
+        return broken
+
+
+def hub_blob_sha256(path):
+    """
+    Hugging Face のキャッシュでは LFS のファイルが blobs/<sha256> に置かれるので、
+    リンク先のファイル名を公開されているチェックサムとして使う
+    """
+    name = os.path.basename(os.path.realpath(path))
+    return name if _SHA256_RE.match(name) else None
+
+
+def resolve_model(model_id, store=None):
+    """
+    ストアに検証済みのスナップショットがあればそのパスを返す。無ければ model_id をそのまま返す
+    """
+    if os.path.isdir(model_id):
+        return model_id
+    return (store or ModelStore()).snapshot_path(model_id) or model_id
+
+
+def fetch_snapshot(model_id, revision=None, store=None):
+    from huggingface_hub import snapshot_download
+
+    store = store or ModelStore()
+    print(f"Downloading {model_id} (diffusers snapshot)...")
+    source_dir = snapshot_download(
+        model_id,
+        revision=revision,
+        allow_patterns=SNAPSHOT_ALLOW_PATTERNS,
+        ignore_patterns=SNAPSHOT_IGNORE_PATTERNS
+    )
+    return store.add_snapshot(model_id, source_dir, revision=revision)
+
+
+def fetch_file(model_id, filename, link_to=None, revision=None, store=None):
+    from huggingface_hub import hf_hub_download
+
+    store = store or ModelStore()
+    path = store.file_path(model_id, filename)
+    if not path:
+        print(f"Downloading {filename} from {model_id}...")
+        path = store.add_file(model_id, filename, hf_hub_download(repo_id=model_id, filename=filename, revision=revision))
+    if link_to:
+        target = os.path.join(link_to, filename)
+        method = link_file(path, target)
+        print(f"Linked {target} ({method})")
+        return target
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local content-addressed model store")
+    parser.add_argument("--root", type=str, default=MODEL_STORE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fetch_parser = subparsers.add_parser("fetch", help="Hugging Face Hub から取り込む")
+    fetch_parser.add_argument("model_id")
+    fetch_parser.add_argument("--file", type=str, default=None, help="単一ファイルだけを取り込む")
+    fetch_parser.add_argument("--link-to", type=str, default=None, help="取り込んだファイルを配置するディレクトリ")
+    fetch_parser.add_argument("--revision", type=str, default=None)
+
+    subparsers.add_parser("list", help="取り込み済みのモデルを表示する")
+
+    verify_parser = subparsers.add_parser("verify", help="blob が変わっていないか確認する")
+    verify_parser.add_argument("--full", action="store_true", help="ハッシュを計算し直す")
+
+    args = parser.parse_args()
+    store = ModelStore(args.root)
+
+    if args.command == "fetch":
+        if args.file:
+            fetch_file(args.model_id, args.file, args.link_to, args.revision, store)
+        else:
+            fetch_snapshot(args.model_id, args.revision, store)
+    elif args.command == "list":
+        manifest = store.manifest()
+        blobs = manifest["blobs"]
+        for model_id, entry in manifest["snapshots"].items():
+            size = sum(blobs.get(d, {}).get("size", 0) for d in entry["files"].values())
+            print(f"{model_id}  {len(entry['files'])} files  {size / 1024 ** 3:.2f} GB  {store.snapshot_dir(model_id)}")
+        for name, digest in manifest["files"].items():
+            print(f"{name}  {blobs.get(digest, {}).get('size', 0) / 1024 ** 3:.2f} GB  {store.blob_path(digest)}")
+    elif args.command == "verify":
+        broken = store.verify(full=args.full)
+        if broken:
+            print(f"Broken blobs: {', '.join(broken)}")
+            sys.exit(1)
+        print(f"All {len(store.manifest()['blobs'])} blobs OK")
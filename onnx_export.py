@@ -0,0 +1,104 @@
+"""
+ONNX Export
+サムネイル生成用の Stable Diffusion を ONNX に書き出し、必要なら int8 に量子化する。
+ローカルにキャッシュ済みの重みだけを使うので、オフラインで実行できる。
+
+Usage:
+  # ONNX (fp32) に書き出し
+  python onnx_export.py export --output models/sd15_onnx
+  # UNet と text encoder を int8 に動的量子化
+  python onnx_export.py quantize --input models/sd15_onnx --output models/sd15_onnx_int8
+
+  THUMBNAIL_BACKEND=onnx THUMBNAIL_ONNX_DIR=models/sd15_onnx_int8 python main.py
+"""
+import os
+import shutil
+import argparse
+
+from simple_image_gen import SD_MODEL_ID
+
+# VAE は量子化すると色が崩れやすいので、既定では UNet と text encoder だけを量子化する
+DEFAULT_QUANTIZE_COMPONENTS = ["unet", "text_encoder"]
+
+
+def export_onnx(model_id, output_dir):
+    """
+    キャッシュ済みの diffusers の重みから ONNX モデルを書き出す
+    """
+    # Hugging Face Hub へは問い合わせない
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+    from optimum.exporters.onnx import main_export
+    from model_store import resolve_model
+
+    print(f"Exporting {model_id} to {output_dir} ...")
+    main_export(
+        model_name_or_path=resolve_model(model_id),
+        output=output_dir,
+        task="text-to-image",
+        local_files_only=True
+    )
+    print(f"Exported ONNX model to {output_dir}")
+    return output_dir
+
+
+def quantize_onnx(input_dir, output_dir, components=None):
+    """
+    書き出した ONNX モデルの各コンポーネントを int8 に動的量子化する。
+    量子化しないコンポーネントと設定ファイルはそのままコピーする。
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    components = components or DEFAULT_QUANTIZE_COMPONENTS
+    if os.path.abspath(input_dir) == os.path.abspath(output_dir):
+        raise ValueError("output_dir must differ from input_dir")
+
+    def ignore(directory, names):
+        # 量子化するコンポーネントの元モデル（外部データを含む）はコピーしない
+        if os.path.basename(directory) in components:
+            return [n for n in names if n.startswith("model.onnx")]
+        return []
+
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    shutil.copytree(input_dir, output_dir, ignore=ignore)
+
+    for name in components:
+        src = os.path.join(input_dir, name, "model.onnx")
+        if not os.path.exists(src):
+            print(f"Warning: {src} not found, skipping")
+            continue
+        dst_dir = os.path.join(output_dir, name)
+        os.makedirs(dst_dir, exist_ok=True)
+
+        print(f"Quantizing {name} ...")
+        # UNet は 2GB を超えるので外部データ形式で保存する
+        quantize_dynamic(
+            src,
+            os.path.join(dst_dir, "model.onnx"),
+            weight_type=QuantType.QInt8,
+            use_external_data_format=(name == "unet")
+        )
+
+    print(f"Quantized ONNX model saved to {output_dir}")
+    return output_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export / quantize the thumbnail model for ONNX Runtime")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the cached diffusers weights to ONNX")
+    export_parser.add_argument("--model", type=str, default=SD_MODEL_ID)
+    export_parser.add_argument("--output", type=str, default=os.path.join("models", "sd15_onnx"))
+
+    quantize_parser = subparsers.add_parser("quantize", help="Quantize an exported ONNX model to int8")
+    quantize_parser.add_argument("--input", type=str, default=os.path.join("models", "sd15_onnx"))
+    quantize_parser.add_argument("--output", type=str, default=os.path.join("models", "sd15_onnx_int8"))
+    quantize_parser.add_argument("--components", type=str, default=",".join(DEFAULT_QUANTIZE_COMPONENTS))
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_onnx(args.model, args.output)
+    else:
+        quantize_onnx(args.input, args.output, [c.strip() for c in args.components.split(",") if c.strip()])
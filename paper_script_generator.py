@@ -3,23 +3,37 @@
 複数の論文を紹介するPodcast形式の台本を生成
 """
 import os
-import requests
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from lm_studio_utils import ensure_lm_studio_ready
+from llm_client import LLMError, chat_json, context_length, dialogue_schema, has_dialogue, report_cache, resolve_model
+from token_budget import (
+    LLM_REASONING_TOKENS, allocate, count_message_tokens, count_tokens, lines_for_minutes, output_tokens_for_lines,
+    truncate_to_tokens
+)
 
 load_dotenv()
 
-LM_STUDIO_URL = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1") + "/chat/completions"
-API_KEY = os.getenv("LM_STUDIO_API_KEY", "lm-studio")
-DEFAULT_MODEL = "openai/gpt-oss-20b"
-SUMMARY_MAX_CHARS = int(os.getenv("PAPER_SUMMARY_MAX_CHARS", "1200"))
+# 論文1本の要約に使うトークンの上限（コンテキストが足りなければさらに短くする）
+PAPER_SUMMARY_MAX_TOKENS = int(os.getenv("PAPER_SUMMARY_MAX_TOKENS", "400"))
+PAPER_SUMMARY_MIN_TOKENS = 150
 DIALOGUE_MAX_CHARS = int(os.getenv("PAPER_DIALOGUE_MAX_CHARS", "420"))
 LM_STUDIO_TIMEOUT = int(os.getenv("LM_STUDIO_TIMEOUT", "240"))
 LM_STUDIO_REWRITE_TIMEOUT = int(os.getenv("LM_STUDIO_REWRITE_TIMEOUT", "180"))
 LM_STUDIO_REWRITE_BATCH_SIZE = int(os.getenv("LM_STUDIO_REWRITE_BATCH_SIZE", "5"))
-LM_STUDIO_MAX_TOKENS = int(os.getenv("LM_STUDIO_MAX_TOKENS", "3200"))
+# 同時に送る書き換えバッチの数（LM Studio の同時推論数に合わせる）
+LM_STUDIO_REWRITE_CONCURRENCY = int(os.getenv("LM_STUDIO_REWRITE_CONCURRENCY", "4"))
+# "single": 全ての論文を1回のリクエストで台本にする / "parallel": 論文ごとの紹介パートを並列に生成して繋ぐ
+PAPER_SCRIPT_MODE = os.getenv("PAPER_SCRIPT_MODE", "single")
+PAPER_SECTION_CONCURRENCY = int(os.getenv("PAPER_SECTION_CONCURRENCY", str(LM_STUDIO_REWRITE_CONCURRENCY)))
+# 台詞の無い応答が続いたときに、キャッシュを使わずに生成し直す回数（1回あたり LLM_RETRIES 回まで再試行する）
+PAPER_SCRIPT_ATTEMPTS = int(os.getenv("PAPER_SCRIPT_ATTEMPTS", "2"))
+# 出力の max_tokens の上限（max_tokens 自体は台本の目標の長さから決める）
+LM_STUDIO_MAX_TOKENS = int(os.getenv("LM_STUDIO_MAX_TOKENS", "8000"))
+# オープニングとエンディングの発話数
+FRAME_LINES = 10
 DEFAULT_SPEAKER_NAME = os.getenv("VOICEVOX_SPEAKER_NAME", "青山龍星")
 CJK_RANGE = r"\u3040-\u30ff\u3400-\u9fff"
 SPACE_BETWEEN_CJK = re.compile(rf"(?<=[{CJK_RANGE}0-9])\s+(?=[{CJK_RANGE}0-9])")
@@ -29,7 +43,21 @@ SENTENCE_SPLIT_RE = re.compile(r"(?<=[。！？!?])")
 SOFT_BREAK_CHARS = ["、", "，", ",", "・", "／", "/", " ", "　", "；", ";", ":", "："]
 ASCII_LETTER_RE = re.compile(r"[A-Za-z]")
 SKIP_TAG_RE = re.compile(r"<skip>.*?</skip>", flags=re.DOTALL)
-ENGLISH_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9+\\-./]*")
+ENGLISH_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9+\-./]*")
+# 「深層学習（Deep Learning）」のように日本語の後ろに括弧書きされた英語
+PARENTHESIZED_ENGLISH_RE = re.compile(rf"(?<=[{CJK_RANGE}])（([^（）{CJK_RANGE}<>]*[A-Za-z][^（）{CJK_RANGE}<>]*)）")
+REWRITE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "index": {"type": "integer"},
+            "text": {"type": "string"}
+        },
+        "required": ["index", "text"],
+        "additionalProperties": False
+    }
+}
 
 ABBREVIATION_READINGS = [
     ("fMRI", "エフエムアールアイ"),
@@ -65,35 +93,11 @@ ABBREVIATION_PATTERNS = [
 ]
 
 
-def resolve_model():
-    model = os.getenv("LM_STUDIO_MODEL")
-    if model:
-        return model
-
-    base_url = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1")
-    try:
-        response = requests.get(f"{base_url}/models", timeout=10)
-        response.raise_for_status()
-        data = response.json().get("data", [])
-        for item in data:
-            model_id = item.get("id")
-            if model_id and "embed" not in model_id.lower():
-                return model_id
-        if data:
-            return data[0].get("id")
-    except Exception as e:
-        print(f"Warning: Could not fetch LM Studio models: {e}")
-
-    return DEFAULT_MODEL
-
-
-def normalize_summary(summary):
+def normalize_summary(summary, max_tokens=PAPER_SUMMARY_MAX_TOKENS):
     cleaned = " ".join((summary or "").split())
     if not cleaned:
         return "要約なし"
-    if len(cleaned) > SUMMARY_MAX_CHARS:
-        return cleaned[:SUMMARY_MAX_CHARS] + "..."
-    return cleaned
+    return truncate_to_tokens(cleaned, max_tokens)
 
 
 def normalize_dialogue_text(text):
@@ -240,20 +244,14 @@ def split_dialogue_lines(dialogue, max_chars):
     return split_lines
 
 
-def rewrite_english_dialogue(dialogue):
-    targets = []
-    for idx, line in enumerate(dialogue):
-        text = line.get("text", "")
-        text = apply_abbreviation_readings(text)
-        dialogue[idx]["text"] = text
-        text_no_skip = SKIP_TAG_RE.sub("", text)
-        if ASCII_LETTER_RE.search(text_no_skip):
-            targets.append({"index": idx, "text": text})
+def wrap_parenthesized_english(text):
+    """
+    日本語の後ろの括弧書きの英語は読み上げないよう <skip> で囲む（LLM で書き換えなくてよい）
+    """
+    return replace_outside_skip(text, lambda s: PARENTHESIZED_ENGLISH_RE.sub(r"（<skip>\1</skip>）", s))
 
-    if not targets:
-        return dialogue
 
-    system_prompt = """
+REWRITE_SYSTEM_PROMPT = """
 あなたは日本語の編集者です。
 以下の台詞に含まれる英語・英字略語を、必ず日本語に言い換え、原文英語は <skip>English</skip> で後置してください。
 表示上は括弧書きにしたい場合、例のようにします: 〇〇（<skip>Original English</skip>）
@@ -261,59 +259,94 @@ def rewrite_english_dialogue(dialogue):
 略語はカタカナ読み＋英字を <skip> </skip> で併記してください（例: イーイージー（<skip>EEG</skip>））。
 """
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-    model = resolve_model()
 
-    batch_size = max(1, LM_STUDIO_REWRITE_BATCH_SIZE)
-    for start in range(0, len(targets), batch_size):
-        batch = targets[start:start + batch_size]
-        payload_json = json.dumps(batch, ensure_ascii=False)
-        user_prompt = f"""次の台詞をルールに沿って書き換えてください。
+def rewrite_batch(batch, model):
+    """
+    1バッチ分を書き換え、{index: 書き換え後の台詞} を返す
+    """
+    payload_json = json.dumps(batch, ensure_ascii=False)
+    user_prompt = f"""次の台詞をルールに沿って書き換えてください。
 JSON配列で返し、各要素は {{"index": 数字, "text": "修正後の台詞"}} の形式にしてください。
 並び順は入力と同じにしてください。
 
 対象台詞:
 {payload_json}
 """
+    rewritten = chat_json(
+        [
+            {"role": "system", "content": REWRITE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.2,
+        # カタカナへの書き換えで長くなる分を見込む
+        max_tokens=2 * count_tokens(payload_json) + LLM_REASONING_TOKENS,
+        timeout=LM_STUDIO_REWRITE_TIMEOUT,
+        model=model,
+        retries=1,
+        array=True,
+        schema=REWRITE_SCHEMA,
+        schema_name="english_rewrite"
+    )
+    expected = {item["index"] for item in batch}
+    results = {}
+    if isinstance(rewritten, list):
+        for item in rewritten:
+            if not isinstance(item, dict):
+                continue
+            idx = item.get("index")
+            text = item.get("text")
+            if idx in expected and isinstance(text, str):
+                results[idx] = normalize_dialogue_text(text)
+    return results
 
-        payload = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.2,
-            "max_tokens": 1200,
-            "stream": False
-        }
 
-        try:
-            response = requests.post(
-                LM_STUDIO_URL,
-                headers=headers,
-                json=payload,
-                timeout=LM_STUDIO_REWRITE_TIMEOUT
-            )
-            response.raise_for_status()
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            content = content.replace("```json", "").replace("```", "").strip()
-            start_idx = content.find('[')
-            end_idx = content.rfind(']')
-            if start_idx != -1 and end_idx != -1:
-                content = content[start_idx:end_idx + 1]
-            rewritten = json.loads(content)
-            if isinstance(rewritten, list):
-                for item in rewritten:
-                    idx = item.get("index")
-                    text = item.get("text")
-                    if isinstance(idx, int) and 0 <= idx < len(dialogue) and isinstance(text, str):
-                        dialogue[idx]["text"] = normalize_dialogue_text(text)
-        except Exception as e:
-            print(f"Warning: Failed to rewrite English dialogue batch: {e}")
+def rewrite_english_dialogue(dialogue):
+    """
+    英語を含む台詞を LLM で日本語に書き換える。
+    同じ台詞は1回だけ送り、バッチは LM_STUDIO_REWRITE_CONCURRENCY 件まで並列に送る。
+    """
+    unique_texts = []
+    line_indices = {}
+    already_japanese = 0
+    for idx, line in enumerate(dialogue):
+        text = line.get("text", "")
+        text = wrap_parenthesized_english(apply_abbreviation_readings(text))
+        dialogue[idx]["text"] = text
+        text_no_skip = SKIP_TAG_RE.sub("", text)
+        if not ASCII_LETTER_RE.search(text_no_skip):
+            if ASCII_LETTER_RE.search(line.get("text", "")):
+                already_japanese += 1
+            continue
+        if text not in line_indices:
+            line_indices[text] = []
+            unique_texts.append(text)
+        line_indices[text].append(idx)
+
+    if not unique_texts:
+        return dialogue
+
+    # index は重複を除いた台詞の通し番号（結果は全ての同じ台詞に反映する）
+    targets = [{"index": i, "text": text} for i, text in enumerate(unique_texts)]
+    batch_size = max(1, LM_STUDIO_REWRITE_BATCH_SIZE)
+    batches = [targets[start:start + batch_size] for start in range(0, len(targets), batch_size)]
+    workers = max(1, min(LM_STUDIO_REWRITE_CONCURRENCY, len(batches)))
+    duplicates = sum(len(indices) for indices in line_indices.values()) - len(unique_texts)
+    print(f"Rewriting English in {len(unique_texts)} lines: {len(batches)} batches, {workers} in flight "
+          f"(skipped {duplicates} duplicates, {already_japanese} already Japanese)")
+
+    model = resolve_model()
+    rewritten = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(rewrite_batch, batch, model) for batch in batches]
+        for future in as_completed(futures):
+            try:
+                rewritten.update(future.result())
+            except Exception as e:
+                print(f"Warning: Failed to rewrite English dialogue batch: {e}")
+
+    for i, text in rewritten.items():
+        for idx in line_indices[unique_texts[i]]:
+            dialogue[idx]["text"] = text
 
     return dialogue
 
@@ -326,44 +359,7 @@ def format_date_jp(date_str):
         return date_str
 
 
-def generate_paper_script(papers, date_str=None):
-    """
-    複数の論文情報からPodcast台本を生成
-
-    Args:
-        papers: 論文情報のリスト
-        date_str: 日付文字列（例: "2024-01-19"）
-
-    Returns:
-        dict: 台本データ（title, dialogue, references）
-    """
-    if not ensure_lm_studio_ready():
-        print("LM Studio is not available. Script generation aborted.")
-        return None
-    if date_str is None:
-        from datetime import datetime
-        date_str = datetime.now().strftime("%Y-%m-%d")
-
-    jp_date_str = format_date_jp(date_str)
-
-    # 論文情報を整形
-    papers_text = ""
-    for i, paper in enumerate(papers, 1):
-        summary = normalize_summary(paper.get("summary"))
-        doi = paper.get("doi") or "なし"
-        published = paper.get("published") or "不明"
-        papers_text += f"""
-【論文{i}】
-タイトル: {paper.get('title', 'No Title')}
-著者: {paper.get('authors', 'Unknown')}
-出典: {paper.get('source', 'Unknown')}
-公開日: {published}
-URL: {paper.get('url', '')}
-DOI: {doi}
-要約: {summary}
-"""
-
-    system_prompt = f"""
+PAPER_SCRIPT_RULES = f"""
 あなたは人気Podcastの構成作家です。
 提供された論文情報を元に、リスナーが親しみやすく、かつ知的好奇心を刺激されるような「一人語りの台本」を作成してください。
 
@@ -396,25 +392,71 @@ DOI: {doi}
 Markdownのコードブロック(```json)や、冒頭・末尾の挨拶、解説は一切不要です。
 JSONの文法エラー（カンマ漏れ、閉じていない引用符など）がないように注意してください。
 
-Format:
-{{
+"""
+
+
+def paper_system_prompt(format_spec):
+    return PAPER_SCRIPT_RULES + "Format:\n" + format_spec
+
+
+def format_paper_text(i, paper, summary_tokens=PAPER_SUMMARY_MAX_TOKENS):
+    summary = normalize_summary(paper.get("summary"), summary_tokens) if summary_tokens > 0 else ""
+    doi = paper.get("doi") or "なし"
+    published = paper.get("published") or "不明"
+    return f"""
+【論文{i}】
+タイトル: {paper.get('title', 'No Title')}
+著者: {paper.get('authors', 'Unknown')}
+出典: {paper.get('source', 'Unknown')}
+公開日: {published}
+URL: {paper.get('url', '')}
+DOI: {doi}
+要約: {summary}
+"""
+
+
+def min_lines_per_paper(paper_count):
+    if paper_count <= 4:
+        return 8
+    if paper_count <= 7:
+        return 7
+    return 6
+
+
+def chat_dialogue_json(messages, list_fields=("dialogue",), **kwargs):
+    """
+    list_fields に台詞のある応答だけを受け付ける chat_json。
+    台詞の無い応答はキャッシュせずに再試行し、それでも失敗したらキャッシュを使わずに生成し直す
+    """
+    attempts = max(1, PAPER_SCRIPT_ATTEMPTS)
+    for attempt in range(attempts):
+        try:
+            return chat_json(messages, cache=attempt == 0, valid=lambda data: has_dialogue(data, *list_fields), **kwargs)
+        except LLMError as e:
+            if attempt == attempts - 1:
+                raise
+            print(f"Warning: {e}; regenerating without the cache ({attempt + 2}/{attempts})...")
+
+
+def generate_paper_script_single(papers, jp_date_str):
+    """
+    全ての論文を1回のリクエストで台本にする
+    """
+    system_prompt = paper_system_prompt(f"""{{
   "title": "エピソードのタイトル",
   "dialogue": [
     {{"speaker": "{DEFAULT_SPEAKER_NAME}", "text": "台詞"}}
   ]
 }}
-"""
+""")
 
     paper_count = len(papers)
-    if paper_count <= 4:
-        min_lines = 8
-    elif paper_count <= 7:
-        min_lines = 7
-    else:
-        min_lines = 6
+    min_lines = min_lines_per_paper(paper_count)
     target_minutes = min(15, max(10, paper_count + 5))
 
-    user_prompt = f"""以下の論文情報を元に、約{target_minutes}分程度の論文紹介トーク台本を作成してください。
+    def build_messages(summary_tokens):
+        papers_text = "".join(format_paper_text(i, paper, summary_tokens) for i, paper in enumerate(papers, 1))
+        user_prompt = f"""以下の論文情報を元に、約{target_minutes}分程度の論文紹介トーク台本を作成してください。
 日付は{jp_date_str}です。冒頭で日付と「今日のEEG論文まとめ」であることを紹介してください。
 
 各論文について：
@@ -438,95 +480,243 @@ Format:
 2. 各論文の紹介（要点を整理しながら一人語りで解説）
 3. エンディング（まとめと次回予告）
 """
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-
-    model = resolve_model()
-    max_tokens = min(LM_STUDIO_MAX_TOKENS, 800 + (len(papers) * 250))
-    payload = {
-        "model": model,
-        "messages": [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.5,
-        "max_tokens": max_tokens,
-        "stream": False
-    }
+        ]
+
+    # 出力は目標の長さから決め、要約（1本あたり PAPER_SUMMARY_MAX_TOKENS まで）と一緒にコンテキストに収める
+    lines = max(paper_count * min_lines + FRAME_LINES, lines_for_minutes(target_minutes))
+    max_tokens, input_tokens = allocate(
+        context_length(),
+        count_message_tokens(build_messages(0)),
+        output_tokens_for_lines(lines, DEFAULT_SPEAKER_NAME),
+        desired_input=sum(count_tokens(normalize_summary(paper.get("summary"))) for paper in papers),
+        min_input=paper_count * PAPER_SUMMARY_MIN_TOKENS,
+        max_output=LM_STUDIO_MAX_TOKENS
+    )
+    messages = build_messages(min(PAPER_SUMMARY_MAX_TOKENS, input_tokens // max(paper_count, 1)))
 
     print(f"Generating paper review script for {len(papers)} papers...")
 
-    max_retries = 3
-    for attempt in range(max_retries):
+    try:
+        return chat_dialogue_json(messages, temperature=0.5, max_tokens=max_tokens, timeout=LM_STUDIO_TIMEOUT,
+                                  schema=dialogue_schema(), schema_name="paper_script")
+    except LLMError as e:
+        if e.content:
+            print("Raw response:", e.content[:500])
+        return None
+
+
+def generate_paper_section(i, paper, paper_count, min_lines):
+    """
+    1本の論文の紹介パートを作る（オープニングとエンディングは含めない）
+    """
+    system_prompt = paper_system_prompt(f"""{{
+  "dialogue": [
+    {{"speaker": "{DEFAULT_SPEAKER_NAME}", "text": "台詞"}}
+  ]
+}}
+""")
+    header = f"""論文まとめ番組の{i}本目（全{paper_count}本）の論文の紹介パートだけを作成してください。
+オープニングとエンディングは別に作成するので含めないでください。
+最初の発話では「{i}本目の論文は」のように、何本目の論文かが分かる形で紹介を始めてください。
+
+内容：
+- 背景・先行研究の位置づけ（要約にない場合は「要約からは不明」と明記）
+- 研究の目的・課題
+- 手法・データ・対象
+- 主な結果や示唆
+- 限界・今後の展望（要約にない場合は明記）
+
+構成指示：
+- 最低{min_lines}発話
+- 1セリフは1〜2文で、読み上げやすい長さにする
+- 要点の言い換えや独り言の確認を挟む（要約にある範囲で）
+- 推測で断定しない
+"""
+
+    def build_messages(summary_tokens):
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": header + format_paper_text(i, paper, summary_tokens)}
+        ]
+
+    max_tokens, input_tokens = allocate(
+        context_length(),
+        count_message_tokens(build_messages(0)),
+        output_tokens_for_lines(min_lines + 2, DEFAULT_SPEAKER_NAME),
+        desired_input=count_tokens(normalize_summary(paper.get("summary"))),
+        min_input=PAPER_SUMMARY_MIN_TOKENS,
+        max_output=LM_STUDIO_MAX_TOKENS
+    )
+    data = chat_dialogue_json(
+        build_messages(min(PAPER_SUMMARY_MAX_TOKENS, input_tokens)),
+        temperature=0.5,
+        max_tokens=max_tokens,
+        timeout=LM_STUDIO_TIMEOUT,
+        schema=dialogue_schema(title=False),
+        schema_name="paper_section"
+    )
+    return data["dialogue"]
+
+
+def generate_paper_frame(papers, jp_date_str):
+    """
+    エピソードのタイトルとオープニング・エンディングを作る
+    """
+    system_prompt = paper_system_prompt(f"""{{
+  "title": "エピソードのタイトル",
+  "opening": [
+    {{"speaker": "{DEFAULT_SPEAKER_NAME}", "text": "台詞"}}
+  ],
+  "closing": [
+    {{"speaker": "{DEFAULT_SPEAKER_NAME}", "text": "台詞"}}
+  ]
+}}
+""")
+    titles = "\n".join(f"{i}. {paper.get('title', 'No Title')}" for i, paper in enumerate(papers, 1))
+    user_prompt = f"""論文紹介番組のタイトルと、オープニング・エンディングの台詞だけを作成してください（各論文の紹介は別に作成します）。
+日付は{jp_date_str}です。オープニングでは日付と「今日のEEG論文まとめ」であることを紹介し、今日の{len(papers)}本の論文を簡単に予告してください。
+エンディングではまとめと次回予告をしてください。それぞれ3〜5発話にしてください。
+
+今日の論文:
+{titles}
+"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    max_tokens, _ = allocate(
+        context_length(),
+        count_message_tokens(messages),
+        output_tokens_for_lines(FRAME_LINES, DEFAULT_SPEAKER_NAME),
+        max_output=LM_STUDIO_MAX_TOKENS
+    )
+    return chat_dialogue_json(
+        messages,
+        list_fields=("opening", "closing"),
+        temperature=0.5,
+        max_tokens=max_tokens,
+        timeout=LM_STUDIO_TIMEOUT,
+        schema=dialogue_schema("opening", "closing"),
+        schema_name="paper_frame"
+    )
+
+
+def generate_paper_script_parallel(papers, jp_date_str):
+    """
+    論文ごとの紹介パートと、タイトル・オープニング・エンディングを並列に生成し、入力順に繋ぐ。
+    1本の論文で失敗してもその論文だけを再試行し、それでも失敗したらその論文を飛ばす。
+    """
+    paper_count = len(papers)
+    min_lines = min_lines_per_paper(paper_count)
+    workers = max(1, min(PAPER_SECTION_CONCURRENCY, paper_count + 1))
+    print(f"Generating paper review script for {paper_count} papers ({workers} sections in flight)...")
+
+    sections = [None] * paper_count
+    frame = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        frame_future = executor.submit(generate_paper_frame, papers, jp_date_str)
+        futures = {
+            executor.submit(generate_paper_section, i, paper, paper_count, min_lines): i - 1
+            for i, paper in enumerate(papers, 1)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                sections[index] = future.result()
+            except Exception as e:
+                print(f"Warning: Failed to generate section for paper {index + 1}: {e}")
         try:
-            print(f"Attempt {attempt + 1}/{max_retries}...")
-            response = requests.post(LM_STUDIO_URL, headers=headers, json=payload, timeout=LM_STUDIO_TIMEOUT)
-            response.raise_for_status()
-
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-
-            # JSON部分を抽出
-            content = content.replace("```json", "").replace("```", "").strip()
-            start_idx = content.find('{')
-            end_idx = content.rfind('}')
-
-            if start_idx != -1 and end_idx != -1:
-                content = content[start_idx : end_idx + 1]
-
-            script_data = json.loads(content)
-            if isinstance(script_data.get("dialogue"), list):
-                cleaned_dialogue = []
-                for line in script_data["dialogue"]:
-                    if not isinstance(line, dict):
-                        continue
-                    speaker = line.get("speaker") or DEFAULT_SPEAKER_NAME
-                    text = normalize_dialogue_text(line.get("text", ""))
-                    if text:
-                        cleaned_dialogue.append({"speaker": speaker, "text": text})
-                rewritten_dialogue = rewrite_english_dialogue(cleaned_dialogue)
-                for line in rewritten_dialogue:
-                    text = line.get("text", "")
-                    text_no_skip = SKIP_TAG_RE.sub("", text)
-                    if ASCII_LETTER_RE.search(text_no_skip):
-                        line["text"] = normalize_dialogue_text(fallback_wrap_english(text))
-                script_data["dialogue"] = split_dialogue_lines(rewritten_dialogue, DIALOGUE_MAX_CHARS)
-
-            # 参考文献情報を追加
-            script_data['references'] = []
-            for paper in papers:
-                ref = {
-                    'title': paper['title'],
-                    'authors': paper['authors'],
-                    'url': paper['url'],
-                    'doi': paper.get('doi', ''),
-                    'source': paper['source'],
-                    'published': paper['published']
-                }
-                script_data['references'].append(ref)
-
-            script_data['date'] = date_str
-
-            return script_data
-
-        except json.JSONDecodeError:
-            print("Error: LM Studio response was not valid JSON.")
-            if attempt < max_retries - 1:
-                print("Retrying...")
-            else:
-                print("Raw response:", content[:500])
-                return None
+            frame = frame_future.result()
         except Exception as e:
-            print(f"Error communicating with LM Studio: {e}")
-            if attempt < max_retries - 1:
-                print("Retrying...")
-            else:
-                return None
+            print(f"Warning: Failed to generate opening/closing: {e}")
+
+    if not any(sections):
+        print("Error: Failed to generate every paper section.")
+        return None
+
+    frame = frame if isinstance(frame, dict) else {}
+    opening = frame.get("opening") if isinstance(frame.get("opening"), list) else [
+        {"speaker": DEFAULT_SPEAKER_NAME, "text": f"{jp_date_str}の今日のEEG論文まとめをお届けします。"}
+    ]
+    closing = frame.get("closing") if isinstance(frame.get("closing"), list) else [
+        {"speaker": DEFAULT_SPEAKER_NAME, "text": "今日の論文紹介は以上です。次回もお楽しみに。"}
+    ]
+    dialogue = list(opening)
+    for section in sections:
+        dialogue.extend(section or [])
+    dialogue.extend(closing)
+    return {
+        "title": frame.get("title") or f"今日のEEG論文まとめ {jp_date_str}",
+        "dialogue": dialogue
+    }
+
+
+def generate_paper_script(papers, date_str=None, mode=None):
+    """
+    複数の論文情報からPodcast台本を生成
+
+    Args:
+        papers: 論文情報のリスト
+        date_str: 日付文字列（例: "2024-01-19"）
+        mode: "single"（1回のリクエスト）/ "parallel"（論文ごとに並列）。省略時は PAPER_SCRIPT_MODE
+
+    Returns:
+        dict: 台本データ（title, dialogue, references）
+    """
+    if not ensure_lm_studio_ready():
+        print("LM Studio is not available. Script generation aborted.")
+        return None
+    if date_str is None:
+        from datetime import datetime
+        date_str = datetime.now().strftime("%Y-%m-%d")
+
+    jp_date_str = format_date_jp(date_str)
+
+    mode = mode or PAPER_SCRIPT_MODE
+    if mode == "parallel" and len(papers) > 1:
+        script_data = generate_paper_script_parallel(papers, jp_date_str)
+    else:
+        script_data = generate_paper_script_single(papers, jp_date_str)
+    if script_data is None:
+        return None
+
+    if isinstance(script_data.get("dialogue"), list):
+        cleaned_dialogue = []
+        for line in script_data["dialogue"]:
+            if not isinstance(line, dict):
+                continue
+            speaker = line.get("speaker") or DEFAULT_SPEAKER_NAME
+            text = normalize_dialogue_text(line.get("text", ""))
+            if text:
+                cleaned_dialogue.append({"speaker": speaker, "text": text})
+        rewritten_dialogue = rewrite_english_dialogue(cleaned_dialogue)
+        for line in rewritten_dialogue:
+            text = line.get("text", "")
+            text_no_skip = SKIP_TAG_RE.sub("", text)
+            if ASCII_LETTER_RE.search(text_no_skip):
+                line["text"] = normalize_dialogue_text(fallback_wrap_english(text))
+        script_data["dialogue"] = split_dialogue_lines(rewritten_dialogue, DIALOGUE_MAX_CHARS)
+
+    # 参考文献情報を追加
+    script_data['references'] = []
+    for paper in papers:
+        ref = {
+            'title': paper['title'],
+            'authors': paper['authors'],
+            'url': paper['url'],
+            'doi': paper.get('doi', ''),
+            'source': paper['source'],
+            'published': paper['published']
+        }
+        script_data['references'].append(ref)
+
+    script_data['date'] = date_str
+    report_cache()
 
-    return None
+    return script_data
 
 
 def format_description(script_data):
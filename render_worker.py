@@ -0,0 +1,201 @@
+"""
+Render Worker
+video_editor の分散レンダリング用ワーカー。
+HTTP でセグメントジョブを受け取り、映像セグメント（mp4, 音声なし）を返す。
+
+すべてのリクエストに Authorization: Bearer <RENDER_WORKER_TOKEN> が必要（トークン未設定では起動しない）。
+
+Endpoints:
+  GET  /health             稼働状況
+  HEAD /blobs/<sha256>     画像がキャッシュ済みか確認
+  PUT  /blobs/<sha256>     画像をアップロード
+  POST /render             {"index", "image": sha256, "fps", "lines": [{"frames", "text"}]} -> video/mp4
+"""
+import os
+import re
+import json
+import time
+import argparse
+import tempfile
+import threading
+import hashlib
+import hmac
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from video_editor import render_segment, find_japanese_font
+
+BLOB_NAME_RE = re.compile(r"^[0-9a-f]{64}$")
+
+BLOB_DIR = os.getenv("RENDER_WORKER_BLOB_DIR") or os.path.join(tempfile.gettempdir(), "render_worker_blobs")
+# ワーカーと動画生成側で共有するトークン（video_editor も同じ環境変数を送る）
+RENDER_WORKER_TOKEN = os.getenv("RENDER_WORKER_TOKEN", "")
+RENDER_LOCK = threading.Lock()
+STATS = {"rendered": 0, "failed": 0, "busy": False, "render_seconds": 0.0}
+
+
+class RenderWorkerHandler(BaseHTTPRequestHandler):
+    server_version = "RenderWorker/1.0"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        """
+        共有トークンを確認し、一致しなければ 401 を返す
+        """
+        expected = f"Bearer {self.server.token}".encode("utf-8")
+        if hmac.compare_digest(self.headers.get("Authorization", "").encode("utf-8"), expected):
+            return True
+        if self.command == "HEAD":
+            self.send_response(401)
+            self.end_headers()
+        else:
+            self._send_json(401, {"error": "unauthorized"})
+        return False
+
+    def _blob_path(self):
+        name = self.path[len("/blobs/"):]
+        if not BLOB_NAME_RE.match(name):
+            return None, name
+        return os.path.join(BLOB_DIR, name), name
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        return self.rfile.read(length) if length > 0 else b""
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", **STATS})
+            return
+        self._send_json(404, {"error": "not found"})
+
+    def do_HEAD(self):
+        if not self._authorized():
+            return
+        if self.path.startswith("/blobs/"):
+            path, _ = self._blob_path()
+            self.send_response(200 if path and os.path.exists(path) else 404)
+            self.end_headers()
+            return
+        self.send_response(404)
+        self.end_headers()
+
+    def do_PUT(self):
+        if not self._authorized():
+            return
+        if not self.path.startswith("/blobs/"):
+            self._send_json(404, {"error": "not found"})
+            return
+        path, name = self._blob_path()
+        if not path:
+            self._send_json(400, {"error": "invalid blob name"})
+            return
+        data = self._read_body()
+        if hashlib.sha256(data).hexdigest() != name:
+            self._send_json(400, {"error": "checksum mismatch"})
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._send_json(201, {"stored": name})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != "/render":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            job = json.loads(self._read_body() or b"{}")
+            image_hash = job["image"]
+            fps = int(job["fps"])
+            lines = job["lines"]
+        except Exception as e:
+            self._send_json(400, {"error": f"invalid job: {e}"})
+            return
+
+        image_path = os.path.join(BLOB_DIR, image_hash) if BLOB_NAME_RE.match(str(image_hash)) else None
+        if not image_path or not os.path.exists(image_path):
+            self._send_json(404, {"error": "image blob missing"})
+            return
+
+        fd, output = tempfile.mkstemp(prefix="segment_", suffix=".mp4")
+        os.close(fd)
+        try:
+            # CPU を使い切るので1ワーカー内では1セグメントずつ描画する
+            with RENDER_LOCK:
+                STATS["busy"] = True
+                started = time.time()
+                try:
+                    result = render_segment(image_path, lines, output, fps, font_path=self.server.font_path)
+                finally:
+                    STATS["busy"] = False
+                    STATS["render_seconds"] += time.time() - started
+            if not result:
+                STATS["failed"] += 1
+                self._send_json(400, {"error": "empty segment"})
+                return
+            STATS["rendered"] += 1
+            print(f"Rendered segment {job.get('index')} ({sum(l['frames'] for l in lines)} frames)")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(os.path.getsize(output)))
+            self.end_headers()
+            with open(output, "rb") as f:
+                while True:
+                    block = f.read(1024 * 1024)
+                    if not block:
+                        break
+                    self.wfile.write(block)
+        except Exception as e:
+            STATS["failed"] += 1
+            print(f"Error rendering segment {job.get('index')}: {e}")
+            self._send_json(500, {"error": str(e)})
+        finally:
+            try:
+                os.remove(output)
+            except OSError:
+                pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_worker(host="127.0.0.1", port=8790, token=None):
+    """
+    ワーカーを起動する。他のホストから使う場合は host に "0.0.0.0" などを明示する
+    """
+    token = token or RENDER_WORKER_TOKEN
+    if not token:
+        print("Error: Set RENDER_WORKER_TOKEN (or --token) to a shared secret before starting the render worker.")
+        return
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    server = ThreadingHTTPServer((host, port), RenderWorkerHandler)
+    server.token = token
+    server.font_path = find_japanese_font()
+    print(f"Render worker listening on {host}:{port} (font: {server.font_path})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segment render worker for video_editor")
+    parser.add_argument("--host", type=str, default=os.getenv("RENDER_WORKER_HOST", "127.0.0.1"),
+                        help="他のホストから使う場合は 0.0.0.0 などを指定")
+    parser.add_argument("--port", type=int, default=int(os.getenv("RENDER_WORKER_PORT", "8790")))
+    parser.add_argument("--token", type=str, default=RENDER_WORKER_TOKEN, help="共有トークン（未指定時は RENDER_WORKER_TOKEN）")
+    args = parser.parse_args()
+    run_worker(args.host, args.port, args.token)
@@ -1,43 +1,25 @@
 import os
-import requests
 import json
 import re
 from dotenv import load_dotenv
 from lm_studio_utils import ensure_lm_studio_ready
+from llm_client import LLMError, chat_json, context_length, dialogue_schema, has_dialogue, report_cache
+from token_budget import allocate, count_message_tokens, count_tokens, lines_for_minutes, output_tokens_for_lines, truncate_to_tokens
 
 load_dotenv()
 
-LM_STUDIO_URL = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1") + "/chat/completions"
-API_KEY = os.getenv("LM_STUDIO_API_KEY", "lm-studio")
-DEFAULT_MODEL = "openai/gpt-oss-20b"
 DEFAULT_SPEAKER_NAME = os.getenv("VOICEVOX_SPEAKER_NAME", "青山龍星")
+# 台本の目標の長さ（分）。max_tokens はここから決める
+TOPIC_TARGET_MINUTES = 6
+TOPIC_MIN_INPUT_TOKENS = 1000
+# 元テキストのために確保したいトークン（これより長いテキストはコンテキストが足りなければ切る）
+TOPIC_MAX_INPUT_TOKENS = 4000
 CJK_RANGE = r"\u3040-\u30ff\u3400-\u9fff"
 SPACE_BETWEEN_CJK = re.compile(rf"(?<=[{CJK_RANGE}0-9])\s+(?=[{CJK_RANGE}0-9])")
 SPACE_BETWEEN_CJK_ASCII = re.compile(rf"(?<=[{CJK_RANGE}])\s+(?=[A-Za-z0-9])")
 SPACE_BETWEEN_ASCII_CJK = re.compile(rf"(?<=[A-Za-z0-9])\s+(?=[{CJK_RANGE}])")
 
 
-def resolve_model():
-    model = os.getenv("LM_STUDIO_MODEL")
-    if model:
-        return model
-
-    base_url = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1")
-    try:
-        response = requests.get(f"{base_url}/models", timeout=10)
-        response.raise_for_status()
-        data = response.json().get("data", [])
-        for item in data:
-            model_id = item.get("id")
-            if model_id and "embed" not in model_id.lower():
-                return model_id
-        if data:
-            return data[0].get("id")
-    except Exception as e:
-        print(f"Warning: Could not fetch LM Studio models: {e}")
-
-    return DEFAULT_MODEL
-
 def normalize_dialogue_text(text):
     if not text:
         return ""
@@ -96,7 +78,8 @@ def generate_script(topic_text):
     }}
     """
 
-    user_prompt = f"""以下のテキストを元に、約5〜6分程度の解説トーク台本を作成してください。
+    def build_messages(text):
+        user_prompt = f"""以下のテキストを元に、約5〜6分程度の解説トーク台本を作成してください。
 
 構成指示：
 - 導入（話題の全体像）
@@ -108,77 +91,44 @@ def generate_script(topic_text):
 台本は少し長めにし、要点の言い換えや独り言の確認を挟んでください。
 
 【元テキスト】
-{topic_text}"""
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-
-    model = resolve_model()
-    payload = {
-        "model": model,
-        "messages": [
+{text}"""
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 2000,
-        "stream": False
-    }
+        ]
+
+    # 出力は目標の長さから決め、元テキストと一緒にコンテキストに収める
+    max_tokens, input_tokens = allocate(
+        context_length(),
+        count_message_tokens(build_messages("")),
+        output_tokens_for_lines(lines_for_minutes(TOPIC_TARGET_MINUTES), DEFAULT_SPEAKER_NAME),
+        desired_input=min(count_tokens(topic_text), TOPIC_MAX_INPUT_TOKENS),
+        min_input=TOPIC_MIN_INPUT_TOKENS
+    )
+    messages = build_messages(truncate_to_tokens(topic_text, input_tokens))
 
     print(f"Generating script for topic: {topic_text[:50]}...")
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            print(f"Attempt {attempt + 1}/{max_retries}...")
-            response = requests.post(LM_STUDIO_URL, headers=headers, json=payload, timeout=600)
-            response.raise_for_status()
-            
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            
-            # JSON部分だけを抽出する処理
-            # Markdownの除去
-            content = content.replace("```json", "").replace("```", "").strip()
-            
-            # 最初の '{' と最後の '}' を探す
-            start_idx = content.find('{')
-            end_idx = content.rfind('}')
-            
-            if start_idx != -1 and end_idx != -1:
-                content = content[start_idx : end_idx + 1]
-            
-            script_data = json.loads(content)
-            if isinstance(script_data.get("dialogue"), list):
-                cleaned_dialogue = []
-                for line in script_data["dialogue"]:
-                    if not isinstance(line, dict):
-                        continue
-                    speaker = line.get("speaker") or DEFAULT_SPEAKER_NAME
-                    text = normalize_dialogue_text(line.get("text", ""))
-                    if text:
-                        cleaned_dialogue.append({"speaker": speaker, "text": text})
-                script_data["dialogue"] = cleaned_dialogue
-            return script_data
-
-        except json.JSONDecodeError:
-            print("Error: LM Studio response was not valid JSON.")
-            # 最後の試行でなければログを出してリトライ
-            if attempt < max_retries - 1:
-                print("Retrying...")
-            else:
-                print("Raw response:", content)
-                return None
-        except Exception as e:
-            print(f"Error communicating with LM Studio: {e}")
-            if attempt < max_retries - 1:
-                print("Retrying...")
-            else:
-                return None
-    
-    return None
+
+    try:
+        script_data = chat_json(messages, temperature=0.7, max_tokens=max_tokens, timeout=600,
+                                schema=dialogue_schema(), schema_name="topic_script", valid=has_dialogue)
+    except LLMError as e:
+        if e.content:
+            print("Raw response:", e.content)
+        return None
+
+    if isinstance(script_data.get("dialogue"), list):
+        cleaned_dialogue = []
+        for line in script_data["dialogue"]:
+            if not isinstance(line, dict):
+                continue
+            speaker = line.get("speaker") or DEFAULT_SPEAKER_NAME
+            text = normalize_dialogue_text(line.get("text", ""))
+            if text:
+                cleaned_dialogue.append({"speaker": speaker, "text": text})
+        script_data["dialogue"] = cleaned_dialogue
+    report_cache()
+    return script_data
 
 if __name__ == "__main__":
     # Test execution
@@ -0,0 +1,285 @@
+"""
+Series Thumbnail
+シリーズごとの背景画像を少数だけ生成してキャッシュしておき、毎回はエピソードのタイトルと日付を Pillow で合成する。
+THUMBNAIL_MODE=template で有効。デフォルトの diffusion では従来どおり毎回 Stable Diffusion で生成する。
+
+Usage:
+  # 背景のプールを先に作っておく
+  python series_thumbnail.py --prepare paper github bsd
+  # 合成のテスト
+  python series_thumbnail.py --series bsd --title "海馬の長期増強" --output test_thumbnail.png
+"""
+import os
+import re
+import hashlib
+import argparse
+import datetime
+from functools import lru_cache
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "diffusion": 毎回 Stable Diffusion で生成 / "template": 背景のプールにタイトルと日付を合成
+THUMBNAIL_MODE = os.getenv("THUMBNAIL_MODE", "diffusion")
+THUMBNAIL_TEMPLATE_DIR = os.getenv("THUMBNAIL_TEMPLATE_DIR", "thumbnail_templates")
+THUMBNAIL_TEMPLATE_POOL = int(os.getenv("THUMBNAIL_TEMPLATE_POOL", "4"))
+THUMBNAIL_SIZE = (1280, 720)
+# 背景の作り方を変えたら上げる（キャッシュのキーに含める）
+TEMPLATE_VERSION = 1
+
+SERIES_THUMBNAILS = {
+    "paper": {
+        "label": "Brain Tech News",
+        "accent": (255, 166, 90),
+        "gradient": ((18, 24, 32), (40, 70, 110)),
+        "prompts": [
+            "abstract neural network visualization, glowing neurons, dark blue background, cinematic lighting, no text, 4k",
+            "brain computer interface, EEG headset, futuristic laboratory, soft light, no text, 4k",
+            "electroencephalography brain waves, abstract data visualization, dark background, no text, 4k",
+            "human brain hologram, scientific illustration, blue and orange light, no text, 4k",
+        ],
+    },
+    "github": {
+        "label": "EEGFlow開発日記",
+        "accent": (120, 220, 160),
+        "gradient": ((14, 20, 18), (30, 64, 52)),
+        "prompts": [
+            "EEG brain wave research development, programming code on screens, scientific visualization, no text, 4k",
+            "developer desk at night, multiple monitors with waveforms, cozy lighting, no text, 4k",
+            "abstract circuit board and brain waves, green glow, dark background, no text, 4k",
+            "open source software collaboration, abstract network graph, dark theme, no text, 4k",
+        ],
+    },
+    "bsd": {
+        "label": "脳科学辞典",
+        "accent": (130, 180, 255),
+        "gradient": ((20, 18, 30), (60, 50, 100)),
+        "prompts": [
+            "neuroscience, brain anatomy, scientific diagram, detailed illustration, no text, 4k",
+            "neurons and synapses, microscopic view, detailed illustration, soft colors, no text, 4k",
+            "library of neuroscience books, warm light, brain model on desk, no text, 4k",
+            "cross section of the human brain, medical illustration, clean background, no text, 4k",
+        ],
+    },
+}
+
+FONT_CANDIDATES = [
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/opentype/ipafont-gothic/ipagp.ttf",
+]
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    """
+    日本語を描けるフォントを探して読み込む（サイズごとにキャッシュ）
+    """
+    from PIL import ImageFont
+    from video_editor import find_japanese_font
+
+    for path in [find_japanese_font()] + FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size)
+            except Exception:
+                continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow 10.1 より前はサイズを指定できない
+        return ImageFont.load_default()
+
+
+def parse_date(date_str):
+    if isinstance(date_str, datetime.date):
+        return date_str
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(str(date_str), fmt).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def pool_size(series):
+    return max(1, min(THUMBNAIL_TEMPLATE_POOL, len(SERIES_THUMBNAILS[series]["prompts"])))
+
+
+def background_index(series, date_str):
+    """
+    日付ごとに背景を順番に切り替える
+    """
+    date = parse_date(date_str) or datetime.date.today()
+    return date.toordinal() % pool_size(series)
+
+
+def background_path(series, index):
+    from simple_image_gen import SD_MODEL_ID
+
+    prompt = SERIES_THUMBNAILS[series]["prompts"][index]
+    key = hashlib.sha256(f"{TEMPLATE_VERSION}:{SD_MODEL_ID}:{prompt}".encode("utf-8")).hexdigest()
+    return os.path.join(THUMBNAIL_TEMPLATE_DIR, f"{series}_{index}_{key[:12]}.png")
+
+
+def ensure_background(series, index):
+    """
+    背景画像を返す。まだ無ければ一度だけ Stable Diffusion で生成してキャッシュする。
+    生成できない環境（SKIP_DIFFUSERS=1 など）では None
+    """
+    path = background_path(series, index)
+    if os.path.exists(path):
+        return path
+    if os.getenv("SKIP_DIFFUSERS") == "1":
+        return None
+
+    from simple_image_gen import generate_diffusion_image
+
+    os.makedirs(THUMBNAIL_TEMPLATE_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp.png"
+    print(f"Generating {series} background {index + 1}/{pool_size(series)} (cached in {THUMBNAIL_TEMPLATE_DIR})...")
+    if not generate_diffusion_image(SERIES_THUMBNAILS[series]["prompts"][index], tmp_path):
+        return None
+    os.replace(tmp_path, path)
+    return path
+
+
+def gradient_background(series):
+    """
+    背景を生成できないときのグラデーション
+    """
+    from PIL import Image
+
+    width, height = THUMBNAIL_SIZE
+    top, bottom = (np.array(c, dtype=np.float32) for c in SERIES_THUMBNAILS[series]["gradient"])
+    t = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    rows = (top * (1 - t) + bottom * t).astype(np.uint8)
+    pixels = np.ascontiguousarray(np.broadcast_to(rows[:, None, :], (height, width, 3)))
+    return Image.fromarray(pixels)
+
+
+def shade_bottom(image, start=0.45, max_alpha=210):
+    """
+    タイトルを読みやすくするため、下側を徐々に暗くする
+    """
+    from PIL import Image
+
+    width, height = image.size
+    ramp = np.clip((np.arange(height, dtype=np.float32) / height - start) / (1 - start), 0, 1)
+    alpha = (ramp * max_alpha).astype(np.uint8)
+    mask = Image.fromarray(np.ascontiguousarray(np.broadcast_to(alpha[:, None], (height, width))))
+    black = Image.new("RGB", image.size, (0, 0, 0))
+    return Image.composite(black, image, mask)
+
+
+def wrap_title(draw, text, font, max_width):
+    """
+    英単語は途中で切らず、日本語は1文字単位で折り返す
+    """
+    tokens = re.findall(r"[A-Za-z0-9][A-Za-z0-9\-.,:;!?'\"/()&+]*\s*|\s+|.", text)
+    lines = [""]
+    for token in tokens:
+        candidate = lines[-1] + token
+        if lines[-1] and draw.textlength(candidate.rstrip(), font=font) > max_width:
+            lines.append(token.lstrip())
+        else:
+            lines[-1] = candidate
+    return [line.rstrip() for line in lines if line.strip()]
+
+
+def fit_title(draw, text, max_width, max_lines=3, sizes=(76, 68, 60, 52, 46)):
+    """
+    max_lines 行に収まる最大のフォントサイズで折り返す。収まらなければ最後の行を省略する
+    """
+    for size in sizes:
+        font = load_font(size)
+        lines = wrap_title(draw, text, font, max_width)
+        if len(lines) <= max_lines:
+            return font, lines
+    lines = lines[:max_lines]
+    while lines[-1] and draw.textlength(lines[-1] + "…", font=font) > max_width:
+        lines[-1] = lines[-1][:-1]
+    lines[-1] = lines[-1].rstrip() + "…"
+    return font, lines
+
+
+def compose_thumbnail(series, title, date_str, output_filename, background=None):
+    """
+    背景にシリーズ名・日付・タイトルを合成して保存する
+    """
+    from PIL import Image, ImageDraw, ImageOps
+
+    config = SERIES_THUMBNAILS[series]
+    if background:
+        image = ImageOps.fit(Image.open(background).convert("RGB"), THUMBNAIL_SIZE, Image.LANCZOS)
+    else:
+        image = gradient_background(series)
+    image = shade_bottom(image)
+    draw = ImageDraw.Draw(image)
+    width, height = THUMBNAIL_SIZE
+    margin = 60
+
+    # シリーズ名（左上）
+    label_font = load_font(40)
+    label = config["label"]
+    left, top, right, bottom = draw.textbbox((margin, margin), label, font=label_font)
+    draw.rounded_rectangle((left - 18, top - 12, right + 18, bottom + 12), radius=12, fill=config["accent"])
+    draw.text((margin, margin), label, font=label_font, fill=(16, 16, 20))
+
+    # 日付（右上）
+    date = parse_date(date_str)
+    date_text = date.strftime("%Y.%m.%d") if date else str(date_str or "")
+    if date_text:
+        date_font = load_font(40)
+        date_width = draw.textlength(date_text, font=date_font)
+        draw.text((width - margin - date_width, margin), date_text, font=date_font, fill=(255, 255, 255),
+                  stroke_width=3, stroke_fill=(0, 0, 0))
+
+    # タイトル（下側）
+    font, lines = fit_title(draw, title or "", width - margin * 2)
+    line_height = int(font.size * 1.25) if hasattr(font, "size") else 40
+    y = height - margin - line_height * len(lines)
+    for line in lines:
+        draw.text((margin, y), line, font=font, fill=(255, 255, 255), stroke_width=4, stroke_fill=(0, 0, 0))
+        y += line_height
+
+    image.save(output_filename)
+    print(f"Saved {series} thumbnail to {output_filename}")
+    return output_filename
+
+
+def make_episode_thumbnail(series, title, prompt, output_filename="thumbnail.png", date_str=None, mode=None):
+    """
+    エピソードのサムネイルを作る。
+    template モードでは背景のプールにタイトルと日付を合成し、diffusion モードでは prompt から生成する。
+    """
+    mode = mode or THUMBNAIL_MODE
+    if mode == "template" and series in SERIES_THUMBNAILS:
+        try:
+            background = ensure_background(series, background_index(series, date_str))
+            return compose_thumbnail(series, title, date_str, output_filename, background)
+        except Exception as e:
+            print(f"Error composing template thumbnail, falling back to diffusion: {e}")
+
+    from simple_image_gen import generate_thumbnail
+    return generate_thumbnail(prompt, output_filename, date_str=date_str)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Series background templates for thumbnails")
+    parser.add_argument("--prepare", nargs="*", choices=list(SERIES_THUMBNAILS), help="背景のプールを生成する")
+    parser.add_argument("--series", type=str, default="paper", choices=list(SERIES_THUMBNAILS))
+    parser.add_argument("--title", type=str, default="Decoding inner speech from EEG with self-supervised transformers")
+    parser.add_argument("--date", type=str, default=str(datetime.date.today()))
+    parser.add_argument("--output", type=str, default="test_thumbnail.png")
+    args = parser.parse_args()
+
+    if args.prepare:
+        for series in args.prepare:
+            for index in range(pool_size(series)):
+                path = ensure_background(series, index)
+                print(f"{series} #{index}: {path or 'not available (gradient fallback)'}")
+    else:
+        make_episode_thumbnail(args.series, args.title, args.title, args.output, date_str=args.date, mode="template")
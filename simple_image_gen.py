@@ -1,10 +1,59 @@
 import os
+import io
+from functools import lru_cache
 import numpy as np
 
-try:
-    import torch
-except Exception:
-    torch = None
+import model_store
+import thumbnail_cache
+
+# torch は読み込みに数秒かかるので、実際に生成するときに load_torch() で読み込む
+torch = None
+
+SD_MODEL_ID = os.getenv("SD_MODEL_ID", "runwayml/stable-diffusion-v1-5")
+SD_STEPS = 30
+SD_SIZE = 512
+
+# サンプラーとステップ数のプリセット（品質と生成時間のトレードオフを選ぶ）
+#   default: 従来どおりモデル既定のスケジューラで30ステップ
+#   dpm-20 / dpm-12: DPM-Solver++ (multistep) で少ないステップ数
+#   lcm: LCM-LoRA を使った4ステップ生成（LCM_LORA_PATH にローカルの重みが必要）
+SAMPLER_PRESETS = {
+    "default": {"scheduler": None, "steps": SD_STEPS, "guidance": 7.5},
+    "dpm-20": {"scheduler": "dpm", "steps": 20, "guidance": 7.5},
+    "dpm-12": {"scheduler": "dpm", "steps": 12, "guidance": 7.0},
+    "lcm": {"scheduler": "lcm", "steps": 4, "guidance": 1.0},
+}
+THUMBNAIL_PRESET = os.getenv("THUMBNAIL_PRESET", "default")
+LCM_LORA_PATH = os.getenv("LCM_LORA_PATH", "")
+# LCM の重みが無いときに代わりに使うプリセット
+LCM_FALLBACK_PRESET = "dpm-12"
+
+# 推論バックエンド
+#   torch: diffusers (PyTorch)
+#   onnx: onnx_export.py で書き出した ONNX モデルを ONNX Runtime の CPU プロバイダで実行する
+THUMBNAIL_BACKEND = os.getenv("THUMBNAIL_BACKEND", "torch")
+THUMBNAIL_ONNX_DIR = os.getenv("THUMBNAIL_ONNX_DIR", os.path.join("models", "sd15_onnx"))
+THUMBNAIL_ONNX_THREADS = int(os.getenv("THUMBNAIL_ONNX_THREADS", "0"))
+
+# VAE デコーダ
+#   full: モデル付属の VAE
+#   tiny: TAESD 形式の小さいオートエンコーダ（THUMBNAIL_TINY_VAE_PATH のローカルの重みを使う）
+THUMBNAIL_VAE = os.getenv("THUMBNAIL_VAE", "full")
+THUMBNAIL_TINY_VAE_PATH = os.getenv("THUMBNAIL_TINY_VAE_PATH", os.path.join("models", "taesd"))
+
+# 1回のバッチで生成する候補の数（その中から自動で1枚を選ぶ）
+THUMBNAIL_CANDIDATES = int(os.getenv("THUMBNAIL_CANDIDATES", "2"))
+
+# thumbnail_worker.py が起動していればそちらで生成する（モデルのロードを毎回行わない）
+# 空文字を指定するとワーカーを使わずに常にプロセス内で生成する
+THUMBNAIL_WORKER_URL = os.getenv("THUMBNAIL_WORKER_URL", "http://127.0.0.1:8791").rstrip("/")
+THUMBNAIL_WORKER_TIMEOUT = float(os.getenv("THUMBNAIL_WORKER_TIMEOUT", "900"))
+
+# 重み（UNet・VAE・テキストエンコーダー）ごとに1つだけ持ち、プリセットはスケジューラの差し替えで切り替える
+PIPELINE_CACHE = {}
+
+PLACEHOLDER_SIZE = (1280, 720)
+PLACEHOLDER_TITLE = "Brain Tech News"
 
 def _safe_ascii(text, max_len=80):
     cleaned = "".join(ch if 32 <= ord(ch) < 127 else " " for ch in text or "")
@@ -14,6 +63,7 @@ def _safe_ascii(text, max_len=80):
     return cleaned
 
 
+@lru_cache(maxsize=None)
 def _load_font(size):
     try:
         from PIL import ImageFont
@@ -37,111 +87,427 @@ def _load_font(size):
         return None
 
 
+@lru_cache(maxsize=1)
+def _placeholder_template():
+    """
+    プレースホルダーの背景（グラデーション・装飾・タイトル）を一度だけ描画して使い回す
+    """
+    from PIL import Image, ImageDraw
+
+    width, height = PLACEHOLDER_SIZE
+
+    # 縦方向のグラデーションを NumPy で一度に作る（1行ごとの draw.line と同じ色）
+    shade = (22 + np.arange(height) / height * 60).astype(np.uint8)
+    rows = np.stack([shade, shade + 18, shade + 35], axis=1)
+    pixels = np.ascontiguousarray(np.broadcast_to(rows[:, None, :], (height, width, 3)))
+    base = Image.fromarray(pixels)
+    draw = ImageDraw.Draw(base)
+
+    draw.ellipse((width - 360, -120, width + 80, 320), fill=(255, 166, 90))
+    draw.rectangle((0, height - 160, width, height), fill=(12, 16, 22))
+
+    title_font = _load_font(64)
+    if title_font:
+        draw.text((70, 90), PLACEHOLDER_TITLE, font=title_font, fill=(245, 246, 248))
+    return base
+
+
 def _generate_placeholder_thumbnail(prompt, output_filename):
     try:
-        from PIL import Image, ImageDraw
+        from PIL import ImageDraw
     except Exception as exc:
         print(f"Placeholder thumbnail failed (PIL missing): {exc}")
         return None
 
-    width, height = 1280, 720
-    base = Image.new("RGB", (width, height), (18, 24, 32))
+    # 回ごとに変わるのはサブタイトルだけなので、テンプレートのコピーに描き足す
+    base = _placeholder_template().copy()
     draw = ImageDraw.Draw(base)
 
-    for y in range(height):
-        shade = int(22 + (y / height) * 60)
-        draw.line([(0, y), (width, y)], fill=(shade, shade + 18, shade + 35))
-
-    draw.ellipse((width - 360, -120, width + 80, 320), fill=(255, 166, 90))
-    draw.rectangle((0, height - 160, width, height), fill=(12, 16, 22))
-
-    title_font = _load_font(64)
     subtitle_font = _load_font(32)
-    title_text = "Brain Tech News"
     subtitle_text = _safe_ascii(prompt)
-
-    title_color = (245, 246, 248)
-    subtitle_color = (210, 225, 240)
-
-    if title_font:
-        draw.text((70, 90), title_text, font=title_font, fill=title_color)
     if subtitle_font and subtitle_text:
-        draw.text((70, 170), subtitle_text, font=subtitle_font, fill=subtitle_color)
+        draw.text((70, 170), subtitle_text, font=subtitle_font, fill=(210, 225, 240))
 
     base.save(output_filename)
     print(f"Saved placeholder thumbnail to {output_filename}")
     return output_filename
 
 
-def generate_thumbnail(prompt, output_filename="thumbnail.png"):
-    print(f"Generating thumbnail for: {prompt}")
-
-    if os.getenv("SKIP_DIFFUSERS") == "1":
-        print("SKIP_DIFFUSERS=1 detected. Using placeholder thumbnail.")
-        return _generate_placeholder_thumbnail(prompt, output_filename)
-
+def load_torch():
+    """
+    torch を読み込んで返す（使えない環境では None）
+    """
+    global torch
     if torch is None:
-        print("Torch is not available. Using placeholder thumbnail.")
-        return _generate_placeholder_thumbnail(prompt, output_filename)
+        try:
+            import torch as torch_module
+        except Exception:
+            return None
+        torch = torch_module
+    return torch
 
+
+def select_device():
+    load_torch()
     # M1 Mac (Apple Silicon) 用の設定
     # MPS + float16でNaN問題が発生するため、float32を使用
-    device = "mps" if torch.backends.mps.is_available() else "cpu"
-    print(f"Using device: {device}")
+    return "mps" if torch.backends.mps.is_available() else "cpu"
+
+
+def resolve_preset(name=None, backend=None):
+    """
+    プリセット名を解決して (名前, 設定) を返す。LCM の重みがローカルに無ければ代わりのプリセットを使う。
+    """
+    name = name or THUMBNAIL_PRESET
+    backend = backend or THUMBNAIL_BACKEND
+    if name not in SAMPLER_PRESETS:
+        print(f"Warning: Unknown sampler preset '{name}', using default")
+        name = "default"
+    if SAMPLER_PRESETS[name]["scheduler"] == "lcm":
+        if backend == "onnx":
+            # 書き出し済みの ONNX グラフには LoRA を後から融合できない
+            print(f"Warning: LCM preset is not supported with the ONNX backend, using '{LCM_FALLBACK_PRESET}' instead")
+            name = LCM_FALLBACK_PRESET
+        elif not (LCM_LORA_PATH and os.path.exists(LCM_LORA_PATH)):
+            print(f"Warning: LCM_LORA_PATH is not available, using '{LCM_FALLBACK_PRESET}' instead")
+            name = LCM_FALLBACK_PRESET
+    return name, SAMPLER_PRESETS[name]
+
+
+def resolve_vae(name=None, backend=None):
+    """
+    VAE の種類を解決する。tiny は torch バックエンドでローカルに重みがあるときだけ使う。
+    """
+    name = name or THUMBNAIL_VAE
+    backend = backend or THUMBNAIL_BACKEND
+    if name != "tiny":
+        return "full"
+    if backend == "onnx":
+        print("Warning: Tiny VAE is not supported with the ONNX backend, using the full VAE")
+        return "full"
+    if not os.path.exists(THUMBNAIL_TINY_VAE_PATH):
+        print(f"Warning: THUMBNAIL_TINY_VAE_PATH ({THUMBNAIL_TINY_VAE_PATH}) not found, using the full VAE")
+        return "full"
+    return "tiny"
 
-    try:
-        from diffusers import StableDiffusionPipeline
 
-        # モデルのロード (初回はダウンロードが走ります)
-        model_id = "runwayml/stable-diffusion-v1-5"
+def pipeline_variant(preset_name, backend=None, onnx_dir=None, vae=None):
+    """
+    キャッシュキー用に、生成結果に影響するバックエンド・プリセット・VAE の組み合わせを文字列にする
+    """
+    backend = backend or THUMBNAIL_BACKEND
+    if backend == "onnx":
+        onnx_dir = onnx_dir or THUMBNAIL_ONNX_DIR
+        return f"onnx:{os.path.basename(os.path.normpath(onnx_dir))}/{preset_name}"
+    if (vae or "full") == "tiny":
+        return f"torch+taesd/{preset_name}"
+    return f"torch/{preset_name}"
 
-        # MPSではfloat32を使用（float16だとNaNが発生し黒画像になる）
-        dtype = torch.float16 if device == "cuda" else torch.float32
-        print(f"Using dtype: {dtype}")
 
-        pipe = StableDiffusionPipeline.from_pretrained(
-            model_id,
-            torch_dtype=dtype,
-            use_safetensors=True,
-            safety_checker=None  # フィルター無効化
+def apply_preset(pipe, preset):
+    """
+    パイプラインのスケジューラをプリセットに合わせて差し替える（重みは読み込み直さない）。
+    LCM-LoRA は初回だけ読み込み、LCM のときだけ UNet に融合する
+    """
+    if not hasattr(pipe, "base_scheduler"):
+        pipe.base_scheduler = pipe.scheduler
+    if getattr(pipe, "lcm_fused", False) and preset["scheduler"] != "lcm":
+        pipe.unfuse_lora()
+        pipe.lcm_fused = False
+
+    if preset["scheduler"] == "dpm":
+        from diffusers import DPMSolverMultistepScheduler
+        pipe.scheduler = DPMSolverMultistepScheduler.from_config(
+            pipe.base_scheduler.config,
+            algorithm_type="dpmsolver++",
+            use_karras_sigmas=True
         )
-        pipe = pipe.to(device)
+    elif preset["scheduler"] == "lcm":
+        from diffusers import LCMScheduler
+        if not getattr(pipe, "lcm_loaded", False):
+            pipe.load_lora_weights(LCM_LORA_PATH)
+            pipe.lcm_loaded = True
+        if not getattr(pipe, "lcm_fused", False):
+            pipe.fuse_lora()
+            pipe.lcm_fused = True
+        pipe.scheduler = LCMScheduler.from_config(pipe.base_scheduler.config)
+    else:
+        pipe.scheduler = pipe.base_scheduler
+    return pipe
+
+
+def set_preset(pipe, preset_name):
+    """
+    ロード済みのパイプラインをプリセットに切り替える（すでにそのプリセットなら何もしない）
+    """
+    if getattr(pipe, "preset_name", None) != preset_name:
+        preset = SAMPLER_PRESETS[preset_name]
+        print(f"Using sampler preset: {preset_name} ({preset['steps']} steps)")
+        apply_preset(pipe, preset)
+        pipe.preset_name = preset_name
+    return pipe
+
+
+def _has_accelerate():
+    import importlib.util
+    return importlib.util.find_spec("accelerate") is not None
+
+
+def load_pipeline(device=None, preset_name=None, backend=None, onnx_dir=None, vae=None):
+    """
+    Stable Diffusion パイプラインをロードする。同じプロセス内では一度だけロードして使い回す。
+    プリセットが違うだけならロード済みのパイプラインのスケジューラを差し替える（呼び出し側で同時に使わないこと）
+    """
+    backend = backend or THUMBNAIL_BACKEND
+    preset_name, _ = resolve_preset(preset_name, backend)
+    vae = resolve_vae(vae, backend)
+    if backend == "onnx":
+        onnx_dir = onnx_dir or THUMBNAIL_ONNX_DIR
+        cache_key = (onnx_dir, "onnx")
+        if cache_key not in PIPELINE_CACHE:
+            pipe = load_onnx_pipeline(onnx_dir)
+            pipe.backend = "onnx"
+            pipe.vae_name = "full"
+            PIPELINE_CACHE[cache_key] = pipe
+        return set_preset(PIPELINE_CACHE[cache_key], preset_name)
+
+    load_torch()
+    device = device or select_device()
+    cache_key = (SD_MODEL_ID, device, vae)
+    if cache_key in PIPELINE_CACHE:
+        return set_preset(PIPELINE_CACHE[cache_key], preset_name)
+
+    from diffusers import StableDiffusionPipeline
+
+    print(f"Using device: {device}")
+
+    # MPSではfloat32を使用（float16だとNaNが発生し黒画像になる）
+    dtype = torch.float16 if device == "cuda" else torch.float32
+    print(f"Using dtype: {dtype}")
+
+    # モデルストア（model_store.py）に取り込み済みならそこから読み込み、Hub へは問い合わせない
+    # 取り込んでいなければ従来どおり Hub のキャッシュを使う（初回はダウンロードが走ります）
+    model_path = model_store.resolve_model(SD_MODEL_ID)
+    local_only = model_path != SD_MODEL_ID or model_store.MODEL_OFFLINE
+    if local_only:
+        print(f"Loading model offline from: {model_path}")
+    # safetensors はメモリマップで読み込まれるので、accelerate があればランダム初期化とコピーを省く
+    pipe = StableDiffusionPipeline.from_pretrained(
+        model_path,
+        torch_dtype=dtype,
+        use_safetensors=True,
+        local_files_only=local_only,
+        low_cpu_mem_usage=_has_accelerate(),
+        safety_checker=None  # フィルター無効化
+    )
+    if vae == "tiny":
+        # デコードの時間とピークメモリを減らす（サムネイルには十分な画質）
+        from diffusers import AutoencoderTiny
+        print(f"Using tiny VAE: {THUMBNAIL_TINY_VAE_PATH}")
+        pipe.vae = AutoencoderTiny.from_pretrained(THUMBNAIL_TINY_VAE_PATH, torch_dtype=dtype)
+    pipe = pipe.to(device)
 
-        # Apple Silicon向けの推奨設定 (Attention Slicing)
-        pipe.enable_attention_slicing()
+    # Apple Silicon向けの推奨設定 (Attention Slicing)
+    pipe.enable_attention_slicing()
 
-        # 生成実行
-        result = pipe(
-            prompt,
-            height=512,
-            width=512,
-            num_inference_steps=30
+    pipe.backend = "torch"
+    pipe.vae_name = vae
+
+    PIPELINE_CACHE[cache_key] = pipe
+    return set_preset(pipe, preset_name)
+
+
+def load_onnx_pipeline(onnx_dir):
+    """
+    onnx_export.py で書き出した（必要なら int8 量子化した）モデルを ONNX Runtime の CPU プロバイダでロードする
+    """
+    if not os.path.exists(os.path.join(onnx_dir, "model_index.json")):
+        raise FileNotFoundError(f"ONNX model not found in {onnx_dir} (run onnx_export.py first)")
+
+    import onnxruntime
+    from optimum.onnxruntime import ORTStableDiffusionPipeline
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if THUMBNAIL_ONNX_THREADS > 0:
+        session_options.intra_op_num_threads = THUMBNAIL_ONNX_THREADS
+
+    print(f"Using ONNX Runtime (CPUExecutionProvider): {onnx_dir}")
+    return ORTStableDiffusionPipeline.from_pretrained(
+        onnx_dir,
+        provider="CPUExecutionProvider",
+        session_options=session_options
+    )
+
+
+def make_generator(seed, count=1):
+    if seed is None:
+        return None
+    load_torch()
+    # デバイスによらず同じ乱数列になるよう CPU の Generator を使う（候補ごとに seed, seed+1, ...）
+    return [torch.Generator("cpu").manual_seed(int(seed) + i) for i in range(count)]
+
+
+def score_image(image):
+    """
+    生成画像を NumPy の簡単な指標で採点する（大きいほど良い）。
+    ほぼ真っ黒（MPS の NaN など）や真っ白な画像は None を返して候補から外す。
+    """
+    rgb = np.asarray(image.convert("RGB"), dtype=np.float32) / 255.0
+    luma = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    blackness = float(np.mean(luma < 0.04))
+    whiteness = float(np.mean(luma > 0.96))
+    if rgb.max() == 0 or blackness > 0.95 or whiteness > 0.95:
+        return None
+
+    contrast = float(luma.std())
+    hist, _ = np.histogram(luma, bins=64, range=(0.0, 1.0))
+    p = hist[hist > 0] / luma.size
+    entropy = float(-(p * np.log2(p)).sum() / np.log2(64))
+
+    return entropy + 2.0 * contrast - blackness - whiteness
+
+
+def select_best_image(images):
+    """
+    候補の中から最も点数の高い画像を返す。すべて不合格なら (None, scores)
+    """
+    scores = [score_image(image) for image in images]
+    valid = [(score, i) for i, score in enumerate(scores) if score is not None]
+    if not valid:
+        return None, scores
+    _, best = max(valid)
+    return images[best], scores
+
+
+def run_pipeline(pipe, prompt, seed=None, candidates=None):
+    """
+    ロード済みのパイプラインで候補を1回のバッチでまとめて生成し、最も良い1枚を返す
+    """
+    preset = SAMPLER_PRESETS[getattr(pipe, "preset_name", "default")]
+    candidates = max(1, int(candidates or THUMBNAIL_CANDIDATES))
+
+    # 生成実行（テキストエンコードとステップごとのオーバーヘッドを候補間で共有する）
+    result = pipe(
+        prompt,
+        height=SD_SIZE,
+        width=SD_SIZE,
+        num_inference_steps=preset["steps"],
+        guidance_scale=preset["guidance"],
+        num_images_per_prompt=candidates,
+        generator=make_generator(seed, candidates)
+    )
+
+    image, scores = select_best_image(result.images)
+    if candidates > 1:
+        print("Candidate scores: " + ", ".join("rejected" if s is None else f"{s:.3f}" for s in scores))
+    if image is None:
+        raise RuntimeError("All generated candidates were blank")
+    return image
+
+
+def generate_with_worker(prompt, output_filename, seed=None, preset_name=None, candidates=None):
+    """
+    常駐ワーカー（thumbnail_worker.py）で生成する。ワーカーが無い・失敗した場合は None
+    """
+    if not THUMBNAIL_WORKER_URL:
+        return None
+
+    import requests
+
+    try:
+        health = requests.get(f"{THUMBNAIL_WORKER_URL}/health", timeout=2)
+        if health.status_code != 200:
+            return None
+        # キャッシュキーと実際の生成条件がずれないよう、バックエンドや VAE が違うワーカーは使わない
+        worker_variant = health.json().get("variant")
+        local_variant = pipeline_variant(preset_name, vae=resolve_vae())
+        if worker_variant and worker_variant.split("/")[0] != local_variant.split("/")[0]:
+            print(f"Thumbnail worker runs a different backend/VAE ({worker_variant}), generating in-process")
+            return None
+    except Exception:
+        return None
+
+    try:
+        print(f"Using thumbnail worker at {THUMBNAIL_WORKER_URL}")
+        res = requests.post(
+            f"{THUMBNAIL_WORKER_URL}/generate",
+            json={"prompt": prompt, "seed": seed, "preset": preset_name, "candidates": candidates},
+            timeout=THUMBNAIL_WORKER_TIMEOUT
         )
-        image = result.images[0]
-
-        # 画像が正常か確認（真っ黒チェック）
-        img_array = np.array(image)
-        if img_array.max() == 0:
-            print("Warning: Generated image is completely black, retrying with CPU...")
-            # CPUでリトライ
-            pipe = pipe.to("cpu")
-            result = pipe(
-                prompt,
-                height=512,
-                width=512,
-                num_inference_steps=30
-            )
-            image = result.images[0]
+        res.raise_for_status()
+        with open(output_filename, "wb") as f:
+            f.write(res.content)
+        print(f"Successfully saved to {output_filename} (worker: {res.headers.get('X-Generation-Seconds', '?')}s)")
+        return output_filename
+    except Exception as e:
+        print(f"Thumbnail worker failed, generating in-process: {e}")
+        return None
+
+
+def image_to_png_bytes(image):
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def generate_diffusion_image(prompt, output_filename, date_str=None):
+    """
+    Stable Diffusion で生成する（キャッシュ → ワーカー → プロセス内の順）。生成できなければ None
+    """
+    # 同じ条件で生成済みならキャッシュを使う
+    seed = thumbnail_cache.resolve_seed(date_str)
+    preset_name, preset = resolve_preset()
+    candidates = max(1, THUMBNAIL_CANDIDATES)
+    cache_key = thumbnail_cache.thumbnail_key(
+        prompt, SD_MODEL_ID, preset["steps"], SD_SIZE, seed,
+        variant=f"{pipeline_variant(preset_name, vae=resolve_vae())}/n{candidates}"
+    )
+    if thumbnail_cache.lookup(cache_key, output_filename):
+        return output_filename
+
+    if generate_with_worker(prompt, output_filename, seed=seed, preset_name=preset_name, candidates=candidates):
+        thumbnail_cache.store(cache_key, output_filename)
+        return output_filename
+
+    if load_torch() is None:
+        # diffusers の ONNX パイプラインもスケジューラに torch を使う
+        print("Torch is not available.")
+        return None
+
+    try:
+        pipe = load_pipeline(preset_name=preset_name)
+        image = run_pipeline(pipe, prompt, seed=seed, candidates=candidates)
 
         # 保存
         image.save(output_filename)
         print(f"Successfully saved to {output_filename}")
+        thumbnail_cache.store(cache_key, output_filename)
         return output_filename
 
     except Exception as e:
         print(f"Error generating image: {e}")
+        return None
+
+
+def generate_thumbnail(prompt, output_filename="thumbnail.png", date_str=None):
+    """
+    date_str は THUMBNAIL_SEED_POLICY=date のときのシードに使う（省略時は今日の日付）
+    """
+    print(f"Generating thumbnail for: {prompt}")
+
+    if os.getenv("SKIP_DIFFUSERS") == "1":
+        print("SKIP_DIFFUSERS=1 detected. Using placeholder thumbnail.")
         return _generate_placeholder_thumbnail(prompt, output_filename)
 
+    if generate_diffusion_image(prompt, output_filename, date_str):
+        return output_filename
+
+    # プレースホルダーはキャッシュしない
+    print("Using placeholder thumbnail.")
+    return _generate_placeholder_thumbnail(prompt, output_filename)
+
 if __name__ == "__main__":
     # Test execution
     prompt_text = "masterpiece, best quality, a radio studio with a cute green haired anime girl and a pink haired elegant anime girl talking, microphone, on air sign, highly detailed, 4k"
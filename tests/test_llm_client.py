@@ -0,0 +1,13 @@
+from llm_client import find_repetition
+
+
+def test_detects_long_paragraph_loop():
+    paragraph = "".join(f"これは繰り返される段落の{i}番目の文です。" for i in range(15))
+    paragraph = paragraph[:300]
+    text = "前置きの文章です。" + paragraph * 3
+    assert find_repetition(text, min_chars=240) == (300, 2)
+
+
+def test_ignores_text_without_loop():
+    text = "".join(f"{i}番目の文はそれぞれ違う内容です。" for i in range(40))
+    assert find_repetition(text, min_chars=240) is None
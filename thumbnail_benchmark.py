@@ -0,0 +1,177 @@
+"""
+Thumbnail Benchmark
+サンプラーのプリセット・バックエンド・VAE ごとにサムネイル生成の1枚あたりの秒数を計測する。
+同じプロンプト・同じシードで生成した画像を出力ディレクトリに保存するので、品質も見比べられる。
+tiny VAE は同じ条件の full VAE の画像との差（PSNR / 平均絶対誤差）も表示する。
+
+Usage:
+  python thumbnail_benchmark.py --presets default,dpm-20,dpm-12,lcm --runs 3
+  # torch と ONNX Runtime (fp32 / int8) の比較
+  python thumbnail_benchmark.py --presets dpm-12 --backends torch,onnx:models/sd15_onnx,onnx:models/sd15_onnx_int8
+  # full VAE と tiny VAE の比較
+  python thumbnail_benchmark.py --presets dpm-12 --vaes full,tiny
+"""
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+import simple_image_gen
+
+DEFAULT_PROMPT = "masterpiece, best quality, a radio studio with a cute green haired anime girl and a pink haired elegant anime girl talking, microphone, on air sign, highly detailed, 4k"
+
+
+def parse_backend(spec):
+    """
+    "torch" / "onnx" / "onnx:<dir>" を (backend, onnx_dir) にする
+    """
+    backend, _, onnx_dir = spec.partition(":")
+    if backend == "onnx":
+        return backend, onnx_dir or simple_image_gen.THUMBNAIL_ONNX_DIR
+    return backend, None
+
+
+def compare_images(reference_path, image_path):
+    """
+    基準画像との差を PSNR (dB) と平均絶対誤差 (0-255) で返す
+    """
+    reference = np.asarray(Image.open(reference_path).convert("RGB"), dtype=np.float32)
+    image = np.asarray(Image.open(image_path).convert("RGB"), dtype=np.float32)
+    if reference.shape != image.shape:
+        return None
+    diff = reference - image
+    mse = float(np.mean(diff ** 2))
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    return {"psnr": round(psnr, 2), "mae": round(float(np.mean(np.abs(diff))), 2)}
+
+
+def benchmark_preset(preset_name, prompt, runs, seed, output_dir, device=None, backend_spec="torch", vae="full", candidates=1):
+    """
+    1プリセット分を計測する。最初の1枚はウォームアップとして計測から除く。
+    """
+    backend, onnx_dir = parse_backend(backend_spec)
+    started = time.time()
+    pipe = simple_image_gen.load_pipeline(device, preset_name, backend=backend, onnx_dir=onnx_dir, vae=vae)
+    load_seconds = time.time() - started
+    resolved = pipe.preset_name
+    preset = simple_image_gen.SAMPLER_PRESETS[resolved]
+    variant = simple_image_gen.pipeline_variant(resolved, backend, onnx_dir, pipe.vae_name)
+
+    # ウォームアップ
+    simple_image_gen.run_pipeline(pipe, prompt, seed=seed, candidates=candidates)
+
+    timings = []
+    image = None
+    for _ in range(runs):
+        started = time.time()
+        image = simple_image_gen.run_pipeline(pipe, prompt, seed=seed, candidates=candidates)
+        timings.append(time.time() - started)
+
+    image_path = os.path.join(output_dir, variant.replace("/", "_").replace(":", "-") + ".png")
+    image.save(image_path)
+
+    return {
+        "backend": backend_spec,
+        "variant": variant,
+        "preset": preset_name,
+        "resolved": resolved,
+        "vae": pipe.vae_name,
+        "steps": preset["steps"],
+        "candidates": candidates,
+        "load_seconds": round(load_seconds, 2),
+        "seconds_per_image": round(sum(timings) / len(timings), 2),
+        "min_seconds": round(min(timings), 2),
+        "image": image_path,
+    }
+
+
+def add_vae_comparison(results):
+    """
+    tiny VAE の結果に、同じバックエンド・プリセットの full VAE との時間差と画質差を付ける
+    """
+    full = {
+        (r["backend"], r["resolved"]): r
+        for r in results if "error" not in r and r["vae"] == "full"
+    }
+    for r in results:
+        if "error" in r or r["vae"] != "tiny":
+            continue
+        reference = full.get((r["backend"], r["resolved"]))
+        if not reference:
+            continue
+        r["vs_full"] = {
+            "speedup": round(reference["seconds_per_image"] / r["seconds_per_image"], 2) if r["seconds_per_image"] else None,
+            **(compare_images(reference["image"], r["image"]) or {})
+        }
+
+
+def print_report(results):
+    print("")
+    print(f"{'backend':<28} {'preset':<12} {'vae':<5} {'steps':>5} {'load(s)':>8} {'s/image':>8} {'min(s)':>8}  vs full / image")
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<28} {r['preset']:<12} error: {r['error']}")
+            continue
+        name = r["preset"] if r["preset"] == r["resolved"] else f"{r['preset']}->{r['resolved']}"
+        comparison = ""
+        if "vs_full" in r:
+            c = r["vs_full"]
+            comparison = f"x{c.get('speedup')} psnr={c.get('psnr')}dB mae={c.get('mae')}  "
+        print(f"{r['backend']:<28} {name:<12} {r['vae']:<5} {r['steps']:>5} {r['load_seconds']:>8} {r['seconds_per_image']:>8} {r['min_seconds']:>8}  {comparison}{r['image']}")
+
+
+def run_benchmark(presets, prompt, runs, seed, output_dir, device=None, backends=None, vaes=None, candidates=1):
+    if simple_image_gen.load_torch() is None:
+        print("Torch is not available. Cannot run benchmark.")
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    for backend_spec in backends or ["torch"]:
+        for preset_name in presets:
+            for vae in vaes or ["full"]:
+                print(f"=== Benchmarking preset: {preset_name} ({backend_spec}, {vae} VAE) ===")
+                try:
+                    results.append(benchmark_preset(
+                        preset_name, prompt, runs, seed, output_dir, device, backend_spec, vae, candidates
+                    ))
+                except Exception as e:
+                    print(f"Error benchmarking {preset_name} ({backend_spec}, {vae} VAE): {e}")
+                    results.append({"backend": backend_spec, "preset": preset_name, "error": str(e)})
+                # ロード時間を毎回同じ条件で測るため、計測が終わったパイプラインは解放する
+                simple_image_gen.PIPELINE_CACHE.clear()
+
+    add_vae_comparison(results)
+    print_report(results)
+    with open(os.path.join(output_dir, "results.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark thumbnail sampler presets")
+    parser.add_argument("--presets", type=str, default=",".join(simple_image_gen.SAMPLER_PRESETS))
+    parser.add_argument("--backends", type=str, default="torch", help="torch / onnx / onnx:<dir> をカンマ区切りで指定")
+    parser.add_argument("--vaes", type=str, default="full", help="full / tiny をカンマ区切りで指定")
+    parser.add_argument("--prompt", type=str, default=DEFAULT_PROMPT)
+    parser.add_argument("--runs", type=int, default=2, help="計測する枚数（ウォームアップを除く）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--candidates", type=int, default=1, help="1回のバッチで生成する候補数（s/image は1回の生成あたり）")
+    parser.add_argument("--device", type=str, default=None)
+    parser.add_argument("--output-dir", type=str, default="thumbnail_benchmark")
+    args = parser.parse_args()
+
+    run_benchmark(
+        [p.strip() for p in args.presets.split(",") if p.strip()],
+        args.prompt,
+        max(1, args.runs),
+        args.seed,
+        args.output_dir,
+        args.device,
+        [b.strip() for b in args.backends.split(",") if b.strip()],
+        [v.strip() for v in args.vaes.split(",") if v.strip()],
+        max(1, args.candidates)
+    )
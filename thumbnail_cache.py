@@ -0,0 +1,69 @@
+"""
+サムネイル用キャッシュ
+(プロンプト, モデル, ステップ数, サイズ, シード方針) をキーに生成済み画像を再利用する。
+THUMBNAIL_SEED_POLICY=date にすると日付からシードを決めるので、同じ日の再実行は同じ画像になりキャッシュが当たる。
+"""
+import os
+import shutil
+import hashlib
+import datetime
+from dotenv import load_dotenv
+
+from disk_cache import DiskCache, make_key
+
+load_dotenv()
+
+THUMBNAIL_CACHE_ENABLED = os.getenv("THUMBNAIL_CACHE", "1") != "0"
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", "thumbnail_cache")
+THUMBNAIL_CACHE_MAX_MB = float(os.getenv("THUMBNAIL_CACHE_MAX_MB", "200"))
+# "random": 毎回ランダムなシード / "date": 日付ごとに固定のシード
+THUMBNAIL_SEED_POLICY = os.getenv("THUMBNAIL_SEED_POLICY", "random")
+
+CACHE = DiskCache(THUMBNAIL_CACHE_DIR, int(THUMBNAIL_CACHE_MAX_MB * 1024 * 1024), suffix=".png")
+
+
+def seed_for_date(date_str):
+    digest = hashlib.sha256(f"thumbnail-seed:{date_str}".encode("utf-8")).hexdigest()
+    return int(digest[:8], 16)
+
+
+def resolve_seed(date_str=None):
+    """
+    シード方針に従ってシードを返す。random の場合は None（生成側でランダムに決める）
+    """
+    if THUMBNAIL_SEED_POLICY != "date":
+        return None
+    if not date_str:
+        date_str = datetime.date.today().isoformat()
+    return seed_for_date(str(date_str))
+
+
+def thumbnail_key(prompt, model_id, steps, size, seed, variant=None):
+    """
+    variant にはサンプラーのプリセットなど、同じステップ数でも結果が変わる設定を渡す
+    """
+    return make_key(prompt, model_id, steps, size, THUMBNAIL_SEED_POLICY, seed, variant)
+
+
+def lookup(key, output_filename):
+    """
+    キャッシュにあれば output_filename にコピーしてそのパスを返す
+    """
+    if not THUMBNAIL_CACHE_ENABLED:
+        return None
+    path = CACHE.get_path(key)
+    if not path:
+        return None
+    shutil.copyfile(path, output_filename)
+    print(f"Thumbnail cache hit: {output_filename}")
+    return output_filename
+
+
+def store(key, image_path):
+    if not THUMBNAIL_CACHE_ENABLED:
+        return None
+    try:
+        return CACHE.put_file(key, image_path)
+    except Exception as e:
+        print(f"Warning: Could not store thumbnail in cache: {e}")
+        return None
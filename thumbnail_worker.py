@@ -0,0 +1,178 @@
+"""
+Thumbnail Worker
+Stable Diffusion パイプラインを一度だけロードして常駐し、サムネイル生成リクエストを順番に処理する。
+simple_image_gen.generate_thumbnail はこのワーカーが起動していれば自動的に利用する。
+
+Endpoints:
+  GET  /health     ロード状況とレイテンシ統計
+  POST /generate   {"prompt": "...", "seed": null, "preset": null, "candidates": null} -> image/png
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import simple_image_gen
+
+# GPU/CPU を取り合わないよう、生成は1件ずつ直列に処理する
+GENERATE_LOCK = threading.Lock()
+STATS_LOCK = threading.Lock()
+LATENCY_WINDOW = 100
+
+STATE = {
+    "status": "loading",
+    "model_id": simple_image_gen.SD_MODEL_ID,
+    "device": None,
+    "preset": None,
+    "variant": None,
+    "load_seconds": None,
+    "error": None,
+    "requests": 0,
+    "failures": 0,
+    "waiting": 0,
+    "busy": False,
+}
+LATENCIES = deque(maxlen=LATENCY_WINDOW)
+PIPELINE = {"pipe": None}
+
+
+def latency_stats():
+    with STATS_LOCK:
+        values = sorted(LATENCIES)
+    if not values:
+        return {"count": 0}
+
+    def percentile(p):
+        return round(values[min(len(values) - 1, int(p * len(values)))], 2)
+
+    return {
+        "count": len(values),
+        "avg": round(sum(values) / len(values), 2),
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": round(values[-1], 2),
+        "last": round(LATENCIES[-1], 2),
+    }
+
+
+def load_model():
+    started = time.time()
+    try:
+        if simple_image_gen.load_torch() is None:
+            raise RuntimeError("torch is not available")
+        device = "cpu" if simple_image_gen.THUMBNAIL_BACKEND == "onnx" else simple_image_gen.select_device()
+        STATE["device"] = device
+        PIPELINE["pipe"] = simple_image_gen.load_pipeline(device)
+        STATE["preset"] = PIPELINE["pipe"].preset_name
+        STATE["variant"] = simple_image_gen.pipeline_variant(STATE["preset"], vae=PIPELINE["pipe"].vae_name)
+        STATE["status"] = "ready"
+    except Exception as e:
+        STATE["status"] = "error"
+        STATE["error"] = str(e)
+        print(f"Error loading pipeline: {e}")
+    STATE["load_seconds"] = round(time.time() - started, 2)
+    print(f"Pipeline {STATE['status']} in {STATE['load_seconds']}s")
+
+
+class ThumbnailWorkerHandler(BaseHTTPRequestHandler):
+    server_version = "ThumbnailWorker/1.0"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            # ロード中・失敗時は 503 を返し、クライアントはプロセス内生成にフォールバックする
+            status = 200 if STATE["status"] == "ready" else 503
+            self._send_json(status, {**STATE, "latency": latency_stats()})
+            return
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+        if STATE["status"] != "ready":
+            self._send_json(503, {"error": f"pipeline {STATE['status']}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            prompt = request["prompt"]
+            seed = request.get("seed")
+            preset_name = request.get("preset")
+            candidates = request.get("candidates")
+        except Exception as e:
+            self._send_json(400, {"error": f"invalid request: {e}"})
+            return
+
+        with STATS_LOCK:
+            STATE["requests"] += 1
+            STATE["waiting"] += 1
+        try:
+            with GENERATE_LOCK:
+                with STATS_LOCK:
+                    STATE["waiting"] -= 1
+                STATE["busy"] = True
+                started = time.time()
+                try:
+                    # 重みは1組だけ持ち、リクエストのプリセット（無ければ既定）にスケジューラだけを切り替える
+                    pipe = PIPELINE["pipe"]
+                    resolved = simple_image_gen.resolve_preset(preset_name)[0] if preset_name else STATE["preset"]
+                    simple_image_gen.set_preset(pipe, resolved)
+                    image = simple_image_gen.run_pipeline(pipe, prompt, seed=seed, candidates=candidates)
+                finally:
+                    STATE["busy"] = False
+                elapsed = time.time() - started
+            with STATS_LOCK:
+                LATENCIES.append(elapsed)
+            png = simple_image_gen.image_to_png_bytes(image)
+        except Exception as e:
+            with STATS_LOCK:
+                STATE["failures"] += 1
+            print(f"Error generating thumbnail: {e}")
+            self._send_json(500, {"error": str(e)})
+            return
+
+        print(f"Generated thumbnail in {elapsed:.1f}s: {prompt[:60]}")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(png)))
+        self.send_header("X-Generation-Seconds", f"{elapsed:.2f}")
+        self.end_headers()
+        self.wfile.write(png)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_worker(host="127.0.0.1", port=8791):
+    server = ThreadingHTTPServer((host, port), ThumbnailWorkerHandler)
+    # /health にはロード中も応答できるよう、ロードは別スレッドで行う
+    threading.Thread(target=load_model, daemon=True).start()
+    print(f"Thumbnail worker listening on {host}:{port} (model: {simple_image_gen.SD_MODEL_ID})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistent Stable Diffusion thumbnail worker")
+    parser.add_argument("--host", type=str, default=os.getenv("THUMBNAIL_WORKER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("THUMBNAIL_WORKER_PORT", "8791")))
+    args = parser.parse_args()
+    run_worker(args.host, args.port)
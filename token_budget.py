@@ -0,0 +1,203 @@
+"""
+Token Budget
+プロンプトと出力のトークン数を見積もり、コンテキスト長に収まるように入力を詰める。
+LLM_TOKENIZER にローカルのトークナイザーがあればそれで数え、無ければ文字種ごとの係数で近似する。
+出力の max_tokens は台本の目標の長さ（発話数・分数）から決める。
+
+Usage:
+  # 近似の見積もりとトークナイザーでの実数を比べる（TOKEN_* の係数の調整用）
+  LLM_TOKENIZER=openai/gpt-oss-20b python token_budget.py script_*.json
+"""
+import os
+import re
+import sys
+import json
+import math
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# トークナイザーのファイル（tokenizer.json）かディレクトリ、または Hugging Face のモデル ID（ダウンロード済みのものだけを使う）
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "")
+# LM Studio からロード中のコンテキスト長を取れないときの値
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "8192"))
+# 推論モデル（gpt-oss など）が回答の前に使う思考のトークン
+LLM_REASONING_TOKENS = int(os.getenv("LLM_REASONING_TOKENS", "512"))
+
+# 近似の係数（日本語は1文字1トークン、英語は4文字で1トークンとして、安全側に倍率を掛ける）
+TOKEN_CJK_PER_CHAR = float(os.getenv("TOKEN_CJK_PER_CHAR", "1.0"))
+TOKEN_ASCII_CHARS_PER_TOKEN = float(os.getenv("TOKEN_ASCII_CHARS_PER_TOKEN", "4"))
+TOKEN_ESTIMATE_MARGIN = float(os.getenv("TOKEN_ESTIMATE_MARGIN", "1.15"))
+
+# 台本の1発話の平均文字数と、読み上げの速さ（VOICEVOX の標準の話速でおおよそ1分300文字）
+SCRIPT_LINE_CHARS = int(os.getenv("SCRIPT_LINE_CHARS", "50"))
+SPOKEN_CHARS_PER_MINUTE = int(os.getenv("SPOKEN_CHARS_PER_MINUTE", "300"))
+# 目標の長さより長めに書かれても切れないようにする倍率（見積もり自体の余裕は TOKEN_ESTIMATE_MARGIN に含まれる）
+OUTPUT_HEADROOM = 1.1
+
+# 入力を優先して確保しても、出力には希望のこの割合までは残す（これを切るなら入力と出力を希望の比で分ける）
+MIN_OUTPUT_SHARE = 1 / 3
+
+# チャットテンプレートが足すトークン（メッセージごと・リクエストごと）
+MESSAGE_OVERHEAD_TOKENS = 8
+REQUEST_OVERHEAD_TOKENS = 128
+
+CJK_CHARS = r"\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef"
+_PIECE_RE = re.compile(rf"([{CJK_CHARS}])|([A-Za-z]+)|([0-9]+)|(\s*\n\s*)|(\s+)|(.)", flags=re.DOTALL)
+# 切るときに優先する位置（文末・改行・空白）
+_BREAK_RE = re.compile(r"[。！？!?.\n]\s*|[、,;；]\s*|\s+")
+
+
+@lru_cache(maxsize=1)
+def load_tokenizer():
+    """
+    トークン数を返す関数。トークナイザーが無ければ None
+    """
+    if not LLM_TOKENIZER:
+        return None
+    path = LLM_TOKENIZER
+    if os.path.isdir(path):
+        path = os.path.join(path, "tokenizer.json")
+    try:
+        if os.path.isfile(path):
+            from tokenizers import Tokenizer
+            tokenizer = Tokenizer.from_file(path)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(LLM_TOKENIZER, local_files_only=True)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception as e:
+        print(f"Warning: Could not load tokenizer {LLM_TOKENIZER} ({e}); using approximate token counts.")
+        return None
+
+
+def approximate_tokens(text):
+    """
+    文字種ごとの係数でトークン数を近似する（多めに見積もる）
+    """
+    count = 0.0
+    for cjk, word, digits, newline, _space, symbol in _PIECE_RE.findall(text or ""):
+        if cjk:
+            count += TOKEN_CJK_PER_CHAR
+        elif word:
+            count += math.ceil(len(word) / TOKEN_ASCII_CHARS_PER_TOKEN)
+        elif digits:
+            count += math.ceil(len(digits) / 3)
+        elif newline or symbol:
+            count += 1
+    return int(math.ceil(count * TOKEN_ESTIMATE_MARGIN))
+
+
+def count_tokens(text):
+    counter = load_tokenizer()
+    return counter(text or "") if counter else approximate_tokens(text)
+
+
+def count_message_tokens(messages):
+    return REQUEST_OVERHEAD_TOKENS + sum(
+        count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for message in messages
+    )
+
+
+def truncate_to_tokens(text, max_tokens, suffix="..."):
+    """
+    max_tokens に収まるように text を切る。なるべく文末や空白の位置で切る
+    """
+    text = text or ""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens - count_tokens(suffix)
+    # 収まる最長の先頭部分を二分探索する
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    cut = low
+    breaks = [m.end() for m in _BREAK_RE.finditer(text, 0, cut) if m.end() >= cut * 0.8]
+    if breaks:
+        cut = breaks[-1]
+    return text[:cut].rstrip() + suffix
+
+
+def split_to_tokens(text, max_tokens):
+    """
+    段落（空行区切り）をまとめて max_tokens 以内のチャンクに分ける。長すぎる段落は文の境目で分ける
+    """
+    chunks = []
+    current, current_tokens = "", 0
+    for paragraph in text.split("\n\n"):
+        if not paragraph.strip():
+            continue
+        tokens = count_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = "", 0
+        while tokens > max_tokens:
+            head = truncate_to_tokens(paragraph, max_tokens, suffix="")
+            if not head:
+                head = paragraph[:max(1, len(paragraph) * max_tokens // tokens)]
+            chunks.append(head)
+            paragraph = paragraph[len(head):].lstrip()
+            tokens = count_tokens(paragraph)
+        if paragraph:
+            current += paragraph + "\n\n"
+            current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks or [text]
+
+
+def lines_for_minutes(minutes):
+    """
+    目標の分数を読み上げるのに必要な発話数
+    """
+    return int(math.ceil(minutes * SPOKEN_CHARS_PER_MINUTE / SCRIPT_LINE_CHARS))
+
+
+def output_tokens_for_lines(lines, speaker="", extra_tokens=64):
+    """
+    lines 発話の台本（{"speaker": ..., "text": ...} のリスト）に必要な max_tokens
+    """
+    line = json.dumps({"speaker": speaker, "text": "あ" * SCRIPT_LINE_CHARS}, ensure_ascii=False) + ",\n"
+    return int(lines * count_tokens(line) * OUTPUT_HEADROOM) + extra_tokens + LLM_REASONING_TOKENS
+
+
+def allocate(context_tokens, prompt_tokens, desired_output, desired_input=0, min_input=0, max_output=None):
+    """
+    コンテキスト長をプロンプトの固定部分・詰める入力・出力に割り振り、(max_tokens, 入力に使えるトークン数) を返す。
+    両方が収まるなら入力には desired_input 以上を残す。収まらないときは入力の desired_input を先に確保して残りを出力に回し、
+    出力が希望の MIN_OUTPUT_SHARE を切るなら希望の比で分ける（入力は min_input を下回らない）
+    """
+    available = max(context_tokens - prompt_tokens, 0)
+    desired_output = min(desired_output, max_output or desired_output)
+    if desired_output + desired_input <= available:
+        return desired_output, available - desired_output
+    max_tokens = available - desired_input
+    if max_tokens < desired_output * MIN_OUTPUT_SHARE:
+        max_tokens = available * desired_output // max(desired_output + desired_input, 1)
+    max_tokens = max(min(max_tokens, available - min_input), 0)
+    print(f"Warning: Output limited to {max_tokens} tokens (wanted {desired_output}) and input to "
+          f"{available - max_tokens} tokens (wanted {desired_input}) to fit the {context_tokens}-token context.")
+    return max_tokens, available - max_tokens
+
+
+if __name__ == "__main__":
+    counter = load_tokenizer()
+    if not counter:
+        print("Set LLM_TOKENIZER to a local tokenizer to compare with the approximation.")
+    for path in sys.argv[1:]:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        estimate = approximate_tokens(text)
+        if counter:
+            actual = counter(text)
+            print(f"{path}: approx {estimate} / tokenizer {actual} (ratio {estimate / max(actual, 1):.2f})")
+        else:
+            print(f"{path}: approx {estimate}")
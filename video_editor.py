@@ -1,60 +1,95 @@
-from moviepy import ImageClip, AudioFileClip, concatenate_audioclips, CompositeVideoClip, TextClip
 import os
 import glob
 import json
 import re
+import hashlib
+import math
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
 
+import unicodedata
 
-def create_podcast_video(image_path, audio_folder, output_filename="final_video.mp4", script_file=None):
-    """
-    指定された画像と、音声フォルダ内の全てのwavファイルを結合して動画を作成する。
-    script_fileが指定されている場合は字幕を追加する。
-    """
-    print(f"Creating video from {image_path} and audio in {audio_folder}...")
+# エンコード設定（セグメント分割レンダリングでも同じ値を使い、ストリームコピーで結合できるようにする）
+VIDEO_SIZE = (1280, 720)
+VIDEO_CODEC = "libx264"
+AUDIO_CODEC = "aac"
+AUDIO_FPS = 44100
+SUBTITLE_FPS = 24
+STILL_FPS = 1
+# これ未満の fps ではセリフごとに切り上げると1セリフあたり最大 1/fps 秒の無音が増えるので、累積時間で丸める
+PER_LINE_MIN_FPS = 10
+SUBTITLE_FONT_SIZE = 36
+RENDER_THREADS = int(os.getenv("VIDEO_RENDER_THREADS", "4"))
 
-    # 音声ファイルの取得とソート (000_...wav, 001_...wav の順)
-    audio_files = sorted(glob.glob(os.path.join(audio_folder, "*.wav")))
+# 分散レンダリング設定
+# RENDER_WORKERS=http://127.0.0.1:8790,http://render2:8790 のように指定すると
+# タイムラインをセグメントに分割し、render_worker.py で起動したワーカーへ送る
+RENDER_WORKERS = [w.strip().rstrip("/") for w in os.getenv("RENDER_WORKERS", "").split(",") if w.strip()]
+RENDER_SEGMENT_LINES = int(os.getenv("RENDER_SEGMENT_LINES", "8"))
+RENDER_WORKER_SLOTS = int(os.getenv("RENDER_WORKER_SLOTS", "1"))
+RENDER_WORKER_TIMEOUT = float(os.getenv("RENDER_WORKER_TIMEOUT", "600"))
+# render_worker.py と共有するトークン
+RENDER_WORKER_TOKEN = os.getenv("RENDER_WORKER_TOKEN", "")
 
-    if not audio_files:
-        print("No audio files found!")
-        return None
+# VIDEO_FRAGMENTED=1 の場合は fragmented MP4 で書き出す（書き出し中のファイルを先頭から順にアップロードできる）
+VIDEO_FRAGMENTED = os.getenv("VIDEO_FRAGMENTED", "0") == "1"
+FRAGMENTED_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
 
-    # 字幕情報を読み込み
-    subtitles = []
-    show_speaker = False
-    if script_file and os.path.exists(script_file):
-        with open(script_file, "r", encoding="utf-8") as f:
-            script_data = json.load(f)
-            dialogues = script_data.get("dialogue", [])
-            for i, d in enumerate(dialogues):
-                subtitles.append({
-                    "index": i,
-                    "speaker": d["speaker"],
-                    "text": d["text"]
-                })
-        unique_speakers = {sub.get("speaker") for sub in subtitles if sub.get("speaker")}
-        show_speaker = len(unique_speakers) > 1
-
-    # 音声クリップを作成し、各クリップの開始時刻を記録
-    audio_clips = []
-    clip_times = []  # (start_time, duration, index)
-    current_time = 0.0
-
-    for i, wav in enumerate(audio_files):
-        clip = AudioFileClip(wav)
-        audio_clips.append(clip)
-        clip_times.append((current_time, clip.duration, i))
-        current_time += clip.duration
+# 省メモリレンダリング設定
+# VIDEO_RSS_BUDGET_MB を指定すると MoviePy を使わずにフレームを ffmpeg へ直接流し込み、
+# 本プロセスと ffmpeg の RSS 合計が予算を超えた場合は書き出しを中止する
+VIDEO_RSS_BUDGET_MB = float(os.getenv("VIDEO_RSS_BUDGET_MB", "0"))
+VIDEO_BOUNDED_THREADS = int(os.getenv("VIDEO_BOUNDED_THREADS", "2"))
+VIDEO_BOUNDED_LOOKAHEAD = int(os.getenv("VIDEO_BOUNDED_LOOKAHEAD", "10"))
+RSS_POLL_INTERVAL = 0.5
 
-    # 音声を結合
-    final_audio = concatenate_audioclips(audio_clips)
-    duration = final_audio.duration
+# 差分レンダリング設定
+# VIDEO_INCREMENTAL=1 の場合、セリフごとのセグメントを音声フォルダ内にキャッシュし、
+# 変更のあったセリフだけを再エンコードしてストリームコピーで繋ぎ直す
+VIDEO_INCREMENTAL = os.getenv("VIDEO_INCREMENTAL", "0") == "1"
+SEGMENT_CACHE_DIRNAME = "segments"
+SEGMENT_MANIFEST_NAME = "manifest.json"
+SEGMENT_STYLE_VERSION = 1
 
-    # 画像クリップを作成（音声と同じ長さにする）
-    # サイズを1280x720に設定（YouTube推奨）
-    image_clip = ImageClip(image_path).with_duration(duration).resized((1280, 720))
+# シリーズ共通のイントロ/アウトロ
+# VIDEO_BUMPERS=1 の場合、シリーズごとのイントロ/アウトロを本編と同じエンコード設定で一度だけ作成してキャッシュし、
+# 毎回はストリームコピーで前後に繋ぐだけにする
+VIDEO_BUMPERS = os.getenv("VIDEO_BUMPERS", "0") == "1"
+VIDEO_BUMPER_NARRATION = os.getenv("VIDEO_BUMPER_NARRATION", "0") == "1"
+BUMPER_CACHE_DIR = os.getenv("VIDEO_BUMPER_CACHE_DIR", "bumper_cache")
+BUMPER_DURATION = float(os.getenv("VIDEO_BUMPER_DURATION", "3"))
+BUMPER_BACKGROUND = (18, 24, 32)
+BUMPER_FONT_SIZE = 64
+BUMPER_VERSION = 1
+# VOICEVOX の出力と同じ形式（無音のイントロでも wav の連結がそのまま通るように揃える）
+BUMPER_SILENCE_RATE = 24000
+SERIES_BUMPERS = {
+    "paper": {
+        "intro": "Brain Tech News\n今日のEEG論文まとめ",
+        "outro": "Brain Tech News\nご視聴ありがとうございました",
+        "intro_narration": "ブレインテックニュースへようこそ。",
+        "outro_narration": "ご視聴ありがとうございました。また次回お会いしましょう。",
+    },
+    "github": {
+        "intro": "EEGFlow開発日記",
+        "outro": "EEGFlow開発日記\nご視聴ありがとうございました",
+        "intro_narration": "イーイージーフロー開発日記へようこそ。",
+        "outro_narration": "ご視聴ありがとうございました。また次回お会いしましょう。",
+    },
+    "bsd": {
+        "intro": "脳科学辞典 解説",
+        "outro": "脳科学辞典 解説\nご視聴ありがとうございました",
+        "intro_narration": "脳科学辞典の解説をお届けします。",
+        "outro_narration": "ご視聴ありがとうございました。また次回お会いしましょう。",
+    },
+}
 
-import unicodedata
 
 def find_japanese_font():
     """
@@ -69,43 +104,34 @@ def find_japanese_font():
         "Hiragino Sans GB.ttc",
         "Arial Unicode.ttf"
     ]
-    
+
     for font_dir in font_dirs:
         if not os.path.exists(font_dir):
             continue
-            
+
         # Get list of files and try to match
         try:
             files = os.listdir(font_dir)
             for filename in files:
                 # Normalize filename to NFC for comparison
                 norm_name = unicodedata.normalize('NFC', filename)
-                
+
                 # Check against targets
                 for target in targets:
                     if norm_name.startswith(target) or norm_name == target:
                         return os.path.join(font_dir, filename)
         except Exception:
             continue
-            
+
     # Fallback to a hardcoded path that often works or system default
     return '/System/Library/Fonts/Hiragino Sans GB.ttc'
 
-def create_podcast_video(image_path, audio_folder, output_filename="final_video.mp4", script_file=None):
+
+def load_subtitles(script_file):
     """
-    指定された画像と、音声フォルダ内の全てのwavファイルを結合して動画を作成する。
-    script_fileが指定されている場合は字幕を追加する。
+    script.json から字幕情報を読み込む。
+    戻り値は (字幕リスト, 話者名を表示するかどうか)
     """
-    print(f"Creating video from {image_path} and audio in {audio_folder}...")
-
-    # 音声ファイルの取得とソート (000_...wav, 001_...wav の順)
-    audio_files = sorted(glob.glob(os.path.join(audio_folder, "*.wav")))
-
-    if not audio_files:
-        print("No audio files found!")
-        return None
-
-    # 字幕情報を読み込み
     subtitles = []
     show_speaker = False
     if script_file and os.path.exists(script_file):
@@ -120,6 +146,85 @@ def create_podcast_video(image_path, audio_folder, output_filename="final_video.
                 })
         unique_speakers = {sub.get("speaker") for sub in subtitles if sub.get("speaker")}
         show_speaker = len(unique_speakers) > 1
+    return subtitles, show_speaker
+
+
+def format_subtitle(sub, show_speaker):
+    """
+    字幕1件分の表示テキストを作成する
+    """
+    text = strip_skip_tags(sub["text"])
+
+    # 長いテキストは改行
+    wrapped_text = wrap_text(text, max_chars=30)
+    if show_speaker:
+        return f"【{sub['speaker']}】\n{wrapped_text}"
+    return wrapped_text
+
+
+def make_subtitle_clip(display_text, font_path):
+    """
+    字幕テキストクリップを作成する（位置は画面中央）
+    """
+    from moviepy import TextClip
+
+    txt_clip = TextClip(
+        text=display_text,
+        font_size=SUBTITLE_FONT_SIZE,
+        color='white',
+        font=font_path,
+        stroke_color='black',
+        stroke_width=2,
+        method='caption',
+        size=(1200, None),
+        text_align='center'
+    )
+    return txt_clip.with_position('center')
+
+
+def create_podcast_video(image_path, audio_folder, output_filename="final_video.mp4", script_file=None, incremental=None, series=None, fragmented=None, rss_budget_mb=None):
+    """
+    指定された画像と、音声フォルダ内の全てのwavファイルを結合して動画を作成する。
+    script_fileが指定されている場合は字幕を追加する。
+    incremental（未指定時は VIDEO_INCREMENTAL）が有効な場合は差分レンダリングを行う。
+    RENDER_WORKERS が設定されている場合は分散レンダリングを行う。
+    series（"paper", "github", "bsd"）を指定し VIDEO_BUMPERS=1 の場合はイントロ/アウトロを付ける。
+    fragmented（未指定時は VIDEO_FRAGMENTED）が有効な場合は fragmented MP4 で書き出す。
+    rss_budget_mb（未指定時は VIDEO_RSS_BUDGET_MB）が正の場合は省メモリモードで書き出す。
+    優先順位は 差分レンダリング > 分散レンダリング > 省メモリモード > MoviePy。
+    差分・分散レンダリングではメモリの予算は使わない（警告を表示する）。
+    """
+    if incremental is None:
+        incremental = VIDEO_INCREMENTAL
+    if fragmented is None:
+        fragmented = VIDEO_FRAGMENTED
+    if rss_budget_mb is None:
+        rss_budget_mb = VIDEO_RSS_BUDGET_MB
+    if rss_budget_mb and rss_budget_mb > 0:
+        if not incremental and not RENDER_WORKERS:
+            return create_podcast_video_bounded(image_path, audio_folder, output_filename, script_file, rss_budget_mb, series=series, fragmented=fragmented)
+        mode = "incremental" if incremental else "distributed"
+        print(f"Warning: Ignoring the {rss_budget_mb:.0f} MB RSS budget because {mode} rendering takes precedence "
+              "(unset VIDEO_INCREMENTAL / RENDER_WORKERS to enforce it).")
+    if incremental:
+        return create_podcast_video_incremental(image_path, audio_folder, output_filename, script_file, series=series, fragmented=fragmented)
+    if RENDER_WORKERS:
+        return create_podcast_video_distributed(image_path, audio_folder, output_filename, script_file, series=series, fragmented=fragmented)
+
+    # MoviePy は重いので、実際に書き出すときに読み込む
+    from moviepy import ImageClip, AudioFileClip, concatenate_audioclips, CompositeVideoClip
+
+    print(f"Creating video from {image_path} and audio in {audio_folder}...")
+
+    # 音声ファイルの取得とソート (000_...wav, 001_...wav の順)
+    audio_files = sorted(glob.glob(os.path.join(audio_folder, "*.wav")))
+
+    if not audio_files:
+        print("No audio files found!")
+        return None
+
+    # 字幕情報を読み込み
+    subtitles, show_speaker = load_subtitles(script_file)
 
     # 音声クリップを作成し、各クリップの開始時刻を記録
     audio_clips = []
@@ -138,7 +243,7 @@ def create_podcast_video(image_path, audio_folder, output_filename="final_video.
 
     # 画像クリップを作成（音声と同じ長さにする）
     # サイズを1280x720に設定（YouTube推奨）
-    image_clip = ImageClip(image_path).with_duration(duration).resized((1280, 720))
+    image_clip = ImageClip(image_path).with_duration(duration).resized(VIDEO_SIZE)
 
     # 字幕クリップを作成
     text_clips = []
@@ -146,46 +251,24 @@ def create_podcast_video(image_path, audio_folder, output_filename="final_video.
     # 字幕と音声の数が合わない場合でも、可能な限り表示する
     if subtitles:
         print(f"Adding subtitles (Audio: {len(clip_times)}, Script: {len(subtitles)})...")
-        
+
         font_path = find_japanese_font()
         print(f"Using font: {font_path}")
 
         for start_time, clip_duration, idx in clip_times:
             if idx < len(subtitles):
-                sub = subtitles[idx]
-                speaker = sub["speaker"]
-                text = strip_skip_tags(sub["text"])
-
-                # 長いテキストは改行
-                wrapped_text = wrap_text(text, max_chars=30)
-                if show_speaker:
-                    display_text = f"【{speaker}】\n{wrapped_text}"
-                else:
-                    display_text = wrapped_text
+                display_text = format_subtitle(subtitles[idx], show_speaker)
 
                 try:
-                    # 字幕テキストクリップを作成
-                    txt_clip = TextClip(
-                        text=display_text,
-                        font_size=36,
-                        color='white',
-                        font=font_path,
-                        stroke_color='black',
-                        stroke_width=2,
-                        method='caption',
-                        size=(1200, None),
-                        text_align='center'
-                    )
-
                     # 位置と時間を設定（画面中央に中心揃え）
-                    txt_clip = txt_clip.with_position('center')
+                    txt_clip = make_subtitle_clip(display_text, font_path)
                     txt_clip = txt_clip.with_start(start_time)
                     txt_clip = txt_clip.with_duration(clip_duration)
 
                     text_clips.append(txt_clip)
                 except Exception as e:
                     print(f"Warning: Could not create subtitle {idx}: {e}")
-                    
+
     if subtitles and len(subtitles) != len(clip_times):
         print(f"Warning: Subtitle count ({len(subtitles)}) != audio file count ({len(clip_times)}). Some mismatch may occur.")
 
@@ -199,20 +282,825 @@ def create_podcast_video(image_path, audio_folder, output_filename="final_video.
 
     # 書き出し
     # 字幕がある場合はfps=24が必要
-    fps = 24 if text_clips else 1
+    fps = SUBTITLE_FPS if text_clips else STILL_FPS
+
+    bumpers = get_splice_bumpers(series, fps, fragmented)
+    main_filename = output_filename
+    if bumpers:
+        base, ext = os.path.splitext(output_filename)
+        main_filename = f"{base}.main{ext}"
+
+    video.write_videofile(
+        main_filename,
+        fps=fps,
+        codec=VIDEO_CODEC,
+        audio_codec=AUDIO_CODEC,
+        threads=RENDER_THREADS,
+        ffmpeg_params=movflags_params(fragmented and not bumpers)
+    )
+
+    if bumpers:
+        spliced = splice_with_bumpers(main_filename, bumpers, output_filename, fragmented=fragmented)
+        os.remove(main_filename)
+        if not spliced:
+            return None
+
+    print(f"Video created successfully: {output_filename}")
+    return output_filename
+
+
+def movflags_params(fragmented):
+    """
+    fragmented MP4 用の ffmpeg 追加引数
+    """
+    if fragmented:
+        return ["-movflags", FRAGMENTED_MOVFLAGS]
+    return None
+
+
+def get_ffmpeg_exe():
+    """
+    MoviePy が使っている ffmpeg バイナリを返す（無ければ PATH 上の ffmpeg）
+    """
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def get_wav_duration(path):
+    """
+    wav のヘッダから長さ（秒）を読む。デコードはしない。
+    """
+    try:
+        with wave.open(path, "rb") as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except Exception:
+        from moviepy import AudioFileClip
+        clip = AudioFileClip(path)
+        duration = clip.duration
+        clip.close()
+        return duration
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_timeline(audio_folder, script_file=None):
+    """
+    音声フォルダと台本から、1セリフ=1要素のタイムラインを作る。
+    各要素: {"index", "audio", "duration", "text"}（text は字幕なしなら None）
+    """
+    audio_files = sorted(glob.glob(os.path.join(audio_folder, "*.wav")))
+    subtitles, show_speaker = load_subtitles(script_file)
+
+    if subtitles and len(subtitles) != len(audio_files):
+        print(f"Warning: Subtitle count ({len(subtitles)}) != audio file count ({len(audio_files)}). Some mismatch may occur.")
+
+    timeline = []
+    for i, wav in enumerate(audio_files):
+        text = None
+        speaker = None
+        if i < len(subtitles):
+            text = format_subtitle(subtitles[i], show_speaker)
+            speaker = subtitles[i]["speaker"]
+        timeline.append({
+            "index": i,
+            "audio": wav,
+            "duration": get_wav_duration(wav),
+            "text": text,
+            "speaker": speaker
+        })
+    return timeline
+
+
+def assign_frames(timeline, fps, per_line=False):
+    """
+    各セリフの長さをフレーム境界に揃える。
+    累積時間で丸めるので、セグメントを何個に分けても音声とのずれは1フレーム未満に収まる。
+    per_line=True の場合はセリフごとに切り上げ、前後のセリフの変更に影響されないフレーム数にする
+    （音声側は pad_wav で同じ長さまで無音を足す）。fps が PER_LINE_MIN_FPS 未満のときは切り上げの無音が
+    長くなりすぎるので、per_line=True でも累積時間で丸める（音声は無音を足さずにそのまま繋ぐ）。
+    """
+    if per_line and fps >= PER_LINE_MIN_FPS:
+        for entry in timeline:
+            entry["frames"] = int(math.ceil(entry["duration"] * fps - 1e-6))
+        return timeline
+
+    current_time = 0.0
+    start_frame = 0
+    for entry in timeline:
+        current_time += entry["duration"]
+        end_frame = int(round(current_time * fps))
+        entry["frames"] = max(0, end_frame - start_frame)
+        start_frame = end_frame
+    return timeline
+
+
+def render_segment(image_path, lines, output_filename, fps, font_path=None):
+    """
+    1セグメント分の映像（音声なし）を書き出す。
+    lines: [{"frames": フレーム数, "text": 字幕 or None}, ...]
+    """
+    total_frames = sum(line["frames"] for line in lines)
+    if total_frames <= 0:
+        return None
+
+    from moviepy import ImageClip, CompositeVideoClip
+
+    # MoviePy は int(duration * fps) フレームを書き出すので半フレーム分の余裕を持たせる
+    duration = (total_frames + 0.5) / fps
+    image_clip = ImageClip(image_path).with_duration(duration).resized(VIDEO_SIZE)
+
+    text_clips = []
+    start_frame = 0
+    for line in lines:
+        if line.get("text") and line["frames"] > 0:
+            if font_path is None:
+                font_path = find_japanese_font()
+            try:
+                txt_clip = make_subtitle_clip(line["text"], font_path)
+                txt_clip = txt_clip.with_start(start_frame / fps)
+                txt_clip = txt_clip.with_duration(line["frames"] / fps)
+                text_clips.append(txt_clip)
+            except Exception as e:
+                print(f"Warning: Could not create subtitle: {e}")
+        start_frame += line["frames"]
+
+    if text_clips:
+        video = CompositeVideoClip([image_clip] + text_clips)
+    else:
+        video = image_clip
 
     video.write_videofile(
         output_filename,
         fps=fps,
-        codec='libx264',
-        audio_codec='aac',
-        threads=4
+        codec=VIDEO_CODEC,
+        audio=False,
+        threads=RENDER_THREADS,
+        logger=None
     )
+    return output_filename
+
+
+def pad_wav(src_path, dst_path, target_seconds):
+    """
+    wav の末尾に無音を足して target_seconds の長さにする
+    """
+    with wave.open(src_path, "rb") as src:
+        params = src.getparams()
+        data = src.readframes(params.nframes)
+    target_frames = int(round(target_seconds * params.framerate))
+    frame_bytes = params.sampwidth * params.nchannels
+    if target_frames > params.nframes:
+        data += b"\x00" * ((target_frames - params.nframes) * frame_bytes)
+    else:
+        data = data[:target_frames * frame_bytes]
+    with wave.open(dst_path, "wb") as dst:
+        dst.setnchannels(params.nchannels)
+        dst.setsampwidth(params.sampwidth)
+        dst.setframerate(params.framerate)
+        dst.writeframes(data)
+    return dst_path
+
+
+def _write_concat_list(paths, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def mux_segments(segment_paths, audio_files, output_filename, work_dir, fragmented=False):
+    """
+    映像セグメントをストリームコピーで連結し、音声は元の wav 群から1回だけエンコードして多重化する。
+    """
+    video_list = _write_concat_list(segment_paths, os.path.join(work_dir, "video_segments.txt"))
+    audio_list = _write_concat_list(audio_files, os.path.join(work_dir, "audio_segments.txt"))
+
+    cmd = [
+        get_ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", video_list,
+        "-f", "concat", "-safe", "0", "-i", audio_list,
+        "-map", "0:v", "-map", "1:a",
+        "-c:v", "copy",
+        "-c:a", AUDIO_CODEC, "-ar", str(AUDIO_FPS), "-ac", "2",
+        *(movflags_params(fragmented) or []),
+        output_filename
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        print(f"Error muxing segments: {result.stderr.decode('utf-8', errors='replace')[-500:]}")
+        return None
+    return output_filename
+
+
+def build_segment_jobs(timeline, fps, lines_per_segment=None):
+    """
+    タイムラインを lines_per_segment セリフごとのセグメントジョブに分ける
+    """
+    lines_per_segment = max(1, lines_per_segment or RENDER_SEGMENT_LINES)
+    jobs = []
+    for start in range(0, len(timeline), lines_per_segment):
+        entries = timeline[start:start + lines_per_segment]
+        jobs.append({
+            "index": len(jobs),
+            "fps": fps,
+            "lines": [{"frames": e["frames"], "text": e["text"]} for e in entries],
+            "audio": [e["audio"] for e in entries]
+        })
+    return jobs
+
+
+def _render_job_on_worker(worker_url, image_path, image_hash, job, output_filename):
+    """
+    ワーカーにセグメントを描画させる。画像は内容ハッシュで送り、ワーカー側に無い場合だけ転送する。
+    """
+    import requests
+
+    headers = {"Authorization": f"Bearer {RENDER_WORKER_TOKEN}"}
+    blob_url = f"{worker_url}/blobs/{image_hash}"
+    head = requests.head(blob_url, headers=headers, timeout=10)
+    if head.status_code == 401:
+        raise RuntimeError("unauthorized (check RENDER_WORKER_TOKEN)")
+    if head.status_code != 200:
+        with open(image_path, "rb") as f:
+            put = requests.put(blob_url, data=f, headers=headers, timeout=RENDER_WORKER_TIMEOUT)
+        put.raise_for_status()
+
+    payload = {
+        "index": job["index"],
+        "image": image_hash,
+        "fps": job["fps"],
+        "lines": job["lines"]
+    }
+    with requests.post(f"{worker_url}/render", json=payload, headers=headers, timeout=RENDER_WORKER_TIMEOUT, stream=True) as res:
+        res.raise_for_status()
+        with open(output_filename, "wb") as f:
+            for block in res.iter_content(chunk_size=1024 * 1024):
+                f.write(block)
+    return output_filename
+
+
+def render_segments(image_path, jobs, work_dir, workers=None):
+    """
+    セグメントジョブを描画し、入力順のファイルパスのリストを返す。
+    ワーカーが指定されていれば空いているワーカーへ順に割り当て、
+    失敗したワーカーは外して残りのワーカー（全滅時はローカル）で描画し直す。
+    """
+    workers = list(workers or [])
+    image_hash = file_sha256(image_path)
+    font_path = find_japanese_font()
+
+    slots = queue.Queue()
+    for worker_url in workers:
+        for _ in range(max(1, RENDER_WORKER_SLOTS)):
+            slots.put(worker_url)
+    alive = set(workers)
+    alive_lock = threading.Lock()
+
+    def next_slot():
+        """
+        生きているワーカーのスロットが空くまで待って返す。生きているワーカーが無ければ None
+        """
+        while True:
+            with alive_lock:
+                if not alive:
+                    return None
+            try:
+                worker_url = slots.get(timeout=1)
+            except queue.Empty:
+                continue
+            with alive_lock:
+                if worker_url in alive:
+                    return worker_url
+            # 外したワーカーの残りのスロットは捨てる
+
+    def run(position):
+        job = jobs[position]
+        output = os.path.join(work_dir, f"segment_{job['index']:04d}.mp4")
+        while True:
+            worker_url = next_slot()
+            if worker_url is None:
+                break
+            try:
+                _render_job_on_worker(worker_url, image_path, image_hash, job, output)
+                slots.put(worker_url)
+                print(f"  Segment {position + 1}/{len(jobs)} rendered on {worker_url}")
+                return output
+            except Exception as e:
+                # 失敗したワーカーは外し、このセグメントは残りのワーカーで描画し直す
+                print(f"Warning: Worker {worker_url} failed on segment {job['index']}: {e}")
+                with alive_lock:
+                    alive.discard(worker_url)
+        print(f"  Segment {position + 1}/{len(jobs)} rendering locally")
+        return render_segment(image_path, job["lines"], output, job["fps"], font_path=font_path)
+
+    max_workers = max(1, slots.qsize())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, range(len(jobs))))
+
+
+def create_podcast_video_distributed(image_path, audio_folder, output_filename="final_video.mp4", script_file=None, workers=None, series=None, fragmented=False):
+    """
+    タイムラインをセグメントに分割して複数ワーカーで描画し、順番通りに結合して動画を作成する。
+    """
+    workers = workers if workers is not None else RENDER_WORKERS
+    print(f"Creating video from {image_path} and audio in {audio_folder} (distributed, {len(workers)} workers)...")
+
+    timeline = build_timeline(audio_folder, script_file)
+    if not timeline:
+        print("No audio files found!")
+        return None
+
+    fps = SUBTITLE_FPS if any(e["text"] for e in timeline) else STILL_FPS
+    assign_frames(timeline, fps)
+    jobs = [job for job in build_segment_jobs(timeline, fps) if sum(l["frames"] for l in job["lines"]) > 0]
+    print(f"Rendering {len(jobs)} segments ({len(timeline)} lines)...")
+
+    work_dir = tempfile.mkdtemp(prefix="render_segments_")
+    try:
+        segment_paths = render_segments(image_path, jobs, work_dir, workers)
+        if any(path is None for path in segment_paths):
+            print("Failed to render some segments.")
+            return None
+
+        audio_files = [e["audio"] for e in timeline]
+        segment_paths, audio_files = add_bumpers(get_series_bumpers(series, fps), segment_paths, audio_files)
+        if not mux_segments(segment_paths, audio_files, output_filename, work_dir, fragmented=fragmented):
+            return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
     print(f"Video created successfully: {output_filename}")
     return output_filename
 
 
+def segment_style(image_path, fps, font_path):
+    """
+    セグメントの見た目に影響する設定。変わった場合は全セグメントを作り直す。
+    """
+    return {
+        "version": SEGMENT_STYLE_VERSION,
+        "image": file_sha256(image_path),
+        "fps": fps,
+        "size": list(VIDEO_SIZE),
+        "codec": VIDEO_CODEC,
+        "font": font_path,
+        "font_size": SUBTITLE_FONT_SIZE
+    }
+
+
+def segment_key(style, entry):
+    payload = {
+        "style": style,
+        "text": entry["text"],
+        "speaker": entry["speaker"],
+        "audio": entry["audio_hash"],
+        "frames": entry["frames"]
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def create_podcast_video_incremental(image_path, audio_folder, output_filename="final_video.mp4", script_file=None, cache_dir=None, workers=None, series=None, fragmented=False):
+    """
+    セリフ単位のセグメントをキャッシュし、入力（テキスト・話者・音声・スタイル）が変わったセリフだけ
+    再エンコードして、残りはストリームコピーで繋ぎ直す。
+    """
+    workers = workers if workers is not None else RENDER_WORKERS
+    cache_dir = cache_dir or os.path.join(audio_folder, SEGMENT_CACHE_DIRNAME)
+    print(f"Creating video from {image_path} and audio in {audio_folder} (incremental, cache: {cache_dir})...")
+
+    timeline = build_timeline(audio_folder, script_file)
+    if not timeline:
+        print("No audio files found!")
+        return None
+
+    fps = SUBTITLE_FPS if any(e["text"] for e in timeline) else STILL_FPS
+    assign_frames(timeline, fps, per_line=True)
+    style = segment_style(image_path, fps, find_japanese_font())
+
+    os.makedirs(cache_dir, exist_ok=True)
+    pending = []
+    for entry in timeline:
+        entry["audio_hash"] = file_sha256(entry["audio"])
+        entry["key"] = segment_key(style, entry)
+        entry["segment"] = os.path.join(cache_dir, f"line_{entry['key'][:24]}.mp4")
+        if entry["frames"] > 0 and not os.path.exists(entry["segment"]):
+            pending.append(entry)
+
+    print(f"Reusing {len(timeline) - len(pending)}/{len(timeline)} segments, rendering {len(pending)}...")
+
+    work_dir = tempfile.mkdtemp(prefix="render_incremental_")
+    try:
+        if pending:
+            jobs = [{
+                "index": e["index"],
+                "fps": fps,
+                "lines": [{"frames": e["frames"], "text": e["text"]}]
+            } for e in pending]
+            rendered = render_segments(image_path, jobs, work_dir, workers)
+            for entry, path in zip(pending, rendered):
+                if not path:
+                    print(f"Failed to render segment for line {entry['index']}.")
+                    return None
+                os.replace(path, entry["segment"])
+
+        segments = [e for e in timeline if e["frames"] > 0]
+        if fps < PER_LINE_MIN_FPS:
+            # フレームは累積時間で丸めているので、音声は（0フレームのセリフも含め）元の長さのまま繋げば映像とずれない
+            padded_audio = [e["audio"] for e in timeline]
+        else:
+            padded_audio = []
+            for entry in segments:
+                padded = os.path.join(work_dir, f"audio_{entry['index']:04d}.wav")
+                try:
+                    padded_audio.append(pad_wav(entry["audio"], padded, entry["frames"] / fps))
+                except Exception as e:
+                    print(f"Warning: Could not pad {entry['audio']}: {e}")
+                    padded_audio.append(entry["audio"])
+
+        segment_paths, audio_files = add_bumpers(
+            get_series_bumpers(series, fps),
+            [e["segment"] for e in segments],
+            padded_audio
+        )
+        if not mux_segments(segment_paths, audio_files, output_filename, work_dir, fragmented=fragmented):
+            return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    manifest = {
+        "style": style,
+        "lines": [{
+            "index": e["index"],
+            "speaker": e["speaker"],
+            "text": e["text"],
+            "audio_hash": e["audio_hash"],
+            "frames": e["frames"],
+            "key": e["key"],
+            "file": os.path.basename(e["segment"])
+        } for e in timeline]
+    }
+    with open(os.path.join(cache_dir, SEGMENT_MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    # 今回使わなかった古いセグメントを削除
+    in_use = {os.path.basename(e["segment"]) for e in timeline}
+    for path in glob.glob(os.path.join(cache_dir, "line_*.mp4")):
+        if os.path.basename(path) not in in_use:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    print(f"Video created successfully: {output_filename}")
+    return output_filename
+
+
+def get_rss_mb(pid):
+    """
+    プロセスの現在の RSS（MB）。取得できない場合は 0
+    """
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        out = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return int(out.stdout.decode().strip() or 0) / 1024.0
+    except Exception:
+        return 0.0
+
+
+class RssMonitor(threading.Thread):
+    """
+    本プロセスと子プロセス（ffmpeg）の RSS を定期的に計測し、ピークを記録する。
+    予算を超えたら on_exceed を呼ぶ。
+    """
+
+    def __init__(self, child_proc, budget_mb, on_exceed):
+        super().__init__(daemon=True)
+        self.child_proc = child_proc
+        self.budget_mb = budget_mb
+        self.on_exceed = on_exceed
+        self.peak_self_mb = 0.0
+        self.peak_child_mb = 0.0
+        self.peak_total_mb = 0.0
+        self.exceeded = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self_mb = get_rss_mb(os.getpid())
+            child_mb = get_rss_mb(self.child_proc.pid) if self.child_proc.poll() is None else 0.0
+            self.peak_self_mb = max(self.peak_self_mb, self_mb)
+            self.peak_child_mb = max(self.peak_child_mb, child_mb)
+            self.peak_total_mb = max(self.peak_total_mb, self_mb + child_mb)
+            if self.budget_mb and self_mb + child_mb > self.budget_mb and not self.exceeded:
+                self.exceeded = True
+                print(f"Error: RSS {self_mb + child_mb:.0f} MB exceeded budget {self.budget_mb:.0f} MB. Aborting render.")
+                self.on_exceed()
+            self._stop_event.wait(RSS_POLL_INTERVAL)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def render_subtitle_frame(background, display_text, font):
+    """
+    背景画像に字幕を描いた1フレーム分の RGB バイト列を返す（MoviePy の字幕と同じく画面中央・白字黒縁）
+    """
+    from PIL import ImageDraw
+
+    if not display_text or font is None:
+        return background.tobytes()
+    frame = background.copy()
+    draw = ImageDraw.Draw(frame)
+    draw.multiline_text(
+        (VIDEO_SIZE[0] // 2, VIDEO_SIZE[1] // 2),
+        display_text,
+        font=font,
+        fill=(255, 255, 255),
+        anchor="mm",
+        align="center",
+        stroke_width=2,
+        stroke_fill=(0, 0, 0)
+    )
+    return frame.tobytes()
+
+
+def create_podcast_video_bounded(image_path, audio_folder, output_filename="final_video.mp4", script_file=None, rss_budget_mb=None, series=None, fragmented=False):
+    """
+    メモリ使用量を抑えて動画を作成する。
+    クリップを一切作らず、字幕フレームは1セリフ分ずつ Pillow で描いて ffmpeg の標準入力へ流し、
+    音声は wav を ffmpeg の concat で直接読み込ませる。エピソードが長くてもメモリは増えない。
+    """
+    from PIL import Image, ImageFont
+
+    rss_budget_mb = rss_budget_mb if rss_budget_mb is not None else VIDEO_RSS_BUDGET_MB
+    print(f"Creating video from {image_path} and audio in {audio_folder} (bounded memory, budget: {rss_budget_mb or 'none'} MB)...")
+
+    timeline = build_timeline(audio_folder, script_file)
+    if not timeline:
+        print("No audio files found!")
+        return None
+
+    fps = SUBTITLE_FPS if any(e["text"] for e in timeline) else STILL_FPS
+    assign_frames(timeline, fps)
+
+    background = Image.open(image_path).convert("RGB").resize(VIDEO_SIZE)
+    font = None
+    if fps == SUBTITLE_FPS:
+        font_path = find_japanese_font()
+        try:
+            font = ImageFont.truetype(font_path, SUBTITLE_FONT_SIZE)
+        except Exception as e:
+            print(f"Warning: Could not load subtitle font {font_path}: {e}")
+
+    bumpers = get_splice_bumpers(series, fps, fragmented)
+    main_filename = output_filename
+    if bumpers:
+        base, ext = os.path.splitext(output_filename)
+        main_filename = f"{base}.main{ext}"
+
+    work_dir = tempfile.mkdtemp(prefix="render_bounded_")
+    started = time.time()
+    try:
+        audio_list = _write_concat_list([e["audio"] for e in timeline], os.path.join(work_dir, "audio.txt"))
+        cmd = [
+            get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{VIDEO_SIZE[0]}x{VIDEO_SIZE[1]}", "-r", str(fps),
+            "-i", "-",
+            "-f", "concat", "-safe", "0", "-i", audio_list,
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", VIDEO_CODEC, "-preset", "medium", "-pix_fmt", "yuv420p",
+            "-rc-lookahead", str(VIDEO_BOUNDED_LOOKAHEAD),
+            "-threads", str(VIDEO_BOUNDED_THREADS),
+            "-c:a", AUDIO_CODEC, "-ar", str(AUDIO_FPS), "-ac", "2",
+            *(movflags_params(fragmented and not bumpers) or []),
+            main_filename
+        ]
+        stderr_path = os.path.join(work_dir, "ffmpeg.log")
+        with open(stderr_path, "wb") as stderr_file:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+            monitor = RssMonitor(proc, rss_budget_mb, proc.kill)
+            monitor.start()
+            try:
+                for i, entry in enumerate(timeline):
+                    if entry["frames"] <= 0:
+                        continue
+                    frame = render_subtitle_frame(background, entry["text"], font)
+                    for _ in range(entry["frames"]):
+                        proc.stdin.write(frame)
+                    del frame
+                    if (i + 1) % 20 == 0:
+                        print(f"  {i + 1}/{len(timeline)} lines written (peak RSS {monitor.peak_total_mb:.0f} MB)")
+                proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            returncode = proc.wait()
+            monitor.stop()
+
+        print(f"Peak RSS: total {monitor.peak_total_mb:.0f} MB (python {monitor.peak_self_mb:.0f} MB, ffmpeg {monitor.peak_child_mb:.0f} MB), {time.time() - started:.1f}s")
+        if monitor.exceeded:
+            _remove_quietly(main_filename)
+            return None
+        if returncode != 0:
+            with open(stderr_path, "r", encoding="utf-8", errors="replace") as f:
+                print(f"Error encoding video: {f.read()[-500:]}")
+            _remove_quietly(main_filename)
+            return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if bumpers:
+        spliced = splice_with_bumpers(main_filename, bumpers, output_filename, fragmented=fragmented)
+        os.remove(main_filename)
+        if not spliced:
+            return None
+
+    print(f"Video created successfully: {output_filename}")
+    return output_filename
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def write_silence_wav(path, seconds, rate=BUMPER_SILENCE_RATE):
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(b"\x00\x00" * int(round(seconds * rate)))
+    return path
+
+
+def build_bumper(series, kind, fps):
+    """
+    シリーズのイントロ/アウトロ（kind="intro" / "outro"）を作成してキャッシュする。
+    本編と同じ解像度・fps・コーデックで書き出すので、ストリームコピーで連結できる。
+    戻り値: {"video": mp4, "audio": フレーム境界に揃えた wav, "frames": フレーム数}
+    """
+    config = SERIES_BUMPERS.get(series)
+    if not config or not config.get(kind):
+        return None
+
+    text = config[kind]
+    narration = config.get(f"{kind}_narration") if VIDEO_BUMPER_NARRATION else None
+    font_path = find_japanese_font()
+    key_payload = {
+        "version": BUMPER_VERSION,
+        "text": text,
+        "narration": narration,
+        "fps": fps,
+        "size": list(VIDEO_SIZE),
+        "codec": VIDEO_CODEC,
+        "audio_codec": AUDIO_CODEC,
+        "audio_fps": AUDIO_FPS,
+        "duration": BUMPER_DURATION,
+        "font": font_path,
+        "background": list(BUMPER_BACKGROUND)
+    }
+    key = hashlib.sha256(json.dumps(key_payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    base = os.path.join(BUMPER_CACHE_DIR, f"{series}_{kind}_{key[:16]}")
+    video_path = base + ".mp4"
+    audio_path = base + ".wav"
+    if os.path.exists(video_path) and os.path.exists(audio_path):
+        return {"video": video_path, "audio": audio_path, "frames": int(math.ceil(get_wav_duration(audio_path) * fps - 1e-6))}
+
+    print(f"Building {series} {kind} (cached in {BUMPER_CACHE_DIR})...")
+    os.makedirs(BUMPER_CACHE_DIR, exist_ok=True)
+
+    raw_audio = base + ".raw.wav"
+    duration = BUMPER_DURATION
+    if narration:
+        from audio_generator import generate_audio_file, DEFAULT_SPEAKER_NAME
+        if generate_audio_file(narration, DEFAULT_SPEAKER_NAME, raw_audio):
+            duration = max(duration, get_wav_duration(raw_audio) + 0.5)
+        else:
+            narration = None
+    if not narration:
+        write_silence_wav(raw_audio, duration)
+
+    frames = int(math.ceil(duration * fps - 1e-6))
+    pad_wav(raw_audio, audio_path, frames / fps)
+    os.remove(raw_audio)
+
+    from moviepy import ColorClip, TextClip, CompositeVideoClip, AudioFileClip
+
+    clip_duration = (frames + 0.5) / fps
+    clips = [ColorClip(VIDEO_SIZE, color=BUMPER_BACKGROUND).with_duration(clip_duration)]
+    try:
+        title_clip = TextClip(
+            text=text,
+            font_size=BUMPER_FONT_SIZE,
+            color='white',
+            font=font_path,
+            method='caption',
+            size=(1200, None),
+            text_align='center'
+        )
+        clips.append(title_clip.with_position('center').with_duration(clip_duration))
+    except Exception as e:
+        print(f"Warning: Could not create {kind} title: {e}")
+
+    video = CompositeVideoClip(clips, size=VIDEO_SIZE).with_audio(AudioFileClip(audio_path))
+    tmp_path = base + ".tmp.mp4"
+    video.write_videofile(
+        tmp_path,
+        fps=fps,
+        codec=VIDEO_CODEC,
+        audio_codec=AUDIO_CODEC,
+        threads=RENDER_THREADS,
+        logger=None
+    )
+    os.replace(tmp_path, video_path)
+    return {"video": video_path, "audio": audio_path, "frames": frames}
+
+
+def get_series_bumpers(series, fps):
+    """
+    VIDEO_BUMPERS が有効でシリーズが登録されていれば (intro, outro) を返す
+    """
+    if not VIDEO_BUMPERS or not series or series not in SERIES_BUMPERS:
+        return None
+    try:
+        return build_bumper(series, "intro", fps), build_bumper(series, "outro", fps)
+    except Exception as e:
+        print(f"Warning: Could not build bumpers for {series}: {e}")
+        return None
+
+
+def get_splice_bumpers(series, fps, fragmented):
+    """
+    本編を書き出した後にイントロ/アウトロを繋ぐ経路用の get_series_bumpers。
+    fragmented の場合、繋ぎ終わるまで出力ファイルが書かれず同時アップロードが重ならないため付けない
+    """
+    if fragmented and VIDEO_BUMPERS and series in SERIES_BUMPERS:
+        print("Warning: Skipping bumpers because the video is written as fragmented MP4 for streaming upload "
+              "(use VIDEO_INCREMENTAL=1 or RENDER_WORKERS to keep them).")
+        return None
+    return get_series_bumpers(series, fps)
+
+
+def add_bumpers(bumpers, segment_paths, audio_files):
+    """
+    セグメント連結用のリストの前後にイントロ/アウトロを追加する
+    """
+    if not bumpers:
+        return segment_paths, audio_files
+    intro, outro = bumpers
+    if intro:
+        segment_paths = [intro["video"]] + segment_paths
+        audio_files = [intro["audio"]] + audio_files
+    if outro:
+        segment_paths = segment_paths + [outro["video"]]
+        audio_files = audio_files + [outro["audio"]]
+    return segment_paths, audio_files
+
+
+def splice_with_bumpers(main_path, bumpers, output_filename, fragmented=False):
+    """
+    本編の前後にキャッシュ済みのイントロ/アウトロをストリームコピーで繋ぐ
+    """
+    intro, outro = bumpers
+    paths = [p["video"] for p in (intro,) if p] + [main_path] + [p["video"] for p in (outro,) if p]
+    work_dir = tempfile.mkdtemp(prefix="splice_")
+    try:
+        list_path = _write_concat_list(paths, os.path.join(work_dir, "splice.txt"))
+        cmd = [
+            get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy",
+            *(movflags_params(fragmented) or []),
+            output_filename
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            print(f"Error splicing bumpers: {result.stderr.decode('utf-8', errors='replace')[-500:]}")
+            return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return output_filename
+
+
 def wrap_text(text, max_chars=30):
     """
     テキストを指定文字数で改行する
@@ -246,9 +1134,18 @@ def create_video_with_subtitles(image_path, audio_folder, script_file, output_fi
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create podcast video from thumbnail and audio")
+    parser.add_argument("--image", type=str, default="thumbnail.png")
+    parser.add_argument("--audio", type=str, default="output_audio")
+    parser.add_argument("--script", type=str, default="script.json")
+    parser.add_argument("--output", type=str, default="test_video.mp4")
+    parser.add_argument("--incremental", action="store_true", help="Re-encode only lines whose inputs changed")
+    parser.add_argument("--rss-budget-mb", type=float, help="Render in bounded-memory mode with this RSS budget")
+    args = parser.parse_args()
+
     # Test
-    if os.path.exists("thumbnail.png") and os.path.exists("output_audio"):
-        if os.path.exists("script.json"):
-            create_video_with_subtitles("thumbnail.png", "output_audio", "script.json", "test_video.mp4")
-        else:
-            create_podcast_video("thumbnail.png", "output_audio", "test_video.mp4")
+    if os.path.exists(args.image) and os.path.exists(args.audio):
+        script_file = args.script if os.path.exists(args.script) else None
+        create_podcast_video(args.image, args.audio, args.output, script_file, incremental=args.incremental or None, rss_budget_mb=args.rss_budget_mb)
@@ -0,0 +1,141 @@
+"""
+YouTube Streaming Upload
+書き出し中の fragmented MP4 を、書き込み済みの部分から順にレジューマブルアップロードする。
+googleapiclient を読み込むので、youtube_uploader.upload_while_rendering から必要なときだけ import する。
+"""
+import os
+import time
+import threading
+import googleapiclient.errors
+from googleapiclient.http import MediaUpload
+
+from youtube_uploader import (
+    get_authenticated_service, build_upload_body, UPLOAD_CHUNK_SIZE, UPLOAD_POLL_INTERVAL
+)
+
+
+class UploadAborted(Exception):
+    pass
+
+
+class GrowingFileUpload(MediaUpload):
+    """
+    エンコーダが書き込み中のファイルを先頭から順に送るレジューマブルアップロード。
+    fragmented MP4 のように書き込み済みの部分が後から書き換わらない出力にのみ使う。
+    finished がセットされるまで全体サイズは不明（"*"）として送る。
+    """
+
+    def __init__(self, file_path, finished, failed, mimetype="video/mp4", chunksize=UPLOAD_CHUNK_SIZE):
+        super().__init__()
+        self._file_path = file_path
+        self._finished = finished
+        self._failed = failed
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        if self._finished.is_set() and os.path.exists(self._file_path):
+            return os.path.getsize(self._file_path)
+        return None
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def _available(self):
+        try:
+            return os.path.getsize(self._file_path)
+        except OSError:
+            return 0
+
+    def wait_for_chunk(self, begin):
+        """
+        begin から1チャンク分より多く書き込まれるか、書き出しが終わるまで待つ。
+        next_chunk の中で待つと最後のチャンクの全体サイズを正しく送れないので、呼び出し前に待つ。
+        """
+        while True:
+            if self._failed.is_set():
+                raise UploadAborted("Video rendering failed; upload aborted.")
+            if self._finished.is_set():
+                return
+            if self._available() > begin + self._chunksize:
+                return
+            time.sleep(UPLOAD_POLL_INTERVAL)
+
+    def getbytes(self, begin, length):
+        self.wait_for_chunk(begin)
+        with open(self._file_path, "rb") as f:
+            f.seek(begin)
+            return f.read(length)
+
+
+class StreamingUpload:
+    """
+    書き出し中の動画をアップロードする。
+    start() でレジューマブルセッションを開き、finish() で書き出し完了を、abort() で失敗を通知する。
+    """
+
+    def __init__(self, file_path, title, description, category_id="22", keywords=None, privacy_status="private"):
+        self.file_path = file_path
+        self.body = build_upload_body(title, description, category_id, keywords, privacy_status)
+        self.finished = threading.Event()
+        self.failed = threading.Event()
+        self.video_id = None
+        self.error = None
+        self._thread = None
+
+    def start(self):
+        # 認証はブラウザを開く可能性があるので呼び出し元スレッドで行う
+        youtube = get_authenticated_service()
+        if not youtube:
+            return False
+
+        media = GrowingFileUpload(self.file_path, self.finished, self.failed)
+        request = youtube.videos().insert(
+            part="snippet,status",
+            body=self.body,
+            media_body=media
+        )
+        self._thread = threading.Thread(target=self._run, args=(request, media), daemon=True)
+        self._thread.start()
+        print(f"Streaming upload started for {self.file_path}")
+        return True
+
+    def _run(self, request, media):
+        try:
+            response = None
+            while response is None:
+                media.wait_for_chunk(request.resumable_progress)
+                status, response = request.next_chunk()
+                if status:
+                    print(f"Uploaded {status.resumable_progress // (1024 * 1024)} MB")
+            self.video_id = response["id"]
+            print(f"Upload Complete! Video ID: {self.video_id}")
+        except UploadAborted as e:
+            self.error = e
+            print(str(e))
+        except googleapiclient.errors.HttpError as e:
+            self.error = e
+            print(f"An HTTP error {e.resp.status} occurred: {e.content}")
+        except Exception as e:
+            self.error = e
+            print(f"Streaming upload failed: {e}")
+
+    def finish(self):
+        self.finished.set()
+
+    def abort(self):
+        self.failed.set()
+
+    def wait(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+        return self.video_id
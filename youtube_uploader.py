@@ -1,10 +1,4 @@
 import os
-import google_auth_oauthlib.flow
-import googleapiclient.discovery
-import googleapiclient.errors
-from googleapiclient.http import MediaFileUpload
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,7 +8,19 @@ SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
 API_SERVICE_NAME = "youtube"
 API_VERSION = "v3"
 
+# STREAMING_UPLOAD=1 の場合、動画を fragmented MP4 で書き出しながら同時にアップロードする
+STREAMING_UPLOAD = os.getenv("STREAMING_UPLOAD", "0") == "1"
+# レジューマブルアップロードのチャンクは 256KB の倍数である必要がある
+UPLOAD_CHUNK_SIZE = max(1, int(os.getenv("UPLOAD_CHUNK_MB", "8"))) * 1024 * 1024
+UPLOAD_POLL_INTERVAL = float(os.getenv("UPLOAD_POLL_INTERVAL", "1.0"))
+
 def get_authenticated_service():
+    # Google API クライアントは重いので、アップロードするときに初めて読み込む
+    import google_auth_oauthlib.flow
+    import googleapiclient.discovery
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
     creds = None
     # token.json は初回認証後に保存される
     if os.path.exists("token.json"):
@@ -39,6 +45,22 @@ def get_authenticated_service():
 
     return googleapiclient.discovery.build(API_SERVICE_NAME, API_VERSION, credentials=creds)
 
+def build_upload_body(title, description, category_id="22", keywords=None, privacy_status="private"):
+    body = {
+        "snippet": {
+            "title": title,
+            "description": description,
+            "categoryId": category_id
+        },
+        "status": {
+            "privacyStatus": privacy_status
+        }
+    }
+
+    if keywords:
+        body["snippet"]["tags"] = keywords
+    return body
+
 def upload_video(file_path, title, description, category_id="22", keywords=None, privacy_status="private"):
     """
     YouTubeに動画をアップロードする
@@ -51,21 +73,12 @@ def upload_video(file_path, title, description, category_id="22", keywords=None,
     if not youtube:
         return None
 
-    print(f"Uploading {file_path} to YouTube...")
+    import googleapiclient.errors
+    from googleapiclient.http import MediaFileUpload
 
-    body = {
-        "snippet": {
-            "title": title,
-            "description": description,
-            "categoryId": category_id
-        },
-        "status": {
-            "privacyStatus": privacy_status
-        }
-    }
+    print(f"Uploading {file_path} to YouTube...")
 
-    if keywords:
-        body["snippet"]["tags"] = keywords
+    body = build_upload_body(title, description, category_id, keywords, privacy_status)
 
     try:
         request = youtube.videos().insert(
@@ -87,6 +100,35 @@ def upload_video(file_path, title, description, category_id="22", keywords=None,
         print(f"An HTTP error {e.resp.status} occurred: {e.content}")
         return None
 
+def upload_while_rendering(render, file_path, title, description, category_id="22", keywords=None, privacy_status="private"):
+    """
+    render() で file_path に fragmented MP4 を書き出しながら、同時にアップロードする。
+    戻り値は (render() の戻り値, video_id)。セッションを開けなかった場合は書き出し後に通常アップロードする。
+    """
+    from youtube_streaming import StreamingUpload
+
+    upload = StreamingUpload(file_path, title, description, category_id, keywords, privacy_status)
+    if not upload.start():
+        result = render()
+        if not result:
+            return None, None
+        return result, upload_video(result, title, description, category_id, keywords, privacy_status)
+
+    try:
+        result = render()
+    except Exception:
+        upload.abort()
+        upload.wait()
+        raise
+
+    if not result:
+        upload.abort()
+        upload.wait()
+        return None, None
+
+    upload.finish()
+    return result, upload.wait()
+
 if __name__ == "__main__":
     # Test (ダミーファイルが必要)
     pass